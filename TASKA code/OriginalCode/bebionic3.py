@@ -1,3 +1,4 @@
+import select
 import sys
 
 if sys.platform == 'win32': import bluetooth
@@ -8,7 +9,7 @@ else: raise RuntimeError( 'Bluetooth not supported for this OS:' , sys.platform
 
 class Bebionic3():
     """ Python implementation of a Bebionic3 prosthetic hand driver using the IBT control board """
-    def __init__( self, mac = 'ec:fe:7e:1d:8e:a1', elbow = False ):
+    def __init__( self, mac = 'ec:fe:7e:1d:8e:a1', elbow = False, sequence = ( 'stop', 'clear', 'move', 'move' ) ):
         """
         Constructor
 
@@ -18,6 +19,9 @@ class Bebionic3():
             The MAC address of the controller board for the Bebionic3
         elbow : bool
             True if a powered elbow is connected, False else
+        sequence : tuple of str
+            The frames written for every movement command, in order ('stop', 'clear' or 'move').
+            The default repeats the move frame as the controller does not always latch the first one
 
         Returns
         -------
@@ -34,8 +38,7 @@ class Bebionic3():
         self._bt.connect( ( mac, 1 ) )
         
         self._init_bt()
-        self._bt.send( b'\xff\x02\x9e\x9f' )   # stop movement command
-        self._bt.send( b'\xff\x02\x9b\x9c' )   # clear movement command
+        self._write( b'\xff\x02\x9e\x9f\xff\x02\x9b\x9c' )     # stop and clear movement commands
         self._move_dict = { 'tripod'       : b'\xff\x04\x9c\x09\x01\xa9',
                             'power'        : b'\xff\x04\x9c\x11\x01\xb1',
                             'pinch_open'   : b'\xff\x04\x9c\x0e\x01\xae',
@@ -53,6 +56,7 @@ class Bebionic3():
                             'elbow_flex'   : b'\xff\x04\x9c\x2d\x01\xcd',
                             'elbow_extend' : b'\xff\x04\x9c\x2e\x01\xce',
                             'close'        : b'\xff\x04\x9c\x02\x01\xa2' }
+        self._build_move_packets( sequence )
         self._last_move = None
 
     def __del__( self ):
@@ -69,6 +73,44 @@ class Bebionic3():
             # did not open the bluetooth communication
             pass
 
+    @property
+    def healthy( self ):
+        """
+        Returns
+        -------
+        bool
+            True if the bluetooth link to the controller is still up
+
+        Notes
+        -----
+        The socket is only read once select() reports it readable, so the check never blocks. Nothing
+        else reads from the controller, and PyBluez recv takes no MSG_PEEK flag, so the byte is consumed
+        """
+        try:
+            readable, _, _ = select.select( [ self._bt ], [], [], 0 )
+            if not readable: return True
+            return len( self._bt.recv( 1 ) ) > 0
+        except ( OSError, ValueError ):
+            # closed locally (fileno is -1) or reset by the peer
+            return False
+
+    def _write( self, data ):
+        """
+        Write all of the data to the controller
+
+        Parameters
+        ----------
+        data : bytes
+            The frames to write
+
+        Notes
+        -----
+        PyBluez sockets have no sendall, so send is repeated until every byte is out
+        """
+        sent = 0
+        while sent < len( data ):
+            sent += self._bt.send( data[ sent: ] )
+
     def _init_bt( self ):
         """
         Initializes the bluetooth connection and registers all available grips
@@ -102,6 +144,29 @@ class Bebionic3():
             self._bt.send( b'\xff\x16\x93\x2e\xff\x06\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x21' )    # elbow extend
             # raise RuntimeError( "Elbow actuation is currently not supported!" )
         
+    def _build_move_packets( self, sequence ):
+        """
+        Concatenate the frame sequence of every movement class into a single write
+
+        Parameters
+        ----------
+        sequence : tuple of str
+            The frames to send for each movement command ('stop', 'clear' or 'move')
+
+        Raises
+        ------
+        RuntimeError
+            Invalid frame name in the sequence
+        """
+        for step in sequence:
+            if step not in ( 'stop', 'clear', 'move' ):
+                raise RuntimeError( 'Invalid movement frame for the Bebionic3: ', step )
+        self._sequence = tuple( sequence )
+        self._move_pkts = {}
+        for move, pkt in self._move_dict.items():
+            frames = { 'stop' : b'\xff\x02\x9e\x9f', 'clear' : self._move_dict[ 'rest' ], 'move' : pkt }
+            self._move_pkts[ move ] = b''.join( frames[ step ] for step in self._sequence )
+
     def _send_movement_command( self, move ):
         """
         Send a movement command to the Bebionic3
@@ -116,11 +181,8 @@ class Bebionic3():
         RuntimeError
             Invalid movement class name is given
         """
-        if move in self._move_dict:
-            self._bt.send( b'\xff\x02\x9e\x9f' )        # stop last movement command
-            self._bt.send( self._move_dict['rest'] )    # clear last movement command
-            self._bt.send( self._move_dict[ move ] )    # send current movement command
-            self._bt.send( self._move_dict[ move ] )    # must send active movement commands twice
+        if move in self._move_pkts:
+            self._write( self._move_pkts[ move ] )      # stop, clear and move in one write
         else:
             raise RuntimeError( 'Invalid movement class for the Bebionic3: ', move )
 
@@ -174,10 +236,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
     for arg in range( 0, len( arglist ) ):
         attr = getattr( args, arglist[ arg ] )
-        if isinstance( attr, list ) and not isinstance( defaults[ arg ], list ):
+        if isinstance( attr, list ) and not isinstance( defaults[ arg ], ( list, tuple ) ):
             setattr( args, arglist[ arg ], attr[ 0 ]  )
 
-    bb3 = Bebionic3( args.mac, args.elbow )
+    bb3 = Bebionic3( args.mac, args.elbow, args.sequence )
     moves = [ 'tripod', 'power', 'pinch_open', 'active_index', 'pinch_closed',
               'key_lateral', 'index_point', 'mouse', 'column', 'relaxed',
               'rest', 'open', 'pronate', 'supinate', 'elbow_flex', 'elbow_extend', 'close' ]
@@ -1,8 +1,9 @@
-import socket
+import asyncio
 import sys
+import logging
 import math
 import Quaternion
-from Quaternion import _AXES2TUPLE, relative, to_euler
+from Quaternion import _AXES2TUPLE
 
 import time
 import serial
@@ -11,82 +12,63 @@ import numpy as np
 
 from serial import Serial
 
-import sys
-
-import bluetooth
-
 from TASKA import TASKA
 from ActiveWrist import ActiveWrist
 from Positional import Positional
+from TrackerServer import TrackerServer
+from SessionRecorder import SessionRecorder
+import LatencyTracer
+import BufferedLog
 
 # might need a user input for pronate/supinate
 
 localIP = "127.0.0.1"
 localPort = 20001
-buffersize = 1024
-
-msgFromServer = "Hello UDP Client"
-bytestoSend = str.encode(msgFromServer)
-
-# Create a socket
-UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-
-# bind address and ip
-UDPServerSocket.bind((localIP, localPort))
-
-print("UDP server is booted and ready")
-
-# Listen for incoming datagrams
-
-s_val = True
-hand = Positional()
+maxAge = 0.1 # seconds, poses older than this are discarded instead of acted on
+traceLatency = False # stamp every sample at each stage and print per-stage percentiles on exit
+logLevel = logging.INFO # logging.DEBUG also logs every received pose
+recordPath = None # e.g. time.strftime('session_%Y%m%d_%H%M%S.tsr') to record poses and device traffic
 
-while(s_val == True):
-    bytesAddressPair = UDPServerSocket.recvfrom(buffersize)
-    
-    #prints the message received from Udpclient
-    message = bytesAddressPair[0]
-    #address = bytesAddressPair[1]
+def handle_pose(tracker, calibrator):
+    """
+    Actuate the hand for one tracker/calibrator pose
 
-    #check if data is being received
-    if not message:
-        s_val = False
-
-    #convert message bytes to a list format
-    message = message.decode("utf-8")
-    a_list = list(map(float,message.split(',')))
-
-    clientMsg = "Message from Client: {}".format(a_list)
-    print(clientMsg)
-
-    #first 4 elements are tracker, the last 4 are calibrator
-    tracker = a_list[0:4]
-    calibrator = a_list[4:8]
-
-    #calculate euler angles for relative AND source
-    quat_combine = relative(calibrator,tracker)
-
-    euler_angs = to_euler(quat_combine, axes = 'sxyz')
-    print(euler_angs)
-
-    tracker_angs = to_euler(tracker, axes = 'sxyz')
+    Runs in a worker thread so the serial/bluetooth writes never stall datagram reception
+    """
+    log.debug("Message from Client: %s %s", tracker, calibrator)
 
     # need a way to determine which of the 3 angles is the "roll" let's assume the x is roll
-
-    # need to check/switch the pronate and supinate based on which direction activewrist turns! try this 
-    if sum(tracker[:]) > 0:
-        #choose supinate
-        s = 'supinate'
-        while(abs(tracker_angs[0] - euler_angs[0]) < 0.01): #change 0.01 radians error empirically
-            hand.send_command(cmd = "supinate", seconds = 1, move = None, prop = 1.0, angles = [0,0,0,0,0,0], speed = 0.5)
-    else:
-        #choose pronate
-        p = 'pronate'
-        while(abs(tracker_angs[0] - euler_angs[0]) < 0.01): #change 0.01 radians error empirically
-            hand.send_command(cmd = "pronate", seconds = 1, move = None, prop = 1.0, angles = [0,0,0,0,0,0], speed = 0.5)
-    #clientIP = "Client IP Address: {}".format(address)
-    #calculate rotation matrix elements
-    # Sending reply to client
-    # UDPServerSocket.sendto(bytestoSend, address)
-
-UDPServerSocket.close()
\ No newline at end of file
+    # the controller drives the relative roll to its target and only sends the wrist a command on a
+    # start/stop/reverse transition (deadband, hysteresis and dwell are set in WristController)
+    cmd = hand.track_wrist(tracker, calibrator)
+    if cmd is not None:
+        log.info('%s error %.3f', cmd, hand.WristController.error)
+
+async def main():
+    # Create and bind the tracker server
+    # batch receive drains bursts in one pass (needs a selector event loop, so not on Windows)
+    server = TrackerServer(host = localIP, port = localPort, max_age = maxAge, batch = sys.platform != 'win32')
+    await server.start()
+
+    log.info("UDP server is booted and ready")
+
+    # Listen for incoming datagrams, always acting on the newest pose
+    try:
+        await server.run(handle_pose)
+    finally:
+        server.close()
+        log.info('%s', server.stats)
+        if recorder is not None:
+            recorder.close()
+        if LatencyTracer.active is not None:
+            log.info('latency\n%s', LatencyTracer.active.report())
+        BufferedLog.stop()
+
+# console output is written by a background thread so slow terminals never stall a sample
+BufferedLog.start(logLevel)
+log = logging.getLogger('UDPServer')
+if traceLatency:
+    LatencyTracer.enable()
+recorder = SessionRecorder(recordPath) if recordPath else None
+hand = Positional(recorder = recorder)
+asyncio.run(main())
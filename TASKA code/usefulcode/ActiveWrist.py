@@ -1,23 +1,26 @@
-import sys
-
-if sys.platform == 'win32': import bluetooth
-elif sys.platform == 'linux': import socket
-else: raise RuntimeError( 'Bluetooth not supported for this OS:' , sys.platform )
+import BTTransport
+import Handshake
+import LatencyTracer
+import SessionRecorder
 
 #from . import AbstractBaseOutput
 
 class ActiveWrist():
     """Implementation of controller and active wrist movements"""
-    def __init__( self, mac = 'ec:fe:7e:1d:8e:a1', elbow = False ): #specificed MAC address for controller
+    def __init__( self, mac = 'ec:fe:7e:1d:8e:a1', elbow = False, sequence = ( 'stop', 'clear', 'move', 'move' ) ): #specificed MAC address for controller
         """
         Constructor
 
         Parameters
         ----------
         mac : str
-            The MAC address of the controller board for the TASKA
+            The MAC address of the controller board for the TASKA, or the address of a
+            local stand-in ('tcp://host:port' or 'unix:///path', see IBTSimulator.py)
         elbow : bool
             True if a powered elbow is connected, False else
+        sequence : tuple of str
+            The frames written for every movement command, in order ('stop', 'clear' or 'move').
+            The default repeats the move frame as the controller does not always latch the first one
 
         Returns
         -------
@@ -26,22 +29,20 @@ class ActiveWrist():
         """
         self._elbow = elbow
 
-        if sys.platform == 'win32':
-            self._bt = bluetooth.BluetoothSocket( bluetooth.RFCOMM )
-        else:
-            self._bt = socket.socket( socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM )
-        
-        self._bt.connect( ( mac, 1 ) )
+        self._mac = mac
+        self._bt = BTTransport.connect( mac )
+        self._closed = False
 
         self._init_bt()
-        self._bt.send( b'\xff\x02\x9e\x9f' )   # stop movement command
-        self._bt.send( b'\xff\x02\x9b\x9c' )   # clear movement command
+        self._bt.sendall( b'\xff\x02\x9e\x9f\xff\x02\x9b\x9c' )     # stop and clear movement commands
         self._move_dict = { 'rest'         : b'\xff\x02\x9b\x9c',
                             'pronate'      : b'\xff\x04\x9c\x24\x01\xc4',
                             'supinate'     : b'\xff\x04\x9c\x23\x01\xc3',
                             'elbow_flex'   : b'\xff\x04\x9c\x2d\x01\xcd',
                             'elbow_extend' : b'\xff\x04\x9c\x2e\x01\xce'}
+        self._build_move_packets( sequence )
         self._last_move = None
+        self.recorder = None     # set to a SessionRecorder to record every movement command
     
     def __del__( self ):
         """
@@ -49,32 +50,83 @@ class ActiveWrist():
 
         Stops the ActiveWrist from any movements its currently doing and closes communication.
         """
+        self.close()
+
+    def close( self ):
+        """
+        Stop any movement and close the bluetooth link to the controller
+        """
+        if getattr( self, '_closed', True ): return
+        self._closed = True
+        try:
+            self._bt.sendall( b'\xff\x02\x9e\x9f\xff\x02\x9b\x9c' )     # stop and clear movement commands
+        except OSError:
+            # the link is already gone
+            pass
         try:
-            self._bt.send( b'\xff\x02\x9e\x9f' )   # stop movement command
-            self._bt.send( b'\xff\x02\x9b\x9c' )   # clear movement command
-            self._bt.close()                       # close communication
-        except (AttributeError, OSError):
-            # did not open the bluetooth communication
+            self._bt.close()                                        # close communication
+        except OSError:
             pass
     
+    @property
+    def healthy( self ):
+        """
+        Returns
+        -------
+        bool
+            True if the bluetooth link to the controller is still up
+        """
+        return BTTransport.alive( self._bt )
+
     def _init_bt( self ):
         """
         Initializes the bluetooth connection and registers all available grips
+
+        Notes
+        -----
+        All frames go out in one write, and the grip registrations are skipped when reconnecting
+        to a controller that already holds them (see Handshake.ibt)
         """
 
-        self._bt.send( b'\xff\x06\x80\x00\x00\x00\x00\x85' )                           # connect
-        self._bt.send( b'\xff\x02\x00\x01' )
-        self._bt.send( b'\xff\x02\x83\x84' )
-        self._bt.send( b'\xff\x02\x00\x01' )
+        session = b'\xff\x06\x80\x00\x00\x00\x00\x85' \
+                  b'\xff\x02\x00\x01' \
+                  b'\xff\x02\x83\x84' \
+                  b'\xff\x02\x00\x01'                                                  # connect
+        grips = []
 
         if not self._elbow:
-            self._bt.send( b'\xff\x16\x93\x23\xff\x09\x00\x00\x00\x01\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1b' )    # supinate
-            self._bt.send( b'\xff\x16\x93\x24\xff\x09\x00\x00\x00\x02\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1d' )    # pronate
+            grips.append( b'\xff\x16\x93\x23\xff\x09\x00\x00\x00\x01\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1b' )    # supinate
+            grips.append( b'\xff\x16\x93\x24\xff\x09\x00\x00\x00\x02\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1d' )    # pronate
         else:
-            self._bt.send( b'\xff\x16\x93\x23\xff\x03\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x13' )    # supinate
-            self._bt.send( b'\xff\x16\x93\x24\xff\x04\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x15' )    # pronate
-            self._bt.send( b'\xff\x16\x93\x2d\xff\x05\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1f' )    # elbow bend
-            self._bt.send( b'\xff\x16\x93\x2e\xff\x06\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x21' )    # elbow extend
+            grips.append( b'\xff\x16\x93\x23\xff\x03\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x13' )    # supinate
+            grips.append( b'\xff\x16\x93\x24\xff\x04\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x15' )    # pronate
+            grips.append( b'\xff\x16\x93\x2d\xff\x05\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x1f' )    # elbow bend
+            grips.append( b'\xff\x16\x93\x2e\xff\x06\x00\x00\x00\xff\x01\x46\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\x21' )    # elbow extend
+
+        Handshake.ibt( self._bt, self._mac, session, b''.join( grips ) )
+
+    def _build_move_packets( self, sequence ):
+        """
+        Concatenate the frame sequence of every movement class into a single write
+
+        Parameters
+        ----------
+        sequence : tuple of str
+            The frames to send for each movement command ('stop', 'clear' or 'move')
+
+        Raises
+        ------
+        RuntimeError
+            Invalid frame name in the sequence
+        """
+        for step in sequence:
+            if step not in ( 'stop', 'clear', 'move' ):
+                raise RuntimeError( 'Invalid movement frame for the %s: ' % self.__class__.__name__, step )
+        self._sequence = tuple( sequence )
+        self._move_pkts = {}
+        for move, pkt in self._move_dict.items():
+            frames = { 'stop' : b'\xff\x02\x9e\x9f', 'clear' : self._move_dict[ 'rest' ], 'move' : pkt }
+            self._move_pkts[ move ] = b''.join( frames[ step ] for step in self._sequence )
 
     def _send_movement_command( self, move ):
         """
@@ -90,11 +142,12 @@ class ActiveWrist():
         RuntimeError
             Invalid movement class name is given
         """
-        if move in self._move_dict:
-            self._bt.send( b'\xff\x02\x9e\x9f' )        # stop last movement command
-            self._bt.send( self._move_dict['rest'] )    # clear last movement command
-            self._bt.send( self._move_dict[ move ] )    # send current movement command
-            self._bt.send( self._move_dict[ move ] )    # must send active movement commands twice
+        if move in self._move_pkts:
+            self._bt.sendall( self._move_pkts[ move ] )     # stop, clear and move in one write
+            tracer = LatencyTracer.active
+            if tracer is not None: tracer.stamp( 'write' )
+            if self.recorder is not None:
+                self.recorder.record_packet( SessionRecorder.COMMAND, SessionRecorder.WRIST, self._move_pkts[ move ] )
         else:
             raise RuntimeError( 'Invalid movement class for the Bebionic3: ', move )
 
@@ -148,10 +201,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
     for arg in range( 0, len( arglist ) ):
         attr = getattr( args, arglist[ arg ] )
-        if isinstance( attr, list ) and not isinstance( defaults[ arg ], list ):
+        if isinstance( attr, list ) and not isinstance( defaults[ arg ], ( list, tuple ) ):
             setattr( args, arglist[ arg ], attr[ 0 ]  )
 
-    activewristmov = ActiveWrist( args.mac, args.elbow )
+    activewristmov = ActiveWrist( args.mac, args.elbow, args.sequence )
     moves = ['rest','pronate', 'supinate', 'elbow_flex', 'elbow_extend']
     
     print( '------------ Movement Commands ------------' )
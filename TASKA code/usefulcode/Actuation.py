@@ -0,0 +1,75 @@
+import concurrent.futures
+
+class Actuation():
+    """ Combined completion handle for one command sent to several devices concurrently """
+    def __init__( self, futures ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        futures : dict
+            Device name -> concurrent.futures.Future resolved with that device's latency (in seconds)
+
+        Returns
+        -------
+        obj
+            An Actuation object
+        """
+        self._futures = futures
+
+    def done( self ):
+        """
+        Returns
+        -------
+        bool
+            True once every device has finished with the command
+        """
+        return all( future.done() for future in self._futures.values() )
+
+    @property
+    def latency( self ):
+        """
+        Returns
+        -------
+        dict
+            Device name -> seconds from submission until the device took the command
+            (None while it is still pending or if it failed)
+        """
+        return { name : future.result() if future.done() and future.exception() is None else None
+                 for name, future in self._futures.items() }
+
+    @property
+    def errors( self ):
+        """
+        Returns
+        -------
+        dict
+            Device name -> exception raised by that device, for the devices that failed
+        """
+        return { name : future.exception() for name, future in self._futures.items()
+                 if future.done() and future.exception() is not None }
+
+    def result( self, timeout = None ):
+        """
+        Wait for every device
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time (in seconds) to wait for all devices (None to wait forever)
+
+        Returns
+        -------
+        dict
+            Device name -> latency (in seconds)
+
+        Raises
+        ------
+        concurrent.futures.TimeoutError
+            A device did not finish in time
+        Exception
+            The first error raised by a device
+        """
+        concurrent.futures.wait( self._futures.values(), timeout )
+        return { name : future.result( timeout = 0 ) for name, future in self._futures.items() }
@@ -0,0 +1,163 @@
+import select
+import socket
+import sys
+
+def _connect_tcp( target, timeout ):
+    host, _, port = target.rpartition( ':' )
+    sock = socket.create_connection( ( host, int( port ) ), timeout = timeout )
+    sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )   # one frame per write, like RFCOMM
+    return sock
+
+def _connect_unix( target, timeout ):
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    sock.settimeout( timeout )
+    sock.connect( target )
+    return sock
+
+class RFCOMMStream():
+    """ Stream view of a PyBluez socket, which only provides send, recv, close and fileno """
+    def __init__( self, sock ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        sock : bluetooth.BluetoothSocket
+            A connected RFCOMM socket
+
+        Returns
+        -------
+        obj
+            A stream providing connect, send, sendall, recv, peek, settimeout, fileno and close
+        """
+        self._sock = sock
+        self._pending = b''     # byte read ahead by peek(), returned by the next recv()
+
+    def connect( self, address ):
+        self._sock.connect( address )
+
+    def send( self, data ):
+        return self._sock.send( data )
+
+    def sendall( self, data ):
+        """
+        Write all of the data, calling send until the socket took every byte
+
+        Parameters
+        ----------
+        data : bytes
+            The frames to write
+        """
+        sent = 0
+        while sent < len( data ):
+            sent += self._sock.send( data[ sent: ] )
+
+    def recv( self, numbytes ):
+        if self._pending:
+            data, self._pending = self._pending, b''
+            return data
+        return self._sock.recv( numbytes )
+
+    def peek( self ):
+        """
+        Read one byte ahead without consuming it (PyBluez recv takes no MSG_PEEK flag)
+
+        Returns
+        -------
+        bytes
+            The next byte of the stream, empty if the peer closed it
+        """
+        if not self._pending: self._pending = self._sock.recv( 1 )
+        return self._pending
+
+    def settimeout( self, timeout ):
+        self._sock.settimeout( timeout )
+
+    def fileno( self ):
+        return self._sock.fileno()
+
+    def close( self ):
+        self._sock.close()
+
+# address scheme -> factory( target, timeout ) for the stand-ins used off hardware
+_SCHEMES = { 'tcp://' : _connect_tcp, 'unix://' : _connect_unix }
+
+def register( scheme, factory ):
+    """
+    Add a transport for addresses starting with the given scheme
+
+    Parameters
+    ----------
+    scheme : str
+        The address prefix (e.g. 'sim://')
+    factory : callable
+        Called as factory( address without the prefix, timeout ) and returns a connected object
+        providing send, sendall, recv, fileno and close
+    """
+    _SCHEMES[ scheme ] = factory
+
+def connect( address, channel = 1, timeout = None ):
+    """
+    Open the byte stream to an IBT controller (or a local stand-in for it)
+
+    Parameters
+    ----------
+    address : str
+        The MAC address of the controller board (RFCOMM), 'tcp://host:port', 'unix:///path/to/socket'
+        or any other registered scheme
+    channel : int
+        The RFCOMM channel used for MAC addresses
+    timeout : float
+        The socket timeout (in seconds), None for blocking
+
+    Returns
+    -------
+    socket.socket or RFCOMMStream
+        A connected stream providing send, sendall, recv, fileno and close. PyBluez sockets
+        (Windows) are wrapped in an RFCOMMStream as they have no sendall
+
+    Raises
+    ------
+    RuntimeError
+        Bluetooth is not supported on this OS
+    """
+    for scheme, factory in _SCHEMES.items():
+        if address.startswith( scheme ): return factory( address[ len( scheme ): ], timeout )
+
+    if sys.platform == 'win32':
+        import bluetooth
+        sock = RFCOMMStream( bluetooth.BluetoothSocket( bluetooth.RFCOMM ) )
+    elif sys.platform == 'linux':
+        sock = socket.socket( socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM )
+    else:
+        raise RuntimeError( 'Bluetooth not supported for this OS:' , sys.platform )
+    if timeout is not None: sock.settimeout( timeout )
+    sock.connect( ( address, channel ) )
+    return sock
+
+def alive( sock ):
+    """
+    Check a connected stream without consuming any data
+
+    Parameters
+    ----------
+    sock : socket-like
+        The stream returned by connect()
+
+    Returns
+    -------
+    bool
+        False if the peer closed the stream or the socket failed, True else
+
+    Notes
+    -----
+    The stream is only read once select() reports it readable, so the check never blocks
+    """
+    try:
+        readable, _, _ = select.select( [ sock ], [], [], 0 )
+        if not readable: return True
+        if isinstance( sock, RFCOMMStream ): return len( sock.peek() ) > 0
+        return len( sock.recv( 1, socket.MSG_PEEK ) ) > 0
+    except ( OSError, ValueError ):
+        # closed locally (fileno is -1) or reset by the peer
+        return False
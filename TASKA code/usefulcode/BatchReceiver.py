@@ -0,0 +1,157 @@
+import select
+
+import numpy as np
+
+import LatencyTracer
+import TrackerCodec
+
+class BatchReceiver():
+    """ Drains all pending tracker datagrams from a UDP socket into a preallocated NumPy block """
+    def __init__( self, sock, max_batch = 256, slot_size = 256 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        sock : socket.socket
+            A bound UDP socket (it is switched to non-blocking mode)
+        max_batch : int
+            The maximum number of datagrams read per drain
+        slot_size : int
+            The receive buffer size per datagram, larger than the longest datagram expected (at least 81 bytes for
+            float64 datagrams); a datagram that fills the whole slot may have been truncated and is dropped
+
+        Returns
+        -------
+        obj
+            A BatchReceiver object
+
+        Notes
+        -----
+        Python's socket module does not expose recvmmsg, so each datagram is read with recv_into straight into
+        its own slot of one reusable bytearray. Binary datagrams are then decoded for the whole batch at once
+        through a structured view of that buffer; only legacy CSV datagrams are parsed one at a time.
+        """
+        self._sock = sock
+        self._sock.setblocking( False )
+        self._max_batch = max_batch
+        self._slot_size = slot_size
+
+        self._buffer = bytearray( max_batch * slot_size )
+        self._view = memoryview( self._buffer )
+        self._lengths = np.zeros( max_batch, dtype = np.int64 )
+        self._slots = np.ndarray( shape = ( max_batch, ),
+                                  dtype = np.dtype( { 'names'    : [ 'magic', 'version', 'flags', 'seq', 'f32', 'f64' ],
+                                                      'formats'  : [ 'S2', 'u1', 'u1', '<u4', ( '<f4', 8 ), ( '<f8', 8 ) ],
+                                                      'offsets'  : [ 0, 2, 3, 4, 16, 16 ],
+                                                      'itemsize' : slot_size } ),
+                                  buffer = self._buffer )
+
+        self._values = np.empty( ( max_batch, 8 ), dtype = float )
+        self._seq = np.empty( max_batch, dtype = np.int64 )
+        self._valid = np.empty( max_batch, dtype = bool )
+        self._last_seq = self._seq[:0]
+
+        self.received = 0
+        self.dropped = 0
+        self.drains = 0
+        self.closed = False
+
+    @property
+    def seq( self ):
+        """
+        Returns
+        -------
+        numpy.ndarray (n,)
+            The sender sequence numbers for the rows returned by the last drain (-1 for CSV datagrams)
+        """
+        return self._last_seq
+
+    def fileno( self ):
+        return self._sock.fileno()
+
+    def drain( self ):
+        """
+        Read every datagram that is already pending on the socket without blocking
+
+        Returns
+        -------
+        numpy.ndarray (n, 8)
+            One row per valid datagram in arrival order: tracker quaternion followed by calibrator quaternion
+
+        Notes
+        -----
+        The returned block is a view of an internal buffer that is overwritten by the next drain.
+        An empty datagram marks the receiver as closed.
+        """
+        n = 0
+        size = self._slot_size
+        while n < self._max_batch:
+            try:
+                nbytes = self._sock.recv_into( self._view[ n * size : ( n + 1 ) * size ] )
+            except ( BlockingIOError, InterruptedError ):
+                break
+            if nbytes == 0:
+                self.closed = True
+                break
+            self._lengths[n] = nbytes
+            n += 1
+        self.drains += 1
+        tracer = LatencyTracer.active
+        if tracer is not None and n: tracer.begin()
+
+        slots = self._slots[:n]
+        lengths = self._lengths[:n]
+        values = self._values[:n]
+        seq = self._seq[:n]
+        valid = self._valid[:n]
+
+        # recv_into silently truncates, so a datagram that filled its slot cannot be trusted
+        whole = lengths < size
+
+        # decode every binary datagram in the batch in a handful of array ops
+        binary = whole & ( slots[ 'magic' ] == TrackerCodec.MAGIC ) & ( slots[ 'version' ] == TrackerCodec.VERSION )
+        f64 = binary & ( ( slots[ 'flags' ] & TrackerCodec.FLAG_FLOAT64 ) != 0 ) & ( lengths >= 16 + 64 )
+        f32 = binary & ( ( slots[ 'flags' ] & TrackerCodec.FLAG_FLOAT64 ) == 0 ) & ( lengths >= 16 + 32 )
+        values[ f32 ] = slots[ 'f32' ][ f32 ]
+        values[ f64 ] = slots[ 'f64' ][ f64 ]
+        seq[:] = slots[ 'seq' ]
+        seq[ ~binary ] = -1
+        np.logical_or( f32, f64, out = valid )
+
+        # legacy CSV datagrams fall back to the per-packet decoder
+        for i in np.flatnonzero( whole & ~binary ):
+            try:
+                sample = TrackerCodec.decode( self._view[ i * size : i * size + lengths[i] ] )
+            except ValueError:
+                continue
+            values[ i, 0:4 ] = sample.tracker
+            values[ i, 4:8 ] = sample.calibrator
+            valid[i] = True
+
+        n_valid = int( np.count_nonzero( valid ) )
+        self.received += n_valid
+        self.dropped += n - n_valid
+        if n_valid < n:
+            values = values[ valid ]
+            seq = seq[ valid ]
+        self._last_seq = seq
+        if tracer is not None and n: tracer.stamp( 'decode' )
+        return values
+
+    def wait( self, timeout = None ):
+        """
+        Block until at least one datagram is pending, then drain the socket
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time to wait (in seconds), or None to wait forever
+
+        Returns
+        -------
+        numpy.ndarray (n, 8)
+            The drained block (empty on timeout)
+        """
+        select.select( [ self._sock ], [], [], timeout )
+        return self.drain()
@@ -0,0 +1,132 @@
+import sys
+import queue
+import logging
+import logging.handlers
+
+# default record layout, formatted on the background thread
+FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# the handler attached by start(), None when records go straight to the stdlib handlers
+active = None
+
+def start( level = logging.INFO, stream = None, capacity = 1024, debug_watermark = 0.5, fmt = FORMAT ):
+    """
+    Route every logger through a bounded queue drained by a background writer thread
+
+    Parameters
+    ----------
+    level : int
+        The lowest level passed on (logging.DEBUG to see per-sample traffic)
+    stream : file-like
+        Where records are written (sys.stderr if None)
+    capacity : int
+        The number of records the queue holds before records are dropped
+    debug_watermark : float [0, 1]
+        The queue fill fraction above which debug records are dropped
+    fmt : str
+        The logging.Formatter format string
+
+    Returns
+    -------
+    BufferedHandler
+        The new active handler
+    """
+    global active
+    stop()
+    writer = logging.StreamHandler( sys.stderr if stream is None else stream )
+    writer.setFormatter( logging.Formatter( fmt ) )
+    active = BufferedHandler( writer, capacity, debug_watermark )
+
+    root = logging.getLogger()
+    root.addHandler( active )
+    root.setLevel( level )
+    return active
+
+def stop():
+    """
+    Write out every queued record and detach the active handler
+    """
+    global active
+    if active is not None:
+        logging.getLogger().removeHandler( active )
+        active.close()
+        active = None
+
+class BufferedHandler( logging.handlers.QueueHandler ):
+    """ Non-blocking queue handler that defers formatting and writing to a background thread """
+    def __init__( self, target, capacity = 1024, debug_watermark = 0.5 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        target : logging.Handler
+            The handler that formats and writes records on the background thread
+        capacity : int
+            The number of records the queue holds before records are dropped
+        debug_watermark : float [0, 1]
+            The queue fill fraction above which debug records are dropped
+
+        Returns
+        -------
+        obj
+            A BufferedHandler object
+
+        Notes
+        -----
+        The caller only pays for building the LogRecord and one put_nowait(); the message is not %-formatted
+        until the writer thread handles it, so arguments must not be mutated after the call (log bytes( pkt ),
+        not a reused packet buffer). Under pressure debug records are dropped first to leave room for the
+        rest, and nothing ever blocks the caller: a full queue drops the record and counts it.
+        """
+        super().__init__( queue.Queue( capacity ) )
+        self._debug_limit = int( capacity * debug_watermark )
+        self.dropped = 0
+        self.dropped_debug = 0
+
+        self._listener = _Listener( self.queue, target )
+        self._listener.start()
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            The number of queued records and the counts of dropped debug and other records
+        """
+        return { 'queued' : self.queue.qsize(), 'dropped_debug' : self.dropped_debug, 'dropped' : self.dropped }
+
+    def prepare( self, record ):
+        """
+        Pass the record through unformatted (QueueHandler would format it on the calling thread)
+        """
+        return record
+
+    def enqueue( self, record ):
+        """
+        Queue a record without blocking, dropping it if the queue is too full for its level
+        """
+        if record.levelno <= logging.DEBUG and self.queue.qsize() >= self._debug_limit:
+            self.dropped_debug += 1
+            return
+        try:
+            self.queue.put_nowait( record )
+        except queue.Full:
+            self.dropped += 1
+
+    def close( self ):
+        """
+        Drain the queue, stop the writer thread and close the target handler
+        """
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+        super().close()
+
+class _Listener( logging.handlers.QueueListener ):
+    """ QueueListener whose stop sentinel waits for room in a full queue instead of raising """
+    def enqueue_sentinel( self ):
+        self.queue.put( self._sentinel )
@@ -0,0 +1,138 @@
+import threading
+
+from collections import deque
+
+class CommandCoalescer():
+    """ Pipelines TASKA commands through a bounded window and merges updates that were superseded while it was full """
+    def __init__( self, transport, max_in_flight = 4 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        transport : SerialTransport
+            The transport used to send packets and wait on their acknowledgements
+        max_in_flight : int
+            The number of sent commands allowed to wait on their acknowledgement at once
+
+        Returns
+        -------
+        obj
+            A CommandCoalescer object with its sender thread running
+
+        Notes
+        -----
+        Up to max_in_flight commands are on the wire at once; the sender thread only holds a command back while
+        that many are still waiting on their acknowledgement (or timeout), so the link stays pipelined but the hand
+        never has a long backlog to work through. A keyed command (e.g. the finger group target) that is submitted
+        while the previous command with the same key is still the last one queued replaces it instead of queueing
+        behind it, so the hand always moves toward the most recent target. Commands without a key are never merged.
+        """
+        self._transport = transport
+        self._queue = deque()                   # entries of [ key, pkt, opcode ]
+        self._cond = threading.Condition()
+        self._max_in_flight = max( 1, max_in_flight )
+        self._in_flight = 0
+
+        self.submitted = 0
+        self.sent = 0
+        self.errors = 0
+        self.coalesced = {}
+
+        self._running = True
+        self._sender = threading.Thread( target = self._send_loop, daemon = True )
+        self._sender.start()
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of submitted, sent, failed (link error) and coalesced (dropped before hitting the wire)
+            commands, with the coalesced count also broken down per key
+        """
+        with self._cond:
+            return { 'submitted' : self.submitted, 'sent' : self.sent, 'errors' : self.errors,
+                     'coalesced' : sum( self.coalesced.values() ), 'coalesced_by_key' : dict( self.coalesced ) }
+
+    def submit( self, pkt, opcode, key = None ):
+        """
+        Queue a command for sending
+
+        Parameters
+        ----------
+        pkt : bytes
+            The complete packet (including checksum)
+        opcode : int
+            The opcode of the expected acknowledgement
+        key : hashable
+            Identifies commands where only the most recent one matters (None to never merge)
+        """
+        with self._cond:
+            self.submitted += 1
+            if key is not None and self._queue and self._queue[-1][0] == key:
+                self._queue[-1][1] = pkt
+                self._queue[-1][2] = opcode
+                self.coalesced[ key ] = self.coalesced.get( key, 0 ) + 1
+                return
+            self._queue.append( [ key, pkt, opcode ] )
+            self._cond.notify_all()
+
+    def flush( self, timeout = None ):
+        """
+        Wait until every queued command has been sent and acknowledged
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time to wait (in seconds), or None to wait forever
+
+        Returns
+        -------
+        bool
+            True if the queue drained, False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for( lambda: not self._queue and not self._in_flight, timeout )
+
+    def close( self, timeout = 1.0 ):
+        """
+        Send what is still queued (up to timeout) and stop the sender thread
+        """
+        self.flush( timeout )
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._sender.join( timeout )
+
+    def _send_loop( self ):
+        """
+        Background thread that sends queued commands whenever the in-flight window has room
+        """
+        while True:
+            with self._cond:
+                self._cond.wait_for( lambda: ( self._queue and self._in_flight < self._max_in_flight ) or not self._running )
+                if not self._queue: return
+                if self._in_flight >= self._max_in_flight:
+                    # stopping, wait for the window before sending what is left
+                    self._cond.wait_for( lambda: self._in_flight < self._max_in_flight )
+                _, pkt, opcode = self._queue.popleft()
+                self._in_flight += 1
+            try:
+                future = self._transport.send( pkt, opcode = opcode )
+            except Exception:
+                # link error, the command is lost but the sender keeps going
+                self._done( None, failed = True )
+                continue
+            future.add_done_callback( self._done )
+
+    def _done( self, future, failed = False ):
+        """
+        Free a window slot once a command was acknowledged, timed out or failed
+        """
+        with self._cond:
+            if failed or future.exception() is not None: self.errors += 1
+            self.sent += 1
+            self._in_flight -= 1
+            self._cond.notify_all()
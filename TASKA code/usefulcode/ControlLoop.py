@@ -0,0 +1,218 @@
+import bisect
+import math
+import threading
+import time
+
+import LatencyTracer
+
+class ControlLoop():
+    """ Fixed-rate sense -> compute -> actuate scheduler for a Positional hand and wrist """
+
+    # histogram bin edges (in microseconds) for wake-up jitter and cycle overruns
+    HIST_EDGES = [ 50, 100, 250, 500, 1000, 2500, 5000, 10000 ]
+
+    def __init__( self, positional, sense, compute, rate = 50.0, budgets = None, spin = 0.001 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        positional : Positional
+            The hand and wrist to actuate (must provide send_hand( **kwargs ) and send_wrist( cmd ))
+        sense : callable
+            Called once per cycle as sense() and returns the latest sample (e.g. a tracker pose), or None to skip the cycle
+        compute : callable
+            Called as compute( sample ) and returns None or a dict with optional keys
+            'hand' (keyword arguments for send_hand) and 'wrist' (the wrist command)
+        rate : float
+            The cycle rate (in Hz)
+        budgets : dict
+            The maximum command rate (in Hz) for each device ('hand' over serial, 'wrist' over bluetooth).
+            A command issued faster than its budget is held and only the newest held command is sent
+            once the budget allows it (None for { 'hand' : 20.0, 'wrist' : 10.0 })
+        spin : float
+            The time (in seconds) before each deadline spent polling the clock instead of sleeping,
+            to hide the coarse sleep granularity of some platforms
+
+        Returns
+        -------
+        obj
+            A ControlLoop object (call run() or start() to begin cycling)
+        """
+        self._positional = positional
+        self._sense = sense
+        self._compute = compute
+        self._period = 1.0 / rate
+        self._spin = spin
+        if budgets is None: budgets = { 'hand' : 20.0, 'wrist' : 10.0 }
+
+        self._actuators = { 'hand' : lambda cmd: positional.send_hand( **cmd ), 'wrist' : positional.send_wrist }
+        self._intervals = { device : 1.0 / budgets[ device ] if budgets.get( device ) else 0.0 for device in self._actuators }
+        self._last_sent = { device : -math.inf for device in self._actuators }
+        self._held = {}                         # device -> newest command waiting on its rate budget
+
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.max_jitter = 0.0
+        self.sent = { device : 0 for device in self._actuators }
+        self.superseded = { device : 0 for device in self._actuators }
+        self.errors = 0
+        self.last_error = None
+        self._jitter_hist = [ 0 ] * ( len( ControlLoop.HIST_EDGES ) + 1 )
+        self._overrun_hist = [ 0 ] * ( len( ControlLoop.HIST_EDGES ) + 1 )
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Cycle, overrun and skipped-deadline counts, the maximum wake-up jitter (in microseconds),
+            jitter and overrun histograms over the bins given by 'edges_us', and per-device counts of
+            sent commands and commands replaced by a newer one while held back by the rate budget
+        """
+        return { 'cycles' : self.cycles, 'overruns' : self.overruns, 'skipped' : self.skipped,
+                 'errors' : self.errors, 'max_jitter_us' : self.max_jitter * 1e6,
+                 'edges_us' : list( ControlLoop.HIST_EDGES ),
+                 'jitter_hist' : list( self._jitter_hist ), 'overrun_hist' : list( self._overrun_hist ),
+                 'sent' : dict( self.sent ), 'superseded' : dict( self.superseded ) }
+
+    def run( self, cycles = None, duration = None ):
+        """
+        Run the loop in the calling thread
+
+        Parameters
+        ----------
+        cycles : int
+            Stop after this many cycles (None to run until stop() or the duration elapses)
+        duration : float
+            Stop after this many seconds (None to run until stop() or the cycles are done)
+
+        Notes
+        -----
+        Deadlines are start + k * period on the monotonic clock, so wake-up errors never accumulate.
+        A cycle that runs past the next deadline is counted as an overrun and the missed deadlines are
+        skipped rather than run back to back.
+        """
+        period = self._period
+        start = time.monotonic()
+        end = start + duration if duration is not None else math.inf
+        deadline = start
+        done = 0
+        while not self._stopping.is_set() and ( cycles is None or done < cycles ):
+            # sleep most of the way, then spin up to the deadline
+            now = time.monotonic()
+            if deadline - now > self._spin: time.sleep( deadline - now - self._spin )
+            while True:
+                now = time.monotonic()
+                if now >= deadline: break
+            if now >= end: break
+            jitter = now - deadline
+            self._jitter_hist[ bisect.bisect_right( ControlLoop.HIST_EDGES, jitter * 1e6 ) ] += 1
+            if jitter > self.max_jitter: self.max_jitter = jitter
+
+            self._cycle( deadline )
+            done += 1
+            self.cycles += 1
+
+            # next deadline, skipping any that the cycle ran past
+            deadline += period
+            now = time.monotonic()
+            if now > deadline:
+                late = now - deadline
+                self.overruns += 1
+                self._overrun_hist[ bisect.bisect_right( ControlLoop.HIST_EDGES, late * 1e6 ) ] += 1
+                missed = int( late // period ) + 1
+                self.skipped += missed
+                deadline += missed * period
+
+    def start( self, **kwargs ):
+        """
+        Run the loop in a background thread (keyword arguments are passed to run())
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread( target = self.run, kwargs = kwargs, daemon = True )
+        self._thread.start()
+
+    def stop( self, timeout = 1.0 ):
+        """
+        Stop the loop and wait for the background thread (if any) to finish
+        """
+        self._stopping.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join( timeout )
+
+    def _cycle( self, now ):
+        """
+        One sense -> compute -> actuate pass (now is the cycle deadline, so budgets follow the schedule, not the jitter)
+        """
+        sample = self._sense()
+        if sample is not None:
+            tracer = LatencyTracer.active
+            if tracer is not None: tracer.stamp( 'dispatch' )
+            commands = self._compute( sample )
+            if commands:
+                for device, cmd in commands.items():
+                    if device in self._held: self.superseded[ device ] += 1   # superseded before it was sent
+                    self._held[ device ] = cmd
+
+        # send held commands whose device budget allows it
+        for device in list( self._held ):
+            if now - self._last_sent[ device ] < self._intervals[ device ] - 1e-9: continue    # tolerate deadline rounding
+            cmd = self._held.pop( device )
+            try:
+                self._actuators[ device ]( cmd )
+            except Exception as e:
+                # the command is lost, the loop keeps its rate
+                self.errors += 1
+                self.last_error = e
+                continue
+            self._last_sent[ device ] = now
+            self.sent[ device ] += 1
+
+if __name__ == '__main__':
+    import math as _math
+
+    import Quaternion
+
+    from Positional import Positional
+    from PoseMailbox import PoseMailbox
+    from TASKASimulator import SimulatedSerial
+    from IBTSimulator import IBTStandIn
+
+    # 50 Hz loop on the simulated hand and wrist, fed by a 200 Hz synthetic tracker
+    standin = IBTStandIn()
+    hand = Positional( com = SimulatedSerial(), macA = standin.address, supervised = False )
+    mailbox = PoseMailbox( max_age = 0.1 )
+    done = threading.Event()
+
+    def track():
+        start = time.monotonic()
+        while not done.is_set():
+            roll = 0.8 * _math.sin( 2.0 * ( time.monotonic() - start ) )
+            mailbox.put( Quaternion.from_euler( [ roll, 0.0, 0.0 ] ).tolist(), [ 1.0, 0.0, 0.0, 0.0 ] )
+            time.sleep( 0.005 )
+
+    def sense():
+        pose = mailbox.take()
+        return None if pose is None else pose[2:]
+
+    def compute( pose ):
+        cmd = hand.track_wrist( pose[0], pose[1], send = False )
+        fingers = 20.0 + 60.0 * abs( hand.WristController.euler[0] ) / 0.8
+        commands = { 'hand' : { 'angles' : [ fingers ] * 6 } }
+        if cmd is not None: commands[ 'wrist' ] = cmd
+        return commands
+
+    loop = ControlLoop( hand, sense, compute, rate = 50.0 )
+    threading.Thread( target = track, daemon = True ).start()
+    loop.run( duration = 3.0 )
+    done.set()
+    hand.send_wrist( 'rest' )
+    print( 'Loop:', loop.stats )
+    print( 'Wrist transitions:', hand.WristController.stats, 'frames at the stand-in:', standin.frames )
+    standin.close()
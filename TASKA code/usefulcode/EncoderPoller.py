@@ -0,0 +1,125 @@
+import threading
+import time
+
+import numpy as np
+
+class EncoderPoller():
+    """ Background thread that keeps a timestamped snapshot of the TASKA encoder positions """
+    def __init__( self, taska, rate = 2.0 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        taska : TASKA
+            The hand to poll (must provide read_encoders( out ))
+        rate : float
+            The polling rate (in Hz), a read_encoders() round trip takes ~0.33 s at 4800 baud
+
+        Returns
+        -------
+        obj
+            An EncoderPoller object with its polling thread running
+
+        Notes
+        -----
+        Each poll is read into a scratch buffer and copied into the preallocated snapshot under a lock,
+        so readers never see a half-written snapshot and never wait on the serial link.
+        """
+        self._taska = taska
+        self._period = 1.0 / rate
+
+        self._scratch = np.zeros( 6, dtype = float )
+        self._positions = np.zeros( 6, dtype = float )
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._first = threading.Event()         # set once the snapshot holds a real reading
+        self._subscribers = []
+
+        self.polls = 0
+        self.failures = 0
+
+        self._stopping = threading.Event()
+        self._thread = threading.Thread( target = self._poll_loop, daemon = True )
+        self._thread.start()
+
+    def latest( self, out = None ):
+        """
+        Read the most recent snapshot without blocking on the link
+
+        Parameters
+        ----------
+        out : numpy.ndarray (6,), optional
+            Preallocated buffer to copy the positions into
+
+        Returns
+        -------
+        numpy.ndarray (6,)
+            The encoder positions [Index, Middle, Ring, Little, Thumb, Rotator]
+        float or None
+            The time.monotonic() stamp of the snapshot (None before the first successful poll)
+        """
+        if out is None: out = np.empty( 6, dtype = float )
+        with self._lock:
+            np.copyto( out, self._positions )
+            stamp = self._stamp
+        return out, stamp
+
+    def wait( self, timeout = None ):
+        """
+        Wait for the first successful poll
+
+        Returns
+        -------
+        bool
+            True once the snapshot holds a real reading, False on timeout
+        """
+        return self._first.wait( timeout )
+
+    def subscribe( self, callback ):
+        """
+        Parameters
+        ----------
+        callback : callable
+            Called as callback( positions, stamp ) from the polling thread after every successful poll
+            (positions is a read-only view that is reused, copy it to keep it)
+        """
+        self._subscribers.append( callback )
+
+    def unsubscribe( self, callback ):
+        self._subscribers.remove( callback )
+
+    def stop( self ):
+        """
+        Stop the polling thread
+        """
+        self._stopping.set()
+        if self._thread is not threading.current_thread(): self._thread.join( timeout = 2.0 )
+
+    def _poll_loop( self ):
+        """
+        Poll the encoders at a fixed rate using monotonic deadlines
+        """
+        view = self._positions.view()
+        view.flags.writeable = False
+        deadline = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                self._taska.read_encoders( out = self._scratch )
+            except ( RuntimeError, OSError ):
+                # no answer, a garbled answer or a failed port, the snapshot keeps its last good value
+                self.failures += 1
+            else:
+                stamp = time.monotonic()
+                with self._lock:
+                    np.copyto( self._positions, self._scratch )
+                    self._stamp = stamp
+                self._first.set()
+                self.polls += 1
+                for callback in list( self._subscribers ):
+                    callback( view, stamp )
+
+            deadline += self._period
+            delay = deadline - time.monotonic()
+            if delay > 0: self._stopping.wait( delay )
+            else: deadline = time.monotonic()             # fell behind, do not try to catch up
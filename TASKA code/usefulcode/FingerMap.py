@@ -0,0 +1,106 @@
+import numpy as np
+
+class FingerMap():
+    """ Calibrated per-finger mapping from joint angles to TASKA motor positions """
+    NUM_FINGERS = 6
+
+    def __init__( self, lower = 20.0, upper = 80.0 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        lower : float or iterable of floats (6,)
+            The input value of each finger that maps to fully open (position 0)
+        upper : float or iterable of floats (6,)
+            The input value of each finger that maps to fully closed (position 255)
+
+        Returns
+        -------
+        obj
+            A FingerMap object
+
+        Notes
+        -----
+        Iterables should be in the following finger order: [Index, Middle, Ring, Little, Thumb, Rotator]
+        """
+        self._scratch = np.zeros( FingerMap.NUM_FINGERS, dtype = float )
+        self._speed = np.zeros( FingerMap.NUM_FINGERS, dtype = float )
+        self.calibrate( lower, upper )
+
+    def calibrate( self, lower, upper ):
+        """
+        Set the input range of every finger
+
+        Parameters
+        ----------
+        lower : float or iterable of floats (6,)
+            The input value of each finger that maps to fully open
+        upper : float or iterable of floats (6,)
+            The input value of each finger that maps to fully closed
+
+        Raises
+        ------
+        ValueError
+            A range is empty or inverted
+        """
+        lower = np.broadcast_to( np.asarray( lower, dtype = float ), ( FingerMap.NUM_FINGERS, ) ).copy()
+        upper = np.broadcast_to( np.asarray( upper, dtype = float ), ( FingerMap.NUM_FINGERS, ) ).copy()
+        if np.any( upper <= lower ): raise ValueError( 'Finger ranges must have upper > lower' )
+        self.lower = lower
+        self.upper = upper
+        self._span = upper - lower
+
+    def map( self, values, out = None ):
+        """
+        Clamp, scale and quantize finger values to motor positions
+
+        Parameters
+        ----------
+        values : iterable of floats (6,)
+            The finger values in the calibrated input units
+        out : numpy.ndarray (6,) of uint8, optional
+            Destination for the positions (e.g. a view into the packet buffer)
+
+        Returns
+        -------
+        numpy.ndarray (6,) of uint8
+            The positions [0, 255], truncated toward zero like int( 255 * proportion ) (NaN maps to the lower bound)
+        """
+        if out is None: out = np.empty( FingerMap.NUM_FINGERS, dtype = np.uint8 )
+        tmp = self._scratch
+        tmp[:] = values                     # single conversion, the rest runs on the scratch buffer
+        np.fmax( tmp, self.lower, out = tmp )  # fmax ignores NaN, so NaN clamps to lower like max( lower, nan )
+        np.minimum( tmp, self.upper, out = tmp )
+        np.subtract( tmp, self.lower, out = tmp )
+        np.divide( tmp, self._span, out = tmp )
+        np.multiply( tmp, 255, out = tmp )
+        np.copyto( out, tmp, casting = 'unsafe' )
+        return out
+
+    def quantize( self, proportions, out ):
+        """
+        Quantize proportions [0, 1] (e.g. finger speeds) to [0, 255]
+
+        Parameters
+        ----------
+        proportions : float or iterable of floats (6,)
+            A single value for every finger or one per finger
+        out : numpy.ndarray (6,) of uint8
+            Destination for the quantized values
+
+        Returns
+        -------
+        numpy.ndarray (6,) of uint8
+            The out array
+        """
+        if isinstance( proportions, ( int, float ) ):
+            out[:] = int( 255 * max( 0.0, min( 1.0, proportions ) ) )    # common case, one speed for all fingers
+            return out
+        tmp = self._speed
+        tmp[:] = proportions
+        np.fmin( tmp, 1.0, out = tmp )        # NaN clamps to 1 like max( 0.0, min( 1.0, nan ) )
+        np.maximum( tmp, 0.0, out = tmp )
+        np.multiply( tmp, 255, out = tmp )
+        np.copyto( out, tmp, casting = 'unsafe' )
+        return out
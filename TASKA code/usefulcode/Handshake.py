@@ -0,0 +1,157 @@
+import threading
+import time
+
+# per-device record of the configuration already applied during this session
+#   ( 'ibt', address )   -> the grip registration frames the controller holds
+#   ( 'taska', mac )     -> the encoder enable packets the hand has acknowledged
+_cache = {}
+_lock = threading.Lock()
+
+def configured( kind, address ):
+    """
+    Returns
+    -------
+    bytes or None
+        The configuration cached for the device, None if it has not been configured yet
+    """
+    with _lock: return _cache.get( ( kind, address ) )
+
+def forget( kind = None, address = None ):
+    """
+    Drop cached configurations so the next handshake repeats them in full
+
+    Parameters
+    ----------
+    kind : str
+        Only forget 'ibt' or 'taska' devices (all if None)
+    address : str
+        Only forget this device (all if None)
+    """
+    with _lock:
+        for key in list( _cache ):
+            if ( kind is None or key[0] == kind ) and ( address is None or key[1] == address ):
+                del _cache[ key ]
+
+def ibt( bt, address, session, registration, cache = True ):
+    """
+    Connect to an IBT controller and register its grips in a single write
+
+    Parameters
+    ----------
+    bt : socket-like
+        The connected stream to the controller
+    address : str
+        The controller address (the cache key)
+    session : bytes
+        The connect and status frames sent on every new link
+    registration : bytes
+        The concatenated 0x93 grip registration frames
+    cache : bool
+        True to skip the registration frames if this controller already holds them
+
+    Returns
+    -------
+    bool
+        True if the registration was skipped because it was cached
+
+    Notes
+    -----
+    Grip registrations are stored on the controller, so a link that dropped while the controller
+    stayed powered only needs the session frames. The controller does not acknowledge them, so a
+    cached registration is only an assumption: call forget() after power cycling the controller
+    (SupervisedDevice does so before every reconnect).
+    """
+    key = ( 'ibt', address )
+    with _lock: cached = cache and _cache.get( key ) == registration
+    bt.sendall( session if cached else session + registration )
+    if cache:
+        with _lock: _cache[ key ] = registration
+    return cached
+
+def read_response( ser, timeout = 0.5, success = ( b'CONNECT', ), failure = ( b'NO CARRIER', b'ERROR' ) ):
+    """
+    Read an AT command response line by line until it succeeds, fails or times out
+
+    Parameters
+    ----------
+    ser : serial-like
+        The port the command was written to
+    timeout : float
+        The maximum time (in seconds) to wait for a terminating line
+    success : tuple of bytes
+        Line prefixes that report success
+    failure : tuple of bytes
+        Line prefixes that report failure
+
+    Returns
+    -------
+    ( bool or None, bytes )
+        True / False for a success / failure line (None on timeout) and the raw response
+    """
+    deadline = time.monotonic() + timeout
+    resp = bytearray()
+    start = 0
+    while time.monotonic() < deadline:
+        resp += ser.read( max( 1, ser.in_waiting ) )
+        while True:
+            end = resp.find( b'\n', start )
+            if end < 0: break
+            line = bytes( resp[ start : end ] ).strip()
+            start = end + 1
+            if line.startswith( success ): return True, bytes( resp )
+            if line.startswith( failure ): return False, bytes( resp )
+    return None, bytes( resp )
+
+def taska( ser, mac, enable_pkts, timeout = 0.5, cache = True ):
+    """
+    Connect to a TASKA hand and enable its motor encoders
+
+    Parameters
+    ----------
+    ser : serial-like
+        The port of the bluetooth serial module
+    mac : str
+        The MAC address of the hand (if None, the module connects to the first one found)
+    enable_pkts : list of bytes
+        The encoder enable packets, each acknowledged with a 6 byte response
+    timeout : float
+        The maximum time (in seconds) to wait for the connection response, and then for the
+        encoder acknowledgements
+    cache : bool
+        True to skip the encoder enables if this hand already acknowledged them
+
+    Returns
+    -------
+    ( bool or None, bytes )
+        The connection result and raw response as returned by read_response(). The result is
+        False if the hand connected but did not acknowledge every encoder enable in time
+
+    Notes
+    -----
+    All encoder enables are written at once and the acknowledgements are read as a single block,
+    so the handshake costs one round trip instead of one per motor and no fixed timeout.
+    Nothing is written after a failed or timed out connection response.
+    """
+    cmd = 'atd'
+    if mac is not None: cmd += ' %s\r\n' % mac.upper()
+    else: cmd += '\r\n'
+    port_timeout = ser.timeout
+    ser.timeout = timeout                # never block on a hand that stays silent
+    try:
+        ser.write( cmd.encode( 'utf-8' ) )
+        connected, resp = read_response( ser, timeout )
+        if not connected: return connected, resp
+
+        key = ( 'taska', mac )
+        registration = b''.join( enable_pkts )
+        with _lock: cached = cache and _cache.get( key ) == registration
+        if not cached:
+            ser.write( registration )
+            size = 6 * len( enable_pkts )    # expected response packets: [ 64, 77, I2C, 6, 11, CHKSUM ]
+            acks = ser.read( size = size )
+            if len( acks ) != size: return False, resp + acks
+            if cache:
+                with _lock: _cache[ key ] = registration
+        return connected, resp
+    finally:
+        ser.timeout = port_timeout
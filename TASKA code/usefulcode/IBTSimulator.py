@@ -0,0 +1,319 @@
+import json
+import os
+import socket
+import threading
+import time
+
+import BTTransport
+
+# IBT message opcodes (first payload byte)
+CONNECT = 0x80
+REGISTER_GRIP = 0x93
+MOVE = 0x9c
+STOP = 0x9e
+CLEAR = 0x9b
+
+# grip IDs that drive the wrist / elbow and the direction they turn ( joint, sign )
+_JOINT_GRIPS = { 0x23 : ( 'wrist', +1 ),      # supinate
+                 0x24 : ( 'wrist', -1 ),      # pronate
+                 0x2d : ( 'elbow', +1 ),      # elbow flex
+                 0x2e : ( 'elbow', -1 ) }     # elbow extend
+
+def frame( payload ):
+    """
+    Build an IBT frame [ 0xff, LENGTH, PAYLOAD..., CHKSUM ]
+
+    Parameters
+    ----------
+    payload : bytes-like
+        The message (opcode first)
+
+    Returns
+    -------
+    bytes
+        The framed message where LENGTH counts the payload and checksum bytes and
+        CHKSUM is the low byte of LENGTH - 1 plus the payload sum
+    """
+    payload = bytes( payload )
+    length = len( payload ) + 1
+    return bytes( [ 0xff, length ] ) + payload + bytes( [ ( length - 1 + sum( payload ) ) & 0xFF ] )
+
+class IBTDecoder():
+    """ Incremental decoder for the 0xff framed IBT byte stream """
+    def __init__( self ):
+        self._buffer = bytearray()
+        self.bad_frames = 0
+
+    def feed( self, data ):
+        """
+        Parameters
+        ----------
+        data : bytes-like
+            Bytes received from the stream
+
+        Returns
+        -------
+        list of bytes
+            The payload of every complete frame with a valid checksum
+        """
+        buf = self._buffer
+        buf.extend( data )
+        payloads = []
+        while True:
+            start = buf.find( 0xff )
+            if start < 0:
+                buf.clear()
+                break
+            if start: del buf[:start]
+            if len( buf ) < 2: break
+            length = buf[1]
+            if length < 2:
+                del buf[0]
+                continue
+            if len( buf ) < length + 2: break
+            payload = bytes( buf[ 2 : length + 1 ] )
+            if ( length - 1 + sum( payload ) ) & 0xFF != buf[ length + 1 ]:
+                self.bad_frames += 1
+                del buf[0]
+                continue
+            del buf[ : length + 2 ]
+            payloads.append( payload )
+        return payloads
+
+class IBTEmulator():
+    """ Model of an IBT controller driving a wrist rotator (and optional elbow) """
+    def __init__( self, rotation_rate = 90.0, clock = time.monotonic ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        rotation_rate : float
+            The joint speed (in degrees per second) while a move command is active
+        clock : callable
+            The monotonic clock used to timestamp messages and integrate joint angles
+
+        Returns
+        -------
+        obj
+            An IBTEmulator object
+        """
+        self._rate = rotation_rate
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.connected = False
+        self.grips = {}                         # grip ID -> registration payload
+        self.active = None                      # grip ID of the running move
+        self._angles = { 'wrist' : 0.0, 'elbow' : 0.0 }
+        self._moved = clock()
+
+        self.counts = {}
+        self.log = []                           # ( arrival time, payload )
+
+    @property
+    def angles( self ):
+        """
+        Returns
+        -------
+        dict
+            The current 'wrist' rotation (positive is supination) and 'elbow' angle in degrees
+        """
+        with self._lock:
+            self._advance( self._clock() )
+            return dict( self._angles )
+
+    def handle( self, payload, now = None ):
+        """
+        Apply one decoded IBT message
+
+        Parameters
+        ----------
+        payload : bytes
+            The message payload (opcode first)
+        now : float
+            The arrival time on the emulator clock
+        """
+        if now is None: now = self._clock()
+        with self._lock:
+            self._advance( now )
+            self.log.append( ( now, payload ) )
+            opcode = payload[0]
+            self.counts[ opcode ] = self.counts.get( opcode, 0 ) + 1
+            if opcode == CONNECT: self.connected = True
+            elif opcode == REGISTER_GRIP: self.grips[ payload[1] ] = payload
+            elif opcode == MOVE: self.active = payload[1]
+            elif opcode in ( STOP, CLEAR ): self.active = None
+
+    def _advance( self, now ):
+        """
+        Integrate the joint driven by the active move up to time now
+        """
+        dt = now - self._moved
+        self._moved = now
+        joint = _JOINT_GRIPS.get( self.active )
+        if joint is not None and dt > 0 and self.active in self.grips:
+            self._angles[ joint[0] ] += joint[1] * self._rate * dt
+
+class IBTStandIn():
+    """ Local TCP or Unix-socket server that stands in for the IBT bluetooth controller """
+    def __init__( self, path = None, host = '127.0.0.1', port = 0, emulator = None ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path : str
+            Serve on this Unix socket path instead of TCP
+        host : str
+            The TCP address to listen on
+        port : int
+            The TCP port to listen on (0 picks a free port)
+        emulator : IBTEmulator
+            The controller model (a default one is created if None)
+
+        Returns
+        -------
+        obj
+            An IBTStandIn object accepting connections (pass self.address as the driver MAC)
+        """
+        self.emulator = emulator if emulator is not None else IBTEmulator()
+        self._path = path
+        if path is not None:
+            if os.path.exists( path ): os.unlink( path )
+            self._server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+            self._server.bind( path )
+            self.address = 'unix://' + path
+        else:
+            self._server = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+            self._server.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+            self._server.bind( ( host, port ) )
+            self.address = 'tcp://%s:%d' % self._server.getsockname()
+        self._server.listen( 4 )
+
+        self._frame_event = threading.Condition()
+        self.frames = 0
+        self.bad_frames = 0
+        self._clients = []
+        self._running = True
+        self._thread = threading.Thread( target = self._accept_loop, daemon = True )
+        self._thread.start()
+
+    def wait_frames( self, count, timeout = 1.0 ):
+        """
+        Wait until at least count frames have been decoded in total
+
+        Returns
+        -------
+        bool
+            True if the count was reached, False on timeout
+        """
+        with self._frame_event:
+            return self._frame_event.wait_for( lambda: self.frames >= count, timeout )
+
+    def drop( self ):
+        """
+        Close every client connection (as a lost radio link would) while still accepting new ones
+
+        Returns
+        -------
+        int
+            The number of connections closed
+        """
+        clients, self._clients = self._clients, []
+        for conn in clients:
+            try: conn.shutdown( socket.SHUT_RDWR )
+            except OSError: pass
+        return len( clients )
+
+    def close( self ):
+        self._running = False
+        self.drop()
+        try: self._server.close()
+        except OSError: pass
+        if self._path is not None and os.path.exists( self._path ): os.unlink( self._path )
+
+    def _accept_loop( self ):
+        while self._running:
+            try: conn, _ = self._server.accept()
+            except OSError: break
+            self._clients.append( conn )
+            threading.Thread( target = self._client_loop, args = ( conn, ), daemon = True ).start()
+
+    def _client_loop( self, conn ):
+        # each connection gets its own decoder so a partial frame from a dropped client never reaches the next one
+        decoder = IBTDecoder()
+        with conn:
+            while self._running:
+                try: data = conn.recv( 4096 )
+                except OSError: break
+                if not data: break
+                now = time.monotonic()
+                bad = decoder.bad_frames
+                payloads = decoder.feed( data )
+                for payload in payloads: self.emulator.handle( payload, now )
+                with self._frame_event:
+                    self.frames += len( payloads )
+                    self.bad_frames += decoder.bad_frames - bad
+                    self._frame_event.notify_all()
+
+def save_log( log, path ):
+    """
+    Save an emulator message log as JSON lines of { 't' : seconds since the first message, 'frame' : hex }
+    """
+    t0 = log[0][0] if log else 0.0
+    with open( path, 'w' ) as f:
+        for t, payload in log:
+            f.write( json.dumps( { 't' : t - t0, 'frame' : frame( payload ).hex() } ) + '\n' )
+
+def load_log( path ):
+    """
+    Returns
+    -------
+    list of tuples
+        ( seconds since the first message, framed bytes ) for every saved message
+    """
+    with open( path ) as f:
+        return [ ( entry[ 't' ], bytes.fromhex( entry[ 'frame' ] ) ) for entry in map( json.loads, f ) ]
+
+def replay( session, address, speed = 1.0 ):
+    """
+    Resend a recorded session to a controller or stand-in
+
+    Parameters
+    ----------
+    session : list of tuples
+        ( time, framed bytes ) entries as returned by load_log()
+    address : str
+        The controller MAC address or stand-in address
+    speed : float
+        The replay speed factor (None or 0 to send as fast as possible)
+
+    Returns
+    -------
+    float
+        The wall time (in seconds) the replay took
+    """
+    bt = BTTransport.connect( address )
+    start = time.monotonic()
+    try:
+        for t, data in session:
+            if speed:
+                delay = start + t / speed - time.monotonic()
+                if delay > 0: time.sleep( delay )
+            bt.sendall( data )
+    finally:
+        bt.close()
+    return time.monotonic() - start
+
+if __name__ == '__main__':
+    # drive the ActiveWrist driver against a local stand-in and report the simulated rotation
+    from ActiveWrist import ActiveWrist
+
+    standin = IBTStandIn()
+    wrist = ActiveWrist( mac = standin.address )
+    for move in [ 'pronate', 'rest', 'supinate', 'rest' ]:
+        wrist.publish( move )
+        time.sleep( 0.25 )
+        print( '%-8s wrist angle: %6.1f deg' % ( move, standin.emulator.angles[ 'wrist' ] ) )
+    print( 'Frames received:', standin.frames, 'by opcode:', { hex( k ) : v for k, v in standin.emulator.counts.items() } )
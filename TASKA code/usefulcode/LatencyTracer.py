@@ -0,0 +1,181 @@
+import time
+
+from array import array
+
+import numpy as np
+
+# default stages of the receive -> compute -> actuate path, in order. Each stamp marks the end of its stage:
+#   receive   the datagram was read from the socket (starts the sample, time idling on an empty socket is not latency)
+#   decode    the pose was decoded (TrackerServer / BatchReceiver)
+#   dispatch  the controller picked the pose up: mailbox wait plus the executor hand-off or control loop schedule
+#   compute   the wrist controller update finished (Positional.track_wrist)
+#   write     a command was written to a device (ActiveWrist socket or TASKA serial port)
+#   ack       the TASKA acknowledged a command (SerialTransport reader thread)
+STAGES = ( 'receive', 'decode', 'dispatch', 'compute', 'write', 'ack' )
+
+# the tracer the instrumented modules stamp into, None when tracing is disabled
+active = None
+
+def enable( stages = STAGES, capacity = 4096 ):
+    """
+    Start tracing (instrumented code checks the module level active tracer)
+
+    Returns
+    -------
+    LatencyTracer
+        The new active tracer
+    """
+    global active
+    active = LatencyTracer( stages, capacity )
+    return active
+
+def disable():
+    """
+    Stop tracing, instrumented code skips every stamp afterwards
+    """
+    global active
+    active = None
+
+class LatencyTracer():
+    """ Fixed-size ring buffer of per-sample stage timestamps """
+    # default histogram bin edges (in microseconds)
+    HIST_EDGES = [ 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000 ]
+
+    def __init__( self, stages = STAGES, capacity = 4096 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        stages : iterable of str
+            The stage names in pipeline order (the first one is stamped by begin())
+        capacity : int
+            The number of samples kept (older samples are overwritten)
+
+        Returns
+        -------
+        obj
+            A LatencyTracer object
+
+        Notes
+        -----
+        Stamps are time.perf_counter_ns() values written into a flat array( 'q' ) at slot * stages + stage, so a
+        stamp is one clock read and one list-like store. stamp() writes into the sample most recently begun unless
+        a slot is given; with several threads in flight a late stage (e.g. an ack) can land on a newer sample.
+        """
+        self.stages = list( stages )
+        self._stage_index = { stage : i for i, stage in enumerate( self.stages ) }
+        self._width = len( self.stages )
+        self._capacity = capacity
+        self._ring = array( 'q', bytes( 8 * capacity * self._width ) )
+        self._blank = array( 'q', bytes( 8 * self._width ) )
+        self._next = 0
+        self._slot = 0
+
+    @property
+    def samples( self ):
+        """
+        Returns
+        -------
+        int
+            The number of samples begun (only the last capacity of them are kept)
+        """
+        return self._next
+
+    def begin( self ):
+        """
+        Start a new sample and stamp its first stage
+
+        Returns
+        -------
+        int
+            The slot of the sample (pass it to stamp() from code that may run after the next sample began)
+        """
+        slot = ( self._next % self._capacity ) * self._width
+        self._next += 1
+        self._ring[ slot : slot + self._width ] = self._blank
+        self._ring[ slot ] = time.perf_counter_ns()
+        self._slot = slot
+        return slot
+
+    def stamp( self, stage, slot = None ):
+        """
+        Parameters
+        ----------
+        stage : str
+            The stage that just completed
+        slot : int
+            The slot returned by begin() (the most recent sample if None)
+        """
+        self._ring[ ( self._slot if slot is None else slot ) + self._stage_index[ stage ] ] = time.perf_counter_ns()
+
+    def clear( self ):
+        self._ring = array( 'q', bytes( 8 * self._capacity * self._width ) )
+        self._next = 0
+        self._slot = 0
+
+    def latencies( self ):
+        """
+        Returns
+        -------
+        dict
+            Stage -> numpy.ndarray of the time (in microseconds) from the previous stamped stage to this one for
+            every kept sample that reached it, plus 'total' from the first to the last stamp of each sample.
+            Stamps older than an earlier stage (left by a command of an overlapping sample) are skipped
+        """
+        ring = np.frombuffer( self._ring, dtype = np.int64 ).reshape( self._capacity, self._width )
+        ring = ring[ ring[ :, 0 ] != 0 ]
+        # the latest stamp up to each stage, so a skipped stage is measured from the one before it
+        reached = np.maximum.accumulate( ring, axis = 1 )
+        out = {}
+        for i, stage in enumerate( self.stages[1:], start = 1 ):
+            mask = ( ring[ :, i ] != 0 ) & ( ring[ :, i ] >= reached[ :, i - 1 ] )
+            out[ stage ] = ( ring[ mask, i ] - reached[ mask, i - 1 ] ) / 1e3
+        out[ 'total' ] = ( reached[ :, -1 ] - ring[ :, 0 ] ) / 1e3
+        return out
+
+    def percentiles( self, q = ( 50, 95, 99 ) ):
+        """
+        Returns
+        -------
+        dict
+            Stage -> { 'count' : samples, 'p50' : us, 'p95' : us, 'p99' : us } (None values for stages never reached)
+        """
+        out = {}
+        for stage, values in self.latencies().items():
+            row = { 'count' : len( values ) }
+            for p, value in zip( q, np.percentile( values, q ) if len( values ) else [ None ] * len( q ) ):
+                row[ 'p%g' % p ] = None if value is None else float( value )
+            out[ stage ] = row
+        return out
+
+    def histograms( self, edges = None ):
+        """
+        Parameters
+        ----------
+        edges : list of floats
+            The bin edges (in microseconds), defaults to HIST_EDGES
+
+        Returns
+        -------
+        dict
+            'edges_us' and stage -> counts per bin ( < edges[0], ..., >= edges[-1] )
+        """
+        if edges is None: edges = LatencyTracer.HIST_EDGES
+        out = { 'edges_us' : list( edges ) }
+        for stage, values in self.latencies().items():
+            out[ stage ] = np.bincount( np.searchsorted( edges, values, side = 'right' ), minlength = len( edges ) + 1 ).tolist()
+        return out
+
+    def report( self ):
+        """
+        Returns
+        -------
+        str
+            A table of the per-stage percentiles
+        """
+        lines = [ '%-10s %8s %10s %10s %10s' % ( 'stage', 'count', 'p50 (us)', 'p95 (us)', 'p99 (us)' ) ]
+        for stage, row in self.percentiles().items():
+            if not row[ 'count' ]: lines.append( '%-10s %8d %10s %10s %10s' % ( stage, 0, '-', '-', '-' ) )
+            else: lines.append( '%-10s %8d %10.1f %10.1f %10.1f' % ( stage, row[ 'count' ], row[ 'p50' ], row[ 'p95' ], row[ 'p99' ] ) )
+        return '\n'.join( lines )
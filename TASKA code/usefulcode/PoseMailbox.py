@@ -0,0 +1,130 @@
+import threading
+import time
+
+class PoseMailbox():
+    """ Single-slot, latest-value-wins mailbox for tracker/calibrator poses """
+    def __init__( self, max_age = None, clock = time.monotonic ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        max_age : float
+            The maximum age (in seconds) of a pose handed to the controller (no limit if None)
+        clock : callable
+            The monotonic clock used to timestamp poses
+
+        Returns
+        -------
+        obj
+            A PoseMailbox object
+
+        Notes
+        -----
+        Designed for one producer (the socket reader) and one consumer (the controller).
+        The slot is a single tuple reference that is replaced, never mutated, so neither side takes a lock.
+        Poses that are overwritten before being taken are counted as superseded, and poses older than
+        max_age when taken are discarded and counted as stale.
+        """
+        self._max_age = max_age
+        self._clock = clock
+        self._ready = threading.Event()
+
+        # slot holds ( seq, stamp, tracker, calibrator )
+        self._slot = None
+        self._seq = 0
+        self._last_seq = 0
+
+        self.posted = 0
+        self.delivered = 0
+        self.superseded = 0
+        self.stale = 0
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of posted, delivered, superseded and stale poses
+        """
+        return { 'posted' : self.posted, 'delivered' : self.delivered,
+                 'superseded' : self.superseded, 'stale' : self.stale }
+
+    def put( self, tracker, calibrator, stamp = None, count = 1 ):
+        """
+        Post a new pose, replacing any pose that has not been taken yet
+
+        Parameters
+        ----------
+        tracker : iterable of floats (4,)
+            The tracker quaternion
+        calibrator : iterable of floats (4,)
+            The calibrator quaternion
+        stamp : float
+            The time the pose was sampled on the mailbox clock (now if None)
+        count : int
+            The number of received poses this one stands for (the older ones from the same batch count as superseded)
+        """
+        self._seq += count
+        self._slot = ( self._seq, self._clock() if stamp is None else stamp, tracker, calibrator )
+        self.posted += count
+        self._ready.set()
+
+    def take( self, max_age = None ):
+        """
+        Take the freshest pose without waiting
+
+        Parameters
+        ----------
+        max_age : float
+            Overrides the mailbox max_age for this call
+
+        Returns
+        -------
+        tuple or None
+            ( seq, stamp, tracker, calibrator ) for the freshest pose, or None if there is no new, fresh pose
+        """
+        slot = self._slot
+        if slot is None or slot[0] == self._last_seq: return None
+
+        self.superseded += slot[0] - self._last_seq - 1
+        self._last_seq = slot[0]
+
+        if max_age is None: max_age = self._max_age
+        if max_age is not None and self._clock() - slot[1] > max_age:
+            self.stale += 1
+            return None
+
+        self.delivered += 1
+        return slot
+
+    def wait( self, timeout = None, max_age = None ):
+        """
+        Wait for the next fresh pose
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time to wait (in seconds), or None to wait forever
+        max_age : float
+            Overrides the mailbox max_age for this call
+
+        Returns
+        -------
+        tuple or None
+            ( seq, stamp, tracker, calibrator ) for the freshest pose, or None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            pose = self.take( max_age )
+            if pose is not None: return pose
+
+            # clear before re-checking so a put() racing with us still wakes us up
+            self._ready.clear()
+            pose = self.take( max_age )
+            if pose is not None: return pose
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0: return None
+            self._ready.wait( remaining )
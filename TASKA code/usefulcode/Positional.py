@@ -1,5 +1,8 @@
 import time
 import serial
+import logging
+import threading
+import concurrent.futures
 
 import numpy as np
 
@@ -7,10 +10,16 @@ from serial import Serial
 
 import sys
 
-import bluetooth
-
 from TASKA import TASKA
 from ActiveWrist import ActiveWrist
+from Supervisor import SupervisedDevice
+from WristController import WristController
+from Actuation import Actuation
+from FingerMap import FingerMap
+
+import LatencyTracer
+
+log = logging.getLogger(__name__)
 
 #Need to create a new class that has all these inits and these inits have self.TASKA
 #Now when calling anything from TASKA or ActiveWrist you have to use things like self.Taska.publish() to do so
@@ -18,15 +27,102 @@ from ActiveWrist import ActiveWrist
 
 class Positional():
 
-    def __init__(self,com = 'COM3', macT = '68:0a:e2:74:67:62', macA = 'ec:fe:7e:1d:8e:a1', elbow = False):
+    def __init__(self,com = 'COM3', macT = '68:0a:e2:74:67:62', macA = 'ec:fe:7e:1d:8e:a1', elbow = False, supervised = True, parallel = True, recorder = None):
         #calling TASKA and ActiveWrist into class as objects
-        self.TASKA = TASKA(com = com, mac = macT)
-        #to do add a current limit 
-        self.ActiveWrist = ActiveWrist(mac = macA, elbow = elbow)
+        #supervised devices reconnect in the background after a dropped link and replay the last command
+        #a SessionRecorder (if given) records the poses tracked and every packet sent to/from both devices
+        self.recorder = recorder
+        def wrist():
+            device = ActiveWrist(mac = macA, elbow = elbow)
+            device.recorder = recorder
+            return device
+        if supervised:
+            self.TASKA = SupervisedDevice(lambda: TASKA(com = com, mac = macT, recorder = recorder), name = 'TASKA')
+            self.ActiveWrist = SupervisedDevice(wrist, name = 'ActiveWrist')
+        else:
+            self.TASKA = TASKA(com = com, mac = macT, recorder = recorder)
+            #to do add a current limit 
+            self.ActiveWrist = wrist()
+        #finger angles in degrees, 20 degrees = fully extended, 80 degrees = fully closed (calibrate per finger)
+        self.FingerMap = FingerMap(lower = 20, upper = 80)
+        #closed-loop wrist rotation, replace to change its target/deadband/dwell
+        self.WristController = WristController()
+        #one worker thread per device so a stall on one link never delays the other
+        #the locks keep direct callers (e.g. ControlLoop) from writing a device at the same time as its worker
+        self._locks = {name: threading.Lock() for name in ['TASKA', 'ActiveWrist']}
+        self._workers = None
+        if parallel:
+            self._workers = {name: concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = name)
+                             for name in ['TASKA', 'ActiveWrist']}
+
+    @property
+    def link_stats(self):
+        #outage and time-to-recover counters of the supervised devices
+        return {name: getattr(device, 'stats', None) for name, device in [('TASKA', self.TASKA), ('ActiveWrist', self.ActiveWrist)]}
+
+    def close(self):
+        #finishes the commands already handed to the device workers, then stops them and closes both devices
+        if self._workers is not None:
+            for worker in self._workers.values():
+                worker.shutdown(wait = True)
+            self._workers = None
+        for device in [self.TASKA, self.ActiveWrist]:
+            close = getattr(device, 'close', None)
+            if close is not None:
+                close()
 
     def test_command(self, cmd): 
-        self.ActiveWrist.publish(cmd)
-    def send_command(self, cmd = "rest", move = None, prop = 1.0, angles = None, speed = 1.0 ):
+        with self._locks['ActiveWrist']:
+            self.ActiveWrist.publish(cmd)
+
+    def send_hand(self, move = None, prop = 1.0, angles = None, speed = 1.0):
+        #TASKA half of send_command, angles are in degrees and mapped by self.FingerMap
+        with self._locks['TASKA']:
+            self.TASKA.publish(move = move, prop = prop, angles = angles, speed = speed, finger_map = self.FingerMap)
+
+    def send_wrist(self, cmd = "rest"):
+        #ActiveWrist half of send_command, the wrist only transmits when the movement changes
+        with self._locks['ActiveWrist']:
+            self.ActiveWrist.publish(cmd)
+
+    def track_wrist(self, tracker, calibrator, now = None, send = True):
+        #one closed-loop wrist update from the relative roll, commands are only sent on state transitions
+        #send = False only returns the command, for a caller that schedules the send itself (e.g. ControlLoop)
+        #the command goes through the wrist worker, so it stays in order with send_command
+        cmd = self.WristController.update(tracker, calibrator, now)
+        tracer = LatencyTracer.active
+        if tracer is not None:
+            tracer.stamp('compute')
+        if self.recorder is not None:
+            self.recorder.record_pose(tracker, calibrator, self.WristController.euler)
+        if cmd is not None and send:
+            self._submit('ActiveWrist', self.send_wrist, cmd).add_done_callback(self._log_failure)
+        return cmd
+
+    @staticmethod
+    def _log_failure(future):
+        #nobody waits on a tracked wrist command, so a failed send is only logged
+        if future.exception() is not None:
+            log.warning('wrist command failed: %r', future.exception())
+
+    def _submit(self, name, fn, *args):
+        #runs fn on the device worker (inline if not parallel), the future resolves with the latency from now
+        start = time.perf_counter()
+        def run():
+            fn(*args)
+            return time.perf_counter() - start
+        if self._workers is not None:
+            return self._workers[name].submit(run)
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(run())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def send_command(self, cmd = "rest", move = None, prop = 1.0, angles = None, speed = 1.0, wait = False):
+        #sends the hand and wrist parts concurrently and returns an Actuation handle with per-device latency
+        #wait = True blocks until both devices took the command, an unknown cmd sends nothing and returns None
         
         wristmoves = ['rest','pronate', 'supinate', 'elbow_flex', 'elbow_extend']
         taskamoves = [ 'interim', 'relaxed', 'open', 'keyboard', 'dondoff',
@@ -34,40 +130,14 @@ class Positional():
               'mug_close', 'pincer', 'tablet', 'flex', 'precision',
               'grab_go', 'mouse', 'active_index_1', 'active_index_2',
               'custom_1', 'custom_2', 'custom_3', 'custom_4', 'custom_5' ]
-        # mapping of the angles to a degree format
-        # 20 degrees = 0 fully extended
-        # 80 degrees = 1 fully closed
-        angles = [min(max(20, angle), 80) for angle in angles ]
-        # convert back to percentage with respect to 20 being 0% and 80 being 100% (linear)
-        angles = [(angles[0]-20)/60,(angles[1]-20)/60,(angles[2]-20)/60,(angles[3]-20)/60,(angles[4]-20)/60,(angles[5]-20)/60]
-
-        if cmd == "rest":
-
-            
-            self.TASKA.publish(move = move, prop = prop, angles = angles, speed = speed)
-           
-            self.ActiveWrist.publish( wristmoves[0] )
-  
-        elif cmd == "pronate":
-
-            
-            self.TASKA.publish(move = move, prop = prop, angles = angles, speed = speed)
-
-            self.ActiveWrist.publish( wristmoves[1] )
-
-            
-            #self.ActiveWrist.publish( wristmoves[0] ) 
-
-        elif cmd == "supinate":
-
-            
-            self.TASKA.publish(move = move, prop = prop, angles = angles, speed = speed) 
-
-            self.ActiveWrist.publish( wristmoves[2] )
-
-            
-
-            #self.ActiveWrist.publish( wristmoves[0] ) 
-        else:
-            print("NO KNOWN POSITIONS TRY AGAIN")    
+        if cmd not in wristmoves[0:3]:
+            log.warning('no known position %r, try again', cmd)
+            return None
+
+        # angles are mapped by send_hand, 20 degrees = 0 fully extended, 80 degrees = 1 fully closed
+        handle = Actuation({'TASKA': self._submit('TASKA', self.send_hand, move, prop, angles, speed),
+                            'ActiveWrist': self._submit('ActiveWrist', self.send_wrist, cmd)})
+        if wait:
+            handle.result()
+        return handle
 
@@ -18,23 +18,29 @@ _AXES2TUPLE = {
 
 _TUPLE2AXES = dict((v, k) for k, v in _AXES2TUPLE.items())
 
+# cache of resolved axis indices for the scalar Euler path
+_AXES2INDICES = {}
+
 _EPS4 = np.finfo(float).eps * 4
 
+# sign pattern applied by conjugate()
+_CONJUGATE = np.array( [ 1.0, -1.0, -1.0, -1.0 ] )
+
 def magnitude( q ):
     """
     Computes the magnitude of the quaternion
     
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        Input quaternion
+    q : numpy.ndarray (4,) or (..., 4)
+        Input quaternion(s)
 
     Returns
     -------
-    float
-        The magnitude of the quaternion
+    float or numpy.ndarray (...,)
+        The magnitude of the quaternion(s)
     """
-    return np.sqrt( np.sum( np.square( q ) ) )
+    return np.sqrt( np.sum( np.square( q ), axis = -1 ) )
 
 def normalize( q ):
     """
@@ -42,15 +48,16 @@ def normalize( q ):
 
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The quaternion to normalize
+    q : numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to normalize
     
     Returns
     -------
-    numpy.ndarray (4,)
-        The normalized quaternion
+    numpy.ndarray (4,) or (..., 4)
+        The normalized quaternion(s)
     """
-    return np.divide( q, magnitude( q ) )
+    q = np.asarray( q )
+    return np.divide( q, magnitude( q )[..., np.newaxis] )
 
 def conjugate( q ):
     """
@@ -58,15 +65,15 @@ def conjugate( q ):
     
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The quaternion to conjugate
+    q : numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to conjugate
     
     Returns
     -------
-    numpy.ndarray (4,)
-        The conjugated quaternion
+    numpy.ndarray (4,) or (..., 4)
+        The conjugated quaternion(s)
     """
-    return np.multiply( q, np.array( [ 1, -1, -1 , -1 ] ) )
+    return np.multiply( q, _CONJUGATE )
 
 def inverse( q ):
     """
@@ -74,13 +81,13 @@ def inverse( q ):
     
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The quaternion to invert
+    q : numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to invert
 
     Returns
     -------
-    numpy.ndarray (4,)
-        The inverted quaternion
+    numpy.ndarray (4,) or (..., 4)
+        The inverted quaternion(s)
     """
     return normalize( conjugate( q ) )
 
@@ -90,33 +97,49 @@ def multiply( q1, q2 ):
 
     Parameters
     ----------
-    q1 : numpy.ndarray (4,)
-        The first quaternion
-    q2 : numpy.ndarray (4,)
-        The second quaternion
+    q1 : numpy.ndarray (4,) or (..., 4)
+        The first quaternion(s)
+    q2 : numpy.ndarray (4,) or (..., 4)
+        The second quaternion(s)
     
     Returns
     -------
     numpy.ndarray
-        The Hamilton product of the two quaternions [4 elements]
+        The Hamilton product of the two quaternions [4 elements], broadcast over leading dimensions
+    """
+    q1 = np.asarray( q1, dtype = float )
+    q2 = np.asarray( q2, dtype = float )
+    if q1.ndim == 1 and q2.ndim == 1:
+        # single quaternions (the per-packet path) are cheaper in plain floats than as array expressions
+        return np.array( _multiply_floats( *q1.tolist(), *q2.tolist() ) )
+    w1, x1, y1, z1 = q1[...,0], q1[...,1], q1[...,2], q1[...,3]
+    w2, x2, y2, z2 = q2[...,0], q2[...,1], q2[...,2], q2[...,3]
+    return np.stack( [ w1*w2 - x1*x2 - y1*y2 - z1*z2,
+                       w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                       w1*y2 + y1*w2 + z1*x2 - x1*z2,
+                       w1*z2 + z1*w2 + x1*y2 - y1*x2 ], axis = -1 )
+
+def _multiply_floats( w1, x1, y1, z1, w2, x2, y2, z2 ):
     """
-    qm = np.zeros( q1.shape, dtype = np.float )
-    qm[0] = q1[0]*q2[0] - q1[1]*q2[1] - q1[2]*q2[2] - q1[3]*q2[3]
-    qm[1] = q1[0]*q2[1] + q1[1]*q2[0] + q1[2]*q2[3] - q1[3]*q2[2]
-    qm[2] = q1[0]*q2[2] + q1[2]*q2[0] + q1[3]*q2[1] - q1[1]*q2[3]
-    qm[3] = q1[0]*q2[3] + q1[3]*q2[0] + q1[1]*q2[2] - q1[2]*q2[1] 
-    return qm
+    Scalar core of multiply(), relative() and rotate() operating on plain floats
+    """
+    return ( w1*w2 - x1*x2 - y1*y2 - z1*z2,
+             w1*x2 + x1*w2 + y1*z2 - z1*y2,
+             w1*y2 + y1*w2 + z1*x2 - x1*z2,
+             w1*z2 + z1*w2 + x1*y2 - y1*x2 )
 
-def average( q_all, axis = 1 ):
+def average( q_all, axis = 1, weights = None ):
     """
     Average the given set of quaternions
 
     Parameters
     ----------
-    q_all : numpy.ndarray (n_samples, 4 x n_quats) or (4 x n_quats, n_samples)
+    q_all : numpy.ndarray (n_samples, 4) or (4, n_samples)
         The set of quaternions to average
     axis : int
         The axis to average the quaternions over (0 or 1)
+    weights : numpy.ndarray (n_samples,), optional
+        Non-negative weight for each sample (uniform if None)
 
     Returns
     -------
@@ -129,15 +152,104 @@ def average( q_all, axis = 1 ):
         Averaging Quaternions
         F. Landis Markley, Yang Cheng, John L. Crassidis and Yaakov Oshman
         http://www.acsu.buffalo.edu/~johnc/ave_quat07.pdf
+    The sum of outer products is accumulated as a single matrix product Q^T * W * Q
     """
-    n_quats = q_all.shape[axis]
-    Q = np.zeros( ( 4, 4 ), dtype = np.float )
-    for sample in range(0, n_quats):
-        q = q_all[:, sample] if axis == 1 else q_all[sample,:]
-        Q = np.outer( q, q ) + Q
-    Q = np.divide( Q, n_quats )
-    vals, vecs = la.eig( Q )
-    return vecs[ :, np.argmax( vals ) ]
+    q_all = np.asarray( q_all, dtype = float )
+    Q = q_all.T if axis == 1 else q_all     # (n_samples, 4)
+    if weights is None:
+        M = np.divide( np.dot( Q.T, Q ), Q.shape[0] )
+    else:
+        weights = np.asarray( weights, dtype = float )
+        M = np.divide( np.dot( Q.T * weights, Q ), np.sum( weights ) )
+    vals, vecs = la.eigh( M )               # eigenvalues in ascending order
+    return vecs[ :, -1 ]
+
+class QuaternionAverager():
+    """ Streaming quaternion averager that ingests samples one at a time """
+    def __init__( self ):
+        """
+        Constructor
+
+        Returns
+        -------
+        obj
+            A QuaternionAverager object with no samples
+
+        Notes
+        -----
+        Only the weighted 4x4 outer-product accumulator is stored, so each update is O(1)
+        and the current mean can be read at any moment without re-scanning history
+        """
+        self._M = np.zeros( ( 4, 4 ), dtype = float )
+        self._weight = 0.0
+        self._count = 0
+
+    def reset( self ):
+        """
+        Discard all accumulated samples
+        """
+        self._M[:] = 0.0
+        self._weight = 0.0
+        self._count = 0
+
+    def add( self, q, weight = 1.0 ):
+        """
+        Add a single quaternion sample
+
+        Parameters
+        ----------
+        q : numpy.ndarray (4,)
+            The quaternion sample
+        weight : float
+            The non-negative weight of the sample
+        """
+        q = np.asarray( q, dtype = float )
+        self._M += weight * np.outer( q, q )
+        self._weight += weight
+        self._count += 1
+
+    def extend( self, q_all, weights = None ):
+        """
+        Add a block of quaternion samples
+
+        Parameters
+        ----------
+        q_all : numpy.ndarray (n_samples, 4)
+            The quaternion samples
+        weights : numpy.ndarray (n_samples,), optional
+            Non-negative weight for each sample (uniform if None)
+        """
+        Q = np.asarray( q_all, dtype = float ).reshape( -1, 4 )
+        if weights is None:
+            self._M += np.dot( Q.T, Q )
+            self._weight += Q.shape[0]
+        else:
+            weights = np.asarray( weights, dtype = float )
+            self._M += np.dot( Q.T * weights, Q )
+            self._weight += np.sum( weights )
+        self._count += Q.shape[0]
+
+    @property
+    def count( self ):
+        """
+        Returns
+        -------
+        int
+            The number of samples added since construction or the last reset
+        """
+        return self._count
+
+    @property
+    def mean( self ):
+        """
+        Returns
+        -------
+        numpy.ndarray (4,) or None
+            The current average quaternion (None if no weighted samples were added)
+        """
+        if self._weight <= 0.0: return None
+        vals, vecs = la.eigh( np.divide( self._M, self._weight ) )
+        return vecs[ :, -1 ]
 
 def relative( src, dest ):
     """
@@ -145,16 +257,25 @@ def relative( src, dest ):
     
     Parameters
     ----------
-    src : numpy.ndarray (4,)
-        The source quaternion
-    dest : numpy.ndarray (4,)
-        The destination quaternion
+    src : numpy.ndarray (4,) or (..., 4)
+        The source quaternion(s)
+    dest : numpy.ndarray (4,) or (..., 4)
+        The destination quaternion(s)
     
     Returns
     -------
     numpy.ndarray
-        The quaternion representing the rotation from src to dest
-    """
+        The quaternion(s) representing the rotation from src to dest
+    """
+    src = np.asarray( src, dtype = float )
+    dest = np.asarray( dest, dtype = float )
+    if src.ndim == 1 and dest.ndim == 1:
+        # inverse( src ) is the normalized conjugate
+        sw, sx, sy, sz = src.tolist()
+        n = 1.0 / math.sqrt( sw*sw + sx*sx + sy*sy + sz*sz )
+        w, x, y, z = _multiply_floats( sw*n, -sx*n, -sy*n, -sz*n, *dest.tolist() )
+        n = 1.0 / math.sqrt( w*w + x*x + y*y + z*z )
+        return np.array( ( w*n, x*n, y*n, z*n ) )
     return normalize( multiply( inverse( src ), dest ) )
 
 def rotate( q, p ):
@@ -163,20 +284,27 @@ def rotate( q, p ):
 
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The rotation quaternion
-    p : numpy.ndarray (3,)
-        The vector to rotate
+    q : numpy.ndarray (4,) or (..., 4)
+        The rotation quaternion(s)
+    p : numpy.ndarray (3,) or (..., 3)
+        The vector(s) to rotate
 
     Returns
     -------
     numpy.ndarray
-        The rotated vector [3 elements]
-    """
-    pp = np.zeros( q.shape, dtype = np.float )
-    pp[1:] = p
+        The rotated vector(s) [3 elements], broadcast over leading dimensions
+    """
+    q = np.asarray( q, dtype = float )
+    p = np.asarray( p, dtype = float )
+    if q.ndim == 1 and p.ndim == 1:
+        w, x, y, z = q.tolist()
+        n = 1.0 / math.sqrt( w*w + x*x + y*y + z*z )
+        qp = _multiply_floats( w, x, y, z, 0.0, *p.tolist() )
+        return np.array( _multiply_floats( *qp, w*n, -x*n, -y*n, -z*n )[1:] )
+    pp = np.zeros( np.broadcast_shapes( q.shape[:-1], p.shape[:-1] ) + ( 4, ), dtype = float )
+    pp[...,1:] = p
     pr = multiply( multiply( q, pp ), inverse( q ) )
-    return pr[1:]
+    return pr[...,1:]
 
 def to_euler( q, axes = 'sxyz' ):
     """
@@ -184,22 +312,25 @@ def to_euler( q, axes = 'sxyz' ):
 
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The quaternion to compute
+    q : numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to compute
     axes : str
         The Euler angle convention (e.g. 'sxyz', 'rxyz', etc.)
 
     Returns
     -------
-    numpy.ndarray (3,)
+    numpy.ndarray (3,) or (..., 3)
         The Euler angles
 
     Notes
     -----
     Valid conventions start with 's' ('static') or 'r' ('rotate') and are followed
     by rotation axes ('xyz', 'zxz', etc.)
+    The gimbal-lock branch is selected per sample, so stacked inputs may mix both cases
     """
-    R = to_matrix( q )
+    q = np.asarray( q, dtype = float )
+    if q.ndim == 1: return np.array( _euler_from_floats( *q.tolist(), axes, None ) )
+    M = to_matrix( q )
 
     try: firstaxis, parity, repitition, frame = _AXES2TUPLE[axes.lower()]
     except (AttributeError, KeyError):
@@ -210,32 +341,149 @@ def to_euler( q, axes = 'sxyz' ):
     j = _NEXT_AXIS[i+parity]
     k = _NEXT_AXIS[i-parity+1]
 
-    M = np.array(R, dtype=np.float64, copy=False)[:3, :3]
     if repitition:
-        sy = np.sqrt( M[i,j]*M[i,j] + M[i,k]*M[i,k] )
+        sy = np.sqrt( M[...,i,j]*M[...,i,j] + M[...,i,k]*M[...,i,k] )
+        locked = sy <= _EPS4
+        ax = np.where( locked, np.arctan2( -M[...,j,k], M[...,j,j] ), np.arctan2( M[...,i,j], M[...,i,k] ) )
+        ay = np.arctan2( sy, M[...,i,i] )
+        az = np.where( locked, 0.0, np.arctan2( M[...,j,i], -M[...,k,i] ) )
+    else:
+        cy = np.sqrt( M[...,i,i]*M[...,i,i] + M[...,j,i]*M[...,j,i] )
+        locked = cy <= _EPS4
+        ax = np.where( locked, np.arctan2( -M[...,j,k], M[...,j,j] ), np.arctan2( M[...,k,j], M[...,k,k] ) )
+        ay = np.arctan2( -M[...,k,i], cy )
+        az = np.where( locked, 0.0, np.arctan2( M[...,j,i], M[...,i,i] ) )
+
+    if parity: ax, ay, az = -ax, -ay, -az
+    if frame: ax, az = az, ax
+
+    return np.stack( [ ax, ay, az ], axis = -1 )
+
+def _axes_indices( axes ):
+    """
+    Resolve an Euler convention into the (i, j, k, parity, repitition, frame) tuple used by the scalar path
+    """
+    try: return _AXES2INDICES[axes]
+    except (KeyError, TypeError): pass
+
+    try: firstaxis, parity, repitition, frame = _AXES2TUPLE[axes.lower()]
+    except (AttributeError, KeyError):
+        _TUPLE2AXES[axes] # validation
+        firstaxis, parity, repitition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    indices = ( i, j, k, parity, repitition, frame )
+    try: _AXES2INDICES[axes] = indices
+    except TypeError: pass
+    return indices
+
+def _euler_from_floats( w, x, y, z, axes, out ):
+    """
+    Scalar core of to_euler_scalar() and relative_euler() operating on plain floats
+    """
+    i, j, k, parity, repitition, frame = _axes_indices( axes )
+
+    n = 1.0 / math.sqrt( w*w + x*x + y*y + z*z )
+    w, x, y, z = w*n, x*n, y*n, z*n
+    M = ( ( w*w + x*x - y*y - z*z, 2 * ( x*y - w*z ),     2 * ( w*y + x*z ) ),
+          ( 2 * ( x*y + w*z ),     w*w - x*x + y*y - z*z, 2 * ( y*z - w*x ) ),
+          ( 2 * ( x*z - w*y ),     2 * ( w*x + y*z ),     w*w - x*x - y*y + z*z ) )
+
+    if repitition:
+        sy = math.sqrt( M[i][j]*M[i][j] + M[i][k]*M[i][k] )
         if sy > _EPS4:
-            ax = np.arctan2( M[i,j],  M[i,k] )
-            ay = np.arctan2( sy,      M[i,i] )
-            az = np.arctan2( M[j,i], -M[k,i] )
+            ax = math.atan2( M[i][j],  M[i][k] )
+            ay = math.atan2( sy,       M[i][i] )
+            az = math.atan2( M[j][i], -M[k][i] )
         else:
-            ax = np.arctan2( -M[j,k], M[j,j] )
-            ay = np.arctan2( sy,      M[i,i] )
+            ax = math.atan2( -M[j][k], M[j][j] )
+            ay = math.atan2( sy,       M[i][i] )
             az = 0.0
     else:
-        cy = np.sqrt( M[i,i]*M[i,i] + M[j,i]*M[j,i] )
+        cy = math.sqrt( M[i][i]*M[i][i] + M[j][i]*M[j][i] )
         if cy > _EPS4:
-            ax = np.arctan2(  M[k,j], M[k,k] )
-            ay = np.arctan2( -M[k,i], cy )
-            az = np.arctan2(  M[j,i], M[i,i] )
+            ax = math.atan2(  M[k][j], M[k][k] )
+            ay = math.atan2( -M[k][i], cy )
+            az = math.atan2(  M[j][i], M[i][i] )
         else:
-            ax = np.arctan2( -M[j,k], M[j,j] )
-            ay = np.arctan2( -M[k,i], cy )
+            ax = math.atan2( -M[j][k], M[j][j] )
+            ay = math.atan2( -M[k][i], cy )
             az = 0.0
 
     if parity: ax, ay, az = -ax, -ay, -az
     if frame: ax, az = az, ax
 
-    return np.array( [ax, ay, az] )
+    if out is None: return ax, ay, az
+    out[0], out[1], out[2] = ax, ay, az
+    return out
+
+def to_euler_scalar( q, axes = 'sxyz', out = None ):
+    """
+    Computes the Euler angle representation of a single quaternion using plain float math
+
+    Parameters
+    ----------
+    q : iterable of floats (4,)
+        The quaternion to compute
+    axes : str
+        The Euler angle convention (e.g. 'sxyz', 'rxyz', etc.)
+    out : numpy.ndarray (3,) or list, optional
+        Preallocated buffer to write the Euler angles into
+
+    Returns
+    -------
+    tuple of floats (3,) or out
+        The Euler angles
+
+    Notes
+    -----
+    Numerically equivalent to to_euler() for a single quaternion, but builds no temporary arrays
+    """
+    if isinstance( q, np.ndarray ): q = q.tolist()
+    w, x, y, z = q
+    return _euler_from_floats( w, x, y, z, axes, out )
+
+def relative_euler( src, dest, axes = 'sxyz', out = None ):
+    """
+    Computes the Euler angles of the destination quaternion relative to the source using plain float math
+
+    Parameters
+    ----------
+    src : iterable of floats (4,)
+        The source quaternion (e.g. the calibrator)
+    dest : iterable of floats (4,)
+        The destination quaternion (e.g. the tracker)
+    axes : str
+        The Euler angle convention (e.g. 'sxyz', 'rxyz', etc.)
+    out : numpy.ndarray (3,) or list, optional
+        Preallocated buffer to write the Euler angles into
+
+    Returns
+    -------
+    tuple of floats (3,) or out
+        The Euler angles
+
+    Notes
+    -----
+    Fused equivalent of to_euler( relative( src, dest ), axes ) for the per-datagram path
+    """
+    if isinstance( src, np.ndarray ): src = src.tolist()
+    if isinstance( dest, np.ndarray ): dest = dest.tolist()
+    sw, sx, sy, sz = src
+    dw, dx, dy, dz = dest
+
+    # inverse( src ) is the normalized conjugate
+    n = 1.0 / math.sqrt( sw*sw + sx*sx + sy*sy + sz*sz )
+    sw, sx, sy, sz = sw*n, -sx*n, -sy*n, -sz*n
+
+    w = sw*dw - sx*dx - sy*dy - sz*dz
+    x = sw*dx + sx*dw + sy*dz - sz*dy
+    y = sw*dy + sy*dw + sz*dx - sx*dz
+    z = sw*dz + sz*dw + sx*dy - sy*dx
+    return _euler_from_floats( w, x, y, z, axes, out )
 
 def quaternion_to_euler_angle( q ):
     '''Alternate function to compute XYZ Euler angles from quaternion'''
@@ -264,15 +512,15 @@ def from_euler( angles, axes = 'sxyz' ):
 
     Parameters
     ----------
-    angles : numpy.ndarray (3,)
+    angles : numpy.ndarray (3,) or (..., 3)
         The Euler angles
     axes : str
         The Euler angle convention (e.g. 'sxyz', 'rxyz', etc.)
 
     Returns
     -------
-    numpy.ndarray (4,)
-        The quaternion to compute
+    numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to compute
 
     Notes
     -----
@@ -288,13 +536,15 @@ def from_euler( angles, axes = 'sxyz' ):
     j = _NEXT_AXIS[i+parity-1] + 1
     k = _NEXT_AXIS[i-parity] + 1
 
-    ai, aj, ak = angles
+    angles = np.asarray( angles, dtype = float )
+    if angles.ndim == 1: return _from_euler_floats( *angles.tolist(), i, j, k, parity, repitition, frame )
+    ai, aj, ak = angles[...,0], angles[...,1], angles[...,2]
     if frame: ai, ak = ak, ai
     if parity: aj = -aj
 
-    ai /= 2.0
-    aj /= 2.0
-    ak /= 2.0
+    ai = ai / 2.0
+    aj = aj / 2.0
+    ak = ak / 2.0
 
     ci = np.cos( ai )
     si = np.sin( ai )
@@ -308,7 +558,34 @@ def from_euler( angles, axes = 'sxyz' ):
     sc = si * ck
     ss = si * sk
 
-    q = np.zeros( 4, dtype = np.float )
+    q = np.zeros( angles.shape[:-1] + ( 4, ), dtype = float )
+    if repitition:
+        q[...,0] = cj * ( cc - ss )
+        q[...,i] = cj * ( cs + sc )
+        q[...,j] = sj * ( cc + ss )
+        q[...,k] = sj * ( cs - sc )
+    else:
+        q[...,0] = cj * cc + sj * ss
+        q[...,i] = cj * sc - sj * cs
+        q[...,j] = cj * ss + sj * cc
+        q[...,k] = cj * cs - sj * sc
+    if parity: q[...,j] *= -1.0
+
+    return normalize( q )
+
+def _from_euler_floats( ai, aj, ak, i, j, k, parity, repitition, frame ):
+    """
+    Scalar core of from_euler() for a single set of angles operating on plain floats
+    """
+    if frame: ai, ak = ak, ai
+    if parity: aj = -aj
+
+    ci, si = math.cos( ai / 2.0 ), math.sin( ai / 2.0 )
+    cj, sj = math.cos( aj / 2.0 ), math.sin( aj / 2.0 )
+    ck, sk = math.cos( ak / 2.0 ), math.sin( ak / 2.0 )
+    cc, cs, sc, ss = ci * ck, ci * sk, si * ck, si * sk
+
+    q = [ 0.0, 0.0, 0.0, 0.0 ]
     if repitition:
         q[0] = cj * ( cc - ss )
         q[i] = cj * ( cs + sc )
@@ -319,9 +596,10 @@ def from_euler( angles, axes = 'sxyz' ):
         q[i] = cj * sc - sj * cs
         q[j] = cj * ss + sj * cc
         q[k] = cj * cs - sj * sc
-    if parity: q[j] *= -1.0
+    if parity: q[j] = -q[j]
 
-    return normalize( q )
+    n = 1.0 / math.sqrt( q[0]*q[0] + q[1]*q[1] + q[2]*q[2] + q[3]*q[3] )
+    return np.array( ( q[0]*n, q[1]*n, q[2]*n, q[3]*n ) )
     
 def to_matrix( q ):
     """
@@ -329,28 +607,37 @@ def to_matrix( q ):
 
     Parameters
     ----------
-    q : numpy.ndarray (4,)
-        The quaternion to convert
+    q : numpy.ndarray (4,) or (..., 4)
+        The quaternion(s) to convert
     
     Returns
     -------
-    numpy.ndarray (3, 3)
+    numpy.ndarray (3, 3) or (..., 3, 3)
         The rotation matrix
     """
+    q = np.asarray( q, dtype = float )
+    if q.ndim == 1:
+        w, x, y, z = q.tolist()
+        n = 1.0 / math.sqrt( w*w + x*x + y*y + z*z )
+        w, x, y, z = w*n, x*n, y*n, z*n
+        return np.array( ( ( w*w + x*x - y*y - z*z, 2 * ( x*y - w*z ),     2 * ( w*y + x*z ) ),
+                           ( 2 * ( x*y + w*z ),     w*w - x*x + y*y - z*z, 2 * ( y*z - w*x ) ),
+                           ( 2 * ( x*z - w*y ),     2 * ( w*x + y*z ),     w*w - x*x - y*y + z*z ) ) )
     q = normalize( q )
-    R = np.zeros( (3, 3), dtype = np.float )
+    w, x, y, z = q[...,0], q[...,1], q[...,2], q[...,3]
+    R = np.empty( q.shape[:-1] + ( 3, 3 ), dtype = float )
     
-    R[0,0] = q[0]*q[0] + q[1]*q[1] - q[2]*q[2] - q[3]*q[3]
-    R[0,1] = 2 * ( q[1]*q[2] - q[0]*q[3] )
-    R[0,2] = 2 * ( q[0]*q[2] + q[1]*q[3] )
+    R[...,0,0] = w*w + x*x - y*y - z*z
+    R[...,0,1] = 2 * ( x*y - w*z )
+    R[...,0,2] = 2 * ( w*y + x*z )
 
-    R[1,0] = 2 * ( q[1]*q[2] + q[0]*q[3] )
-    R[1,1] = q[0]*q[0] - q[1]*q[1] + q[2]*q[2] - q[3]*q[3]
-    R[1,2] = 2 * ( q[2]*q[3] - q[0]*q[1] )
+    R[...,1,0] = 2 * ( x*y + w*z )
+    R[...,1,1] = w*w - x*x + y*y - z*z
+    R[...,1,2] = 2 * ( y*z - w*x )
 
-    R[2,0] = 2 * ( q[1]*q[3] - q[0]*q[2] )
-    R[2,1] = 2 * ( q[0]*q[1] + q[2]*q[3] )
-    R[2,2] = q[0]*q[0] - q[1]*q[1] - q[2]*q[2] + q[3]*q[3]
+    R[...,2,0] = 2 * ( x*z - w*y )
+    R[...,2,1] = 2 * ( w*x + y*z )
+    R[...,2,2] = w*w - x*x - y*y + z*z
 
     return R
 
@@ -360,23 +647,24 @@ def from_matrix( R ):
     
     Parameters
     ----------
-    R : numpy.ndarray (3, 3)
+    R : numpy.ndarray (3, 3) or (..., 3, 3)
         The rotation matrix
     
     Returns
     -------
-    numpy.ndarray (4,)
+    numpy.ndarray (4,) or (..., 4)
         The quaternion
     """
-    assert( R.shape == (3,3) )
-    assert( np.abs( la.det(R) - 1 ) < 1e-6 )
-    assert( np.allclose( np.dot( R.T, R ), np.eye(3) ) )
+    R = np.asarray( R, dtype = float )
+    assert( R.shape[-2:] == (3,3) )
+    assert( np.all( np.abs( la.det(R) - 1 ) < 1e-6 ) )
+    assert( np.allclose( np.matmul( np.swapaxes( R, -1, -2 ), R ), np.eye(3) ) )
     
-    q = np.zeros( 4 , dtype = np.float )
-    q[0] = 0.5 * np.sqrt( 1 + R[0,0] + R[1,1] + R[2,2] )
-    q[1] = ( 1 / ( 4 * q[0] ) ) * ( R[2,1] - R[1,2] )
-    q[2] = ( 1 / ( 4 * q[0] ) ) * ( R[0,2] - R[2,0] )
-    q[3] = ( 1 / ( 4 * q[0] ) ) * ( R[1,0] - R[0,1] )
+    q = np.zeros( R.shape[:-2] + ( 4, ), dtype = float )
+    q[...,0] = 0.5 * np.sqrt( 1 + R[...,0,0] + R[...,1,1] + R[...,2,2] )
+    q[...,1] = ( 1 / ( 4 * q[...,0] ) ) * ( R[...,2,1] - R[...,1,2] )
+    q[...,2] = ( 1 / ( 4 * q[...,0] ) ) * ( R[...,0,2] - R[...,2,0] )
+    q[...,3] = ( 1 / ( 4 * q[...,0] ) ) * ( R[...,1,0] - R[...,0,1] )
 
     return normalize( q )
 
@@ -420,7 +708,7 @@ def from_axis_angle( theta, axis ):
     numpy.ndarray
         The quaternion (4,)
     """
-    q = np.zeros( 4, dtype = np.float )
+    q = np.zeros( 4, dtype = float )
     q[0] = np.cos( 0.5 * theta )
     q[1:] = np.sin( 0.5 * theta ) * axis
     return normalize( q )
@@ -468,7 +756,7 @@ def between_vectors(v1,v2):
         q =  np.asarray([1,0,0,0])
     #TODO: allow for 180 deg rotations
     else:
-        q = np.zeros( 4 , dtype = np.float )
+        q = np.zeros( 4 , dtype = float )
         
         theta = math.acos(d)/(np.linalg.norm(v1)*np.linalg.norm(v2))
         a = np.cross(v1,v2)
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+import SessionRecorder
+import TrackerCodec
+
+from IBTSimulator import IBTStandIn
+from Positional import Positional
+from TASKASimulator import SimulatedSerial
+from WristController import WristController
+
+class CommandDigest():
+    """ Recorder sink that hashes the packets commanded to each device (TASKA hand and wrist) """
+    def __init__( self ):
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self.commands = {}
+
+    @property
+    def digests( self ):
+        """
+        Returns
+        -------
+        dict
+            Device ID -> hex SHA-256 of every command packet sent to it, in order
+        """
+        with self._lock: return { device : h.hexdigest() for device, h in self._hashes.items() }
+
+    @property
+    def digest( self ):
+        """
+        Returns
+        -------
+        str
+            Hex SHA-256 over the per-device digests in device ID order, covering the hand and wrist
+            commands without depending on how the two devices' writes interleaved
+        """
+        combined = hashlib.sha256()
+        with self._lock:
+            for device in sorted( self._hashes ):
+                combined.update( bytes( ( device, ) ) + self._hashes[ device ].digest() )
+        return combined.hexdigest()
+
+    def record_pose( self, tracker, calibrator, euler = None, t = None ):
+        pass
+
+    def record_packet( self, kind, device, data, t = None ):
+        if kind != SessionRecorder.COMMAND: return
+        with self._lock:
+            if device not in self._hashes:
+                self._hashes[ device ] = hashlib.sha256()
+                self.commands[ device ] = 0
+            self._hashes[ device ].update( bytes( data ) )
+            self.commands[ device ] += 1
+
+def replay( records, hand, speed = None, double = True ):
+    """
+    Feed the recorded tracker stream through the server pipeline
+
+    Parameters
+    ----------
+    records : numpy.ndarray of SessionRecorder.RECORD
+        A recorded session (only POSE records are replayed)
+    hand : Positional
+        The hand and wrist to drive (typically on the simulated devices)
+    speed : float
+        1.0 for the original timing, N for N times faster, None or 0 for as fast as possible
+    double : bool
+        True to encode the poses as float64 (bit-exact), False for the float32 wire format
+
+    Returns
+    -------
+    dict
+        The number of samples, the wall time (in seconds) and the pipeline throughput (samples per second)
+
+    Notes
+    -----
+    Each pose is encoded and decoded with TrackerCodec, then passed to Positional.track_wrist with its recorded
+    timestamp as the controller clock, so the commands sent do not depend on the replay speed.
+    """
+    poses = records[ records[ 'kind' ] == SessionRecorder.POSE ]
+    if not len( poses ): return { 'samples' : 0, 'elapsed' : 0.0, 'rate' : 0.0 }
+    t0 = poses[ 't' ][0]
+    start = time.perf_counter()
+    for seq, rec in enumerate( poses ):
+        if speed:
+            delay = start + ( rec[ 't' ] - t0 ) / speed - time.perf_counter()
+            if delay > 0: time.sleep( delay )
+        sample = TrackerCodec.decode( TrackerCodec.encode( rec[ 'quat' ][0:4], rec[ 'quat' ][4:8], seq = seq,
+                                                          stamp = rec[ 't' ], double = double ) )
+        hand.track_wrist( sample.tracker, sample.calibrator, now = sample.stamp )
+    elapsed = time.perf_counter() - start
+    return { 'samples' : len( poses ), 'elapsed' : elapsed, 'rate' : len( poses ) / elapsed if elapsed > 0 else float( 'inf' ) }
+
+def simulated_hand( controller = None, recorder = None ):
+    """
+    Parameters
+    ----------
+    controller : WristController
+        The wrist controller under test (defaults if None)
+    recorder : SessionRecorder or CommandDigest
+        Receives every command sent to the simulated devices
+
+    Returns
+    -------
+    Positional
+        A hand on a simulated TASKA and a local IBT stand-in
+    IBTStandIn
+        The wrist stand-in (close it when done)
+    """
+    standin = IBTStandIn()
+    hand = Positional( com = SimulatedSerial(), macA = standin.address, supervised = False, parallel = False,
+                       recorder = recorder )
+    if controller is not None: hand.WristController = controller
+    return hand, standin
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser( description = 'Replay a recorded session against the simulated devices' )
+    parser.add_argument( 'session', help = 'session file written by SessionRecorder' )
+    parser.add_argument( '--speed', type = float, default = 0.0, help = '1 for real time, N for N times faster, 0 for as fast as possible' )
+    parser.add_argument( '--target', type = float, default = 0.0 )
+    parser.add_argument( '--deadband', type = float, default = 0.05 )
+    parser.add_argument( '--hysteresis', type = float, default = 0.03 )
+    parser.add_argument( '--min_dwell', type = float, default = 0.2 )
+    parser.add_argument( '--expect', default = None, help = 'expected hand and wrist command digest (exit with 1 on mismatch)' )
+    args = parser.parse_args()
+
+    records = SessionRecorder.load( args.session )
+    digest = CommandDigest()
+    controller = WristController( target = args.target, deadband = args.deadband,
+                                  hysteresis = args.hysteresis, min_dwell = args.min_dwell )
+    hand, standin = simulated_hand( controller, digest )
+    try:
+        result = replay( records, hand, speed = args.speed )
+    finally:
+        hand.close()
+        standin.close()
+
+    print( '%d samples in %.3f s (%.0f samples/s)' % ( result[ 'samples' ], result[ 'elapsed' ], result[ 'rate' ] ) )
+    print( 'hand commands: %d  wrist commands: %d  transitions: %s' % ( digest.commands.get( SessionRecorder.TASKA, 0 ),
+                                                                       digest.commands.get( SessionRecorder.WRIST, 0 ),
+                                                                       controller.stats ) )
+    print( 'command digest:', digest.digest )
+    if args.expect is not None and args.expect != digest.digest:
+        print( 'MISMATCH, expected', args.expect )
+        raise SystemExit( 1 )
@@ -0,0 +1,275 @@
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import LatencyTracer
+import SessionRecorder
+
+class SerialTransport():
+    """ Pipelined transport for TASKA serial packets with a background acknowledgement reader """
+    ACK_START = 64      # every response packet starts with '@'
+    MIN_PACKET = 5      # [ 64, OPCODE, ID, LENGTH, CHKSUM ]
+    MAX_PACKET = 64
+    SLACK = 1.0         # extra time (in seconds) a blocking wait allows the reader to expire a command
+
+    def __init__( self, ser, timeout = 0.5, verify = True, recorder = None ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        ser : serial.Serial
+            An open serial port (its read timeout bounds how long the reader thread blocks)
+        timeout : float
+            The time (in seconds) to wait for an acknowledgement before giving up on it
+        verify : bool
+            True to discard response packets with a bad checksum
+        recorder : SessionRecorder
+            Records every packet written and every valid response packet read (None to not record)
+
+        Returns
+        -------
+        obj
+            A SerialTransport object with its reader thread running
+
+        Notes
+        -----
+        Response packets are framed as [ 64, OPCODE, ID, LENGTH, ..., CHKSUM ] where LENGTH is the total
+        packet size. The reader thread parses them as they arrive and resolves the oldest outstanding
+        command with the same opcode, so commands can be fired back to back without waiting on the link.
+        If the port fails, the reader fails every outstanding command with a ConnectionError and later
+        sends raise one.
+        """
+        self._ser = ser
+        self._timeout = timeout
+        self._verify = verify
+        self._recorder = recorder
+
+        self._pending = {}                      # opcode -> deque of [ future, deadline, responses, packets ]
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._buffer = bytearray()
+
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.bad_checksum = 0
+        self.unmatched = 0
+
+        self._running = True
+        self._error = None                      # set once the reader has stopped, new sends raise it
+        self._reader = threading.Thread( target = self._read_loop, daemon = True )
+        self._reader.start()
+
+    @staticmethod
+    def checksum( array ):
+        return sum( array ) & 0xFF
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of sent packets, matched acknowledgements, timed out commands,
+            corrupt response packets and responses that matched no outstanding command
+        """
+        return { 'sent' : self.sent, 'acked' : self.acked, 'timeouts' : self.timeouts,
+                 'bad_checksum' : self.bad_checksum, 'unmatched' : self.unmatched }
+
+    @property
+    def alive( self ):
+        """
+        Returns
+        -------
+        bool
+            True while the reader thread is running, False once the transport is closed or the port failed
+        """
+        return self._reader.is_alive()
+
+    @property
+    def in_flight( self ):
+        """
+        Returns
+        -------
+        int
+            The number of commands still waiting on an acknowledgement
+        """
+        with self._lock:
+            return sum( len( queue ) for queue in self._pending.values() )
+
+    def send( self, pkt, opcode = None, responses = 1, wait = False, timeout = None ):
+        """
+        Write a packet without waiting for the link round trip
+
+        Parameters
+        ----------
+        pkt : bytes-like
+            The complete packet (including checksum)
+        opcode : int
+            The opcode of the expected response packet(s) (None if no response is expected)
+        responses : int
+            The number of response packets the command produces
+        wait : bool
+            True to block until the response arrives or the command times out
+        timeout : float
+            Overrides the transport acknowledgement timeout for this command
+
+        Returns
+        -------
+        concurrent.futures.Future or bytes or list or None
+            If wait is False, a future resolved with the response packet (a list of packets if responses > 1),
+            or with None if no response arrived in time.
+            If wait is True, the resolved value itself (None if nothing arrived within the timeout).
+
+        Raises
+        ------
+        ConnectionError
+            The transport is closed or its port failed
+        """
+        future = Future()
+        deadline = time.monotonic() + ( self._timeout if timeout is None else timeout )
+        with self._lock:
+            if self._error is not None: raise self._error
+            if opcode is not None: self._pending.setdefault( opcode, deque() ).append( [ future, deadline, responses, [] ] )
+
+        with self._write_lock:
+            self._ser.write( pkt )
+            self.sent += 1
+        tracer = LatencyTracer.active
+        if tracer is not None: tracer.stamp( 'write' )
+        if self._recorder is not None: self._recorder.record_packet( SessionRecorder.COMMAND, SessionRecorder.TASKA, pkt )
+
+        if opcode is None: future.set_result( None )
+        if wait: return self.result( future, timeout )
+        return future
+
+    def result( self, future, timeout = None ):
+        """
+        Wait for a command future, never for longer than its acknowledgement timeout plus SLACK
+
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            A future returned by send()
+        timeout : float
+            The acknowledgement timeout the command was sent with (the transport timeout if None)
+
+        Returns
+        -------
+        bytes or list or None
+            The response packet(s), or None if no response arrived in time
+
+        Raises
+        ------
+        ConnectionError
+            The port failed before the response arrived
+        """
+        try:
+            return future.result( timeout = ( self._timeout if timeout is None else timeout ) + SerialTransport.SLACK )
+        except FutureTimeout:
+            return None
+
+    def close( self ):
+        """
+        Stop the reader thread and release every outstanding command
+        """
+        self._running = False
+        if self._reader is not threading.current_thread(): self._reader.join( timeout = 2 * self._timeout + 1.0 )
+        self._release( ConnectionError( 'Serial transport is closed' ), None )
+
+    def _release( self, error, exception ):
+        """
+        Reject new sends with error and resolve every outstanding command (with None, or failed with exception)
+        """
+        with self._lock:
+            if self._error is None: self._error = error
+            entries = [ entry for queue in self._pending.values() for entry in queue ]
+            self._pending.clear()
+        for entry in entries:
+            if exception is None: entry[0].set_result( None )
+            else: entry[0].set_exception( exception )
+
+    def _read_loop( self ):
+        """
+        Background thread that reads, frames and dispatches response packets
+        """
+        while self._running:
+            try:
+                data = self._ser.read( max( 1, self._ser.in_waiting ) )
+            except Exception as e:
+                # port closed underneath us, nothing can be acknowledged any more
+                error = ConnectionError( 'Serial port failed: %s' % e )
+                self._release( error, error )
+                return
+            if data:
+                self._buffer.extend( data )
+                self._parse()
+            self._expire()
+
+    def _parse( self ):
+        """
+        Extract every complete response packet from the receive buffer
+        """
+        buf = self._buffer
+        while True:
+            start = buf.find( SerialTransport.ACK_START )
+            if start < 0:
+                buf.clear()
+                return
+            if start: del buf[:start]
+            if len( buf ) < 4: return
+
+            length = buf[3]
+            if length < SerialTransport.MIN_PACKET or length > SerialTransport.MAX_PACKET:
+                del buf[0]                                  # not a real start byte, resynchronize
+                continue
+            if len( buf ) < length: return
+
+            pkt = bytes( buf[:length] )
+            if self._verify and SerialTransport.checksum( pkt[:-1] ) != pkt[-1]:
+                self.bad_checksum += 1
+                del buf[0]
+                continue
+            del buf[:length]
+            if self._recorder is not None: self._recorder.record_packet( SessionRecorder.ACK, SessionRecorder.TASKA, pkt )
+            self._dispatch( pkt )
+
+    def _dispatch( self, pkt ):
+        """
+        Hand a response packet to the oldest outstanding command with a matching opcode
+
+        Parameters
+        ----------
+        pkt : bytes
+            The response packet
+        """
+        with self._lock:
+            queue = self._pending.get( pkt[1] )
+            if not queue:
+                self.unmatched += 1
+                return
+            entry = queue[0]
+            entry[3].append( pkt )
+            if len( entry[3] ) < entry[2]: return
+            queue.popleft()
+        self.acked += 1
+        tracer = LatencyTracer.active
+        if tracer is not None: tracer.stamp( 'ack' )
+        entry[0].set_result( entry[3][0] if entry[2] == 1 else entry[3] )
+
+    def _expire( self ):
+        """
+        Give up on commands whose acknowledgement is overdue
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for queue in self._pending.values():
+                while queue and queue[0][1] < now:
+                    expired.append( queue.popleft() )
+        for entry in expired:
+            self.timeouts += 1
+            entry[0].set_result( None )
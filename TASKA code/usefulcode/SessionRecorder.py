@@ -0,0 +1,250 @@
+import json
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+# record kinds
+POSE = 1            # tracker / calibrator quaternions and the computed euler angles
+COMMAND = 2         # packet written to a device
+ACK = 3             # response packet read from a device
+
+# devices
+NO_DEVICE = 0
+TASKA = 1
+WRIST = 2
+BEBIONIC = 3
+
+MAX_DATA = 48       # packet bytes stored per record, longer packets are truncated (size keeps the full length)
+
+RECORD = np.dtype( [ ( 't', '<f8' ),                # time.monotonic() stamp
+                     ( 'kind', 'u1' ),
+                     ( 'device', 'u1' ),
+                     ( 'size', '<u2' ),             # packet length
+                     ( 'quat', '<f8', ( 8, ) ),     # tracker [0:4], calibrator [4:8]
+                     ( 'euler', '<f8', ( 3, ) ),    # relative euler angles (nan if not computed)
+                     ( 'data', 'u1', ( MAX_DATA, ) ) ] )
+
+MAGIC = b'TSR1'
+_HEADER = struct.Struct( '<4sI' )   # magic, length of the JSON dtype description that follows
+
+class SessionRecorder():
+    """ Append-only binary recorder for tracker input and device traffic """
+    def __init__( self, path, chunk_size = 4096, pool = 4 ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path : str
+            The file to append the session to (created with its header if it does not exist)
+        chunk_size : int
+            The number of records per preallocated chunk
+        pool : int
+            The number of chunks allocated up front
+
+        Returns
+        -------
+        obj
+            A SessionRecorder object with its writer thread running
+
+        Notes
+        -----
+        Records are written in place into a preallocated chunk under a short lock. Full chunks are handed to
+        the writer thread and replaced from the pool, so recording never waits on the disk. If the writer
+        falls behind and the pool runs dry a new chunk is allocated (counted in stats) instead of blocking.
+        """
+        self._file = open( path, 'ab' )
+        if self._file.tell() == 0:
+            descr = json.dumps( RECORD.descr ).encode( 'utf-8' )
+            self._file.write( _HEADER.pack( MAGIC, len( descr ) ) + descr )
+        self.path = path
+        self._chunk_size = chunk_size
+
+        self._pool = queue.SimpleQueue()
+        for _ in range( pool ): self._pool.put( np.zeros( chunk_size, dtype = RECORD ) )
+        self._full = queue.SimpleQueue()        # ( chunk, count ) waiting to be written, None to stop
+        self._lock = threading.Lock()
+        self._use( self._pool.get() )
+
+        self.records = 0
+        self.written = 0
+        self.allocated = 0
+
+        self._closed = False
+        self._writer = threading.Thread( target = self._write_loop, daemon = True )
+        self._writer.start()
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of recorded and written records and of chunks allocated because the writer fell behind
+        """
+        return { 'records' : self.records, 'written' : self.written, 'allocated' : self.allocated }
+
+    def record_pose( self, tracker, calibrator, euler = None, t = None ):
+        """
+        Parameters
+        ----------
+        tracker : iterable of floats (4,)
+            The tracker orientation quaternion
+        calibrator : iterable of floats (4,)
+            The calibrator orientation quaternion
+        euler : iterable of floats (3,)
+            The relative euler angles computed from them (None if not computed)
+        t : float
+            The time.monotonic() stamp (now if None)
+        """
+        if t is None: t = time.monotonic()
+        with self._lock:
+            i = self._next()
+            self._t[ i ] = t
+            self._kind[ i ] = POSE
+            self._device[ i ] = NO_DEVICE
+            self._size[ i ] = 0
+            self._quat[ i, 0:4 ] = tracker
+            self._quat[ i, 4:8 ] = calibrator
+            self._euler[ i ] = np.nan if euler is None else euler
+
+    def record_packet( self, kind, device, data, t = None ):
+        """
+        Parameters
+        ----------
+        kind : int
+            COMMAND for packets written to the device, ACK for responses
+        device : int
+            The device ID (TASKA, WRIST or BEBIONIC)
+        data : bytes-like
+            The packet
+        t : float
+            The time.monotonic() stamp (now if None)
+        """
+        if t is None: t = time.monotonic()
+        size = len( data )
+        n = min( size, MAX_DATA )
+        with self._lock:
+            i = self._next()
+            self._t[ i ] = t
+            self._kind[ i ] = kind
+            self._device[ i ] = device
+            self._size[ i ] = size
+            self._data[ i, :n ] = np.frombuffer( data, dtype = np.uint8, count = n )
+
+    def flush( self ):
+        """
+        Hand the partly filled chunk to the writer thread
+        """
+        with self._lock:
+            if self._index: self._swap()
+
+    def close( self ):
+        """
+        Write every remaining record and close the file
+        """
+        if self._closed: return
+        self._closed = True
+        self.flush()
+        self._full.put( None )
+        self._writer.join()
+        self._file.close()
+
+    def __del__( self ):
+        try: self.close()
+        except AttributeError: pass
+
+    def _use( self, chunk ):
+        """
+        Make chunk the one being filled, with a view per field so records are written without building numpy.void rows
+        """
+        self._chunk = chunk
+        self._index = 0
+        self._t, self._kind, self._device = chunk[ 't' ], chunk[ 'kind' ], chunk[ 'device' ]
+        self._size, self._quat, self._euler, self._data = chunk[ 'size' ], chunk[ 'quat' ], chunk[ 'euler' ], chunk[ 'data' ]
+
+    def _next( self ):
+        """
+        Returns
+        -------
+        int
+            The index of the next free record in the current chunk (lock held)
+        """
+        if self._index == self._chunk_size: self._swap()
+        i = self._index
+        self._index += 1
+        self.records += 1
+        return i
+
+    def _swap( self ):
+        """
+        Queue the current chunk for writing and take a fresh one from the pool (lock held)
+        """
+        self._full.put( ( self._chunk, self._index ) )
+        try:
+            self._use( self._pool.get_nowait() )
+        except queue.Empty:
+            self._use( np.zeros( self._chunk_size, dtype = RECORD ) )
+            self.allocated += 1
+
+    def _write_loop( self ):
+        """
+        Background thread that appends full chunks to the file and returns them to the pool
+        """
+        while True:
+            item = self._full.get()
+            if item is None: break
+            chunk, count = item
+            self._file.write( memoryview( chunk[ :count ] ).cast( 'B' ) )
+            self._file.flush()
+            self.written += count
+            chunk.view( np.uint8 )[:] = 0       # records only set their own fields, so recycle chunks cleared
+            self._pool.put( chunk )
+
+def load( path ):
+    """
+    Read a recorded session
+
+    Parameters
+    ----------
+    path : str
+        The session file
+
+    Returns
+    -------
+    numpy.ndarray of RECORD
+        Every record in the order they were recorded
+
+    Raises
+    ------
+    ValueError
+        The file is not a session recording
+    """
+    with open( path, 'rb' ) as f:
+        magic, size = _HEADER.unpack( f.read( _HEADER.size ) )
+        if magic != MAGIC: raise ValueError( 'Not a session recording: %s' % path )
+        dtype = np.dtype( [ tuple( field ) for field in json.loads( f.read( size ) ) ] )
+        return np.fromfile( f, dtype = dtype )
+
+def packets( records, kind = COMMAND, device = None ):
+    """
+    Parameters
+    ----------
+    records : numpy.ndarray of RECORD
+        Records returned by load()
+    kind : int
+        The packet kind to select (COMMAND or ACK)
+    device : int
+        Only select packets of this device (all if None)
+
+    Returns
+    -------
+    list of bytes
+        The packets (truncated to MAX_DATA bytes)
+    """
+    mask = records[ 'kind' ] == kind
+    if device is not None: mask &= records[ 'device' ] == device
+    return [ bytes( rec[ 'data' ][ : min( rec[ 'size' ], MAX_DATA ) ] ) for rec in records[ mask ] ]
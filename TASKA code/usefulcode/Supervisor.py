@@ -0,0 +1,269 @@
+import threading
+import time
+
+import Handshake
+
+class SupervisedDevice():
+    """ Connection manager that keeps a wireless device driver (TASKA, ActiveWrist) connected """
+    def __init__( self, factory, name = None, health = None, check_period = 0.5,
+                  backoff = 0.1, max_backoff = 5.0, connect = True ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        factory : callable
+            Creates a new, connected driver object (e.g. lambda: TASKA( com = 'COM3' ))
+        name : str
+            The device name used in stats and error messages
+        health : callable
+            Called as health( driver ) and returns False once the link is lost
+            (if None, the driver's healthy property is used when it has one)
+        check_period : float
+            The time (in seconds) between health checks
+        backoff : float
+            The delay (in seconds) before the second reconnect attempt, doubled after each failure
+        max_backoff : float
+            The maximum delay (in seconds) between reconnect attempts
+        connect : bool
+            True to connect before returning (errors are raised), False to connect in the background
+
+        Returns
+        -------
+        obj
+            A SupervisedDevice object with its supervisor thread running
+
+        Notes
+        -----
+        publish() calls are forwarded to the driver. A call that fails with a link error (OSError) or a
+        failed health check marks the device as down; the supervisor thread then recreates the driver with
+        exponential backoff and replays the last published command, so the device returns to the commanded
+        state. Reconnects repeat the full handshake (see Handshake.forget), as the device may have lost its
+        configuration. Publishes made during an outage are not sent, but the latest one is the one replayed.
+        The state lock is never held across driver I/O: publishes are serialized by their own lock, and drivers
+        are connected, replayed and closed outside both, so stats and health checks never wait on a stalled link.
+        """
+        self._factory = factory
+        self.name = name if name is not None else getattr( factory, '__name__', 'device' )
+        self._health = health
+        self._check_period = check_period
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+        self._lock = threading.RLock()
+        self._wake = threading.Condition( self._lock )
+        self._publish_lock = threading.Lock()   # keeps publishes to the driver in call order
+        self._device = None
+        self._last = None                       # ( args, kwargs ) of the last publish
+        self._down_since = time.monotonic()
+
+        self.outages = 0
+        self.attempts = 0
+        self.dropped = 0
+        self.recoveries = []                    # time-to-recover (in seconds) of each outage
+        self.last_error = None
+
+        if connect:
+            self._device = factory()
+            self._down_since = None
+
+        self._running = True
+        self._thread = threading.Thread( target = self._supervise, daemon = True )
+        self._thread.start()
+
+    def __getattr__( self, name ):
+        """
+        Forward any other attribute to the connected driver
+
+        Raises
+        ------
+        ConnectionError
+            The device is currently disconnected
+        """
+        if name.startswith( '_' ): raise AttributeError( name )
+        device = self._device
+        if device is None: raise ConnectionError( '%s is disconnected' % self.name )
+        return getattr( device, name )
+
+    @property
+    def connected( self ):
+        """
+        Returns
+        -------
+        bool
+            True if a driver is connected, False during an outage
+        """
+        return self._device is not None
+
+    @property
+    def device( self ):
+        """
+        Returns
+        -------
+        obj or None
+            The current driver object (None during an outage)
+        """
+        return self._device
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of outages, reconnect attempts and publishes dropped during outages,
+            and the last / mean / max time-to-recover (in seconds)
+        """
+        with self._lock:
+            recoveries = list( self.recoveries )
+            return { 'connected' : self._device is not None, 'outages' : self.outages,
+                     'attempts' : self.attempts, 'dropped' : self.dropped,
+                     'last_recovery' : recoveries[-1] if recoveries else None,
+                     'mean_recovery' : sum( recoveries ) / len( recoveries ) if recoveries else None,
+                     'max_recovery' : max( recoveries ) if recoveries else None }
+
+    def publish( self, *args, **kwargs ):
+        """
+        Publish a command to the driver (same arguments as the driver's publish)
+
+        Returns
+        -------
+        bool
+            True if the command was passed to the driver, False if the device is down (it is replayed on reconnect)
+        """
+        with self._lock:
+            self._last = ( args, kwargs )
+            device = self._device
+            if device is None:
+                self.dropped += 1
+                return False
+        with self._publish_lock:
+            if self._device is not device:
+                # the link went down while an earlier publish held the driver
+                with self._lock: self.dropped += 1
+                return False
+            try:
+                device.publish( *args, **kwargs )
+            except OSError as e:
+                self._mark_down( device, e )
+                return False
+        return True
+
+    def wait_connected( self, timeout = None ):
+        """
+        Returns
+        -------
+        bool
+            True once the device is connected, False on timeout
+        """
+        with self._wake:
+            return self._wake.wait_for( lambda: self._device is not None or not self._running, timeout ) \
+                   and self._device is not None
+
+    def close( self ):
+        """
+        Stop supervising and release the driver
+        """
+        with self._wake:
+            self._running = False
+            device, self._device = self._device, None
+            self._wake.notify_all()
+        if device is not None: self._release( device )
+        if self._thread is not threading.current_thread(): self._thread.join()
+
+    def _mark_down( self, device, error ):
+        """
+        Drop a driver whose link failed, wake the supervisor and close the driver (lock not held)
+        """
+        with self._wake:
+            if self._device is not device: return
+            self._device = None
+            self._down_since = time.monotonic()
+            self.outages += 1
+            self.last_error = error
+            self._wake.notify_all()
+        self._release( device )
+
+    @staticmethod
+    def _release( device ):
+        """
+        Close a driver so its port can be reopened (drivers without close() are released on deletion)
+        """
+        close = getattr( device, 'close', None )
+        if close is None: return
+        try: close()
+        except Exception: pass
+
+    def _healthy( self, device ):
+        """
+        Run the health check on a driver, any error counts as unhealthy
+        """
+        try:
+            if self._health is not None: return self._health( device )
+            return getattr( device, 'healthy', True )
+        except Exception:
+            return False
+
+    def _supervise( self ):
+        """
+        Background thread that health checks the driver and reconnects with exponential backoff
+        """
+        delay = 0.0
+        while True:
+            with self._wake:
+                if self._device is not None:
+                    delay = 0.0
+                    self._wake.wait( self._check_period )
+                elif delay:
+                    self._wake.wait( delay )
+                if not self._running: return
+                device = self._device
+
+            if device is not None:
+                if not self._healthy( device ):
+                    self._mark_down( device, None )
+                continue
+
+            # reconnect outside the lock so publishes keep returning immediately
+            with self._lock: self.attempts += 1
+            Handshake.forget()      # the link may have dropped because the device was power cycled
+            try:
+                device = self._factory()
+            except Exception as e:
+                with self._lock: self.last_error = e
+                delay = min( self._max_backoff, 2.0 * delay if delay else self._backoff )
+                continue
+
+            if not self._restore( device ):
+                self._release( device )
+                if not self._running: return
+                delay = min( self._max_backoff, 2.0 * delay if delay else self._backoff )
+
+    def _restore( self, device ):
+        """
+        Replay the last published command on a new driver and install it
+
+        Returns
+        -------
+        bool
+            True if the driver was installed, False if the replay failed or supervision stopped
+        """
+        replayed = None
+        while True:
+            with self._wake:
+                if not self._running: return False
+                last = self._last
+                if last is replayed:
+                    self._device = device
+                    if self.outages: self.recoveries.append( time.monotonic() - self._down_since )
+                    self._down_since = None
+                    self._wake.notify_all()
+                    return True
+
+            # a command published during the replay is replayed in turn before the driver goes live
+            try:
+                device.publish( *last[0], **last[1] )
+            except OSError as e:
+                with self._lock: self.last_error = e
+                return False
+            replayed = last
@@ -1,32 +1,80 @@
 import time
+import struct
 import serial
+import logging
 
 import numpy as np
 
 from serial import Serial
 
+from SerialTransport import SerialTransport
+from CommandCoalescer import CommandCoalescer
+from EncoderPoller import EncoderPoller
+from FingerMap import FingerMap
+
+import Handshake
+
+log = logging.getLogger( __name__ )
+
 # from . import AbstractBaseOutput
 
 class TASKA():
     """ Python implementation of a TASKA prosthetic hand driver using bluetooth """
     NUM_MOTORS = 6
+    ENCODER_READ_BYTES = 3 * 5 + 3 * ( 21 + 26 )    # request and response bytes on the wire per read_encoders()
+
+    # define grip and finger IDs
+    _grip_dict = { 'interim' : 0, 'relaxed' : 1, 'open' : 2, 'keyboard' : 3, 'dondoff' : 4,
+                   'pointer' : 5, 'key' : 6, 'opposition' : 7, 'handshake' : 8, 'tripod' : 9,
+                   'mug_close' : 10, 'pincer' : 11, 'tablet' : 12, 'flex' : 13, 'precision' : 14,
+                   'grab_go' : 15, 'mouse' : 16, 'active_index_1' : 17, 'active_index_2' : 18,
+                   'custom_1' : 19, 'custom_2' : 20, 'custom_3' : 21, 'custom_4' : 22, 'custom_5' : 23 }
+    _finger_dict = { 'index' : 0, 'middle' : 1, 'ring' : 2, 'pinky' : 3, 'thumb' : 4, 'rotator' : 5 }
+
+    # raw encoder order is [I2C 11 motor 1, I2C 11 motor 2, I2C 12 motor 1, ...]
+    _ENCODER_ORDER = [ 4, 3, 2, 1, 5, 0 ]
+
+    # finger group payload: 6 positions, 6 speeds, amps, padding, stall
+    _FINGER_GROUP_PAYLOAD = struct.Struct( '<6B6BBxB' )
 
     @staticmethod
     def checksum( array ):
-        chk = 0
-        for item in array: chk += item
-        return chk & 0xFF
+        return sum( array ) & 0xFF
+
+    @staticmethod
+    def _packet( body ):
+        """
+        Parameters
+        ----------
+        body : iterable of ints
+            The packet without its checksum
 
-    def __init__( self, com = 'COM3', mac = '68:0a:e2:74:67:62' ):
+        Returns
+        -------
+        bytes
+            The immutable packet with the checksum appended
+        """
+        body = bytes( body )
+        return body + bytes( [ TASKA.checksum( body ) ] )
+
+    def __init__( self, com = 'COM3', mac = '68:0a:e2:74:67:62', pipelined = True, coalesce = True, recorder = None ):
         """
         Constructor
 
         Parameters
         ----------
-        com : str
-            The named communication port for the connection (e.g. COM9 on Windows, /dev/ttyACM1 on linux)
+        com : str or serial-like object
+            The named communication port for the connection (e.g. COM9 on Windows, /dev/ttyACM1 on linux),
+            or an already open serial-like object (e.g. TASKASimulator.SimulatedSerial)
         mac : str
             The MAC address of the desired TASKA hand (if None, connect to first one found)
+        pipelined : bool
+            True to fire movement commands without waiting for their acknowledgement, False to wait for each one
+        coalesce : bool
+            True to queue movement commands behind a sender thread that merges superseded finger group and
+            grip proportion updates (implies pipelined), False to send every command as it is published
+        recorder : SessionRecorder
+            Records every packet sent to and received from the hand once connected (None to not record)
 
         Returns
         -------
@@ -39,52 +87,239 @@ class TASKA():
         #     self._bt = socket.socket( socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM )
         
         # self._bt.connect( ( mac, 1 ) )
-        self._ser = serial.Serial( port = com, baudrate = 4800, timeout = 0.5 )
+        if isinstance( com, str ): self._ser = serial.Serial( port = com, baudrate = 4800, timeout = 0.5 )
+        else: self._ser = com
+        self._owns_port = isinstance( com, str )
+        self._closed = False
         
         # self._ser.write( 'ats'.encode( 'utf-8' ) )
         # # time.sleep( 1 )
         # self._ser.write( 'ath'.encode( 'utf-8' ) )
 
-        cmd = 'atd'
-        if mac is not None: cmd += ' %s\r\n' % mac.upper()
-        else: cmd += '\r\n'
-        self._ser.write( cmd.encode( 'utf-8' ) )
-        # time.sleep( 2 )
-
-        resp = self._ser.read( size = 1000 ) # 31 )
-        print( resp )
-
-        # define grip and finger IDs
-        self._grip_dict = { 'interim' : 0, 'relaxed' : 1, 'open' : 2, 'keyboard' : 3, 'dondoff' : 4,
-                            'pointer' : 5, 'key' : 6, 'opposition' : 7, 'handshake' : 8, 'tripod' : 9,
-                            'mug_close' : 10, 'pincer' : 11, 'tablet' : 12, 'flex' : 13, 'precision' : 14,
-                            'grab_go' : 15, 'mouse' : 16, 'active_index_1' : 17, 'active_index_2' : 18,
-                            'custom_1' : 19, 'custom_2' : 20, 'custom_3' : 21, 'custom_4' : 22, 'custom_5' : 23 }
-        self._finger_dict = { 'index' : 0, 'middle' : 1, 'ring' : 2, 'pinky' : 3, 'thumb' : 4, 'rotator' : 5 }
-
         # keep track of movement
         self._last_move = None
+        self._poller = None
+        self._encoder_raw = np.zeros( TASKA.NUM_MOTORS, dtype = float )
 
-        # enable motor encoder access
-        for i2c in [ 11, 12, 13 ]:
-            for motor in [ 1, 2 ]:
-                pkt = [ 35, 77, i2c, 11, motor, 64, 0, 0, 10, 127 ]
-                pkt.append( TASKA.checksum( pkt ) )
-                pkt = bytes( pkt )
+        # finger proportions [0, 1] -> motor positions, publish( finger_map = ... ) maps other units
+        self.finger_map = FingerMap( lower = 0.0, upper = 1.0 )
 
-                self._ser.write( pkt )
-                resp = self._ser.read( size = 6 ) # expected response packet: [ 64, 77, I2C, 6, 11, CHKSUM ]
+        # static packets and reusable buffers for dynamic ones
+        self._build_packets()
+
+        # connect and enable motor encoder access (skipped if this hand is already configured)
+        self._connected, resp = Handshake.taska( self._ser, mac, self._encoder_enable_pkts )
+        log.info( 'connect response %r', resp )
+
+        # acknowledgements are parsed by a background reader from here on
+        self._pipelined = pipelined
+        self._transport = SerialTransport( self._ser, timeout = 0.5, recorder = recorder )
+        self._sender = CommandCoalescer( self._transport ) if coalesce else None
 
     def __del__(self):
+        self.close()
+
+    def close( self ):
+        """
+        Stop the background threads, disconnect the hand and release the serial port (if it was opened here)
+        """
+        if getattr( self, '_closed', True ): return
+        self._closed = True
         try:
-            pkt = [ 35, 82, 14, 5 ]
-            pkt.append( TASKA.checksum( pkt ) )
-            pkt = bytes( pkt )
-        
-            self._ser.write( pkt )
-        except AttributeError:
+            if self._poller is not None: self._poller.stop()
+            if self._sender is not None: self._sender.close()
+            self._transport.send( self._disconnect_pkt )
+        except (AttributeError, OSError):
+            # did not open the serial communication, or the port is already gone
+            pass
+        try:
+            self._transport.close()
+            if self._owns_port: self._ser.close()
+        except (AttributeError, OSError):
             pass
 
+    def _build_packets( self ):
+        """
+        Prebuild every static packet and the reusable buffers for the dynamic ones
+
+        Notes
+        -----
+        Dynamic packets are written in place into their bytearray and only the payload is added to the
+        precomputed header sum to get the checksum, so no per-command lists or bytes objects are created.
+        """
+        # static packets
+        self._grip_pkts = { grip : TASKA._packet( [ 35, 71, 2, 6, idx ] ) for grip, idx in self._grip_dict.items() }
+        self._encoder_enable_pkts = [ TASKA._packet( [ 35, 77, i2c, 11, motor, 64, 0, 0, 10, 127 ] )
+                                      for i2c in [ 11, 12, 13 ] for motor in [ 1, 2 ] ]
+        self._encoder_request_pkts = { i2c : TASKA._packet( [ 35, 109, i2c, 5 ] ) for i2c in [ 11, 12, 13 ] }
+        self._disconnect_pkt = TASKA._packet( [ 35, 82, 14, 5 ] )
+
+        # dynamic packet buffers: [ header..., payload..., CHKSUM ]
+        self._grip_pos_pkt = bytearray( [ 35, 71, 3, 6, 0, 0 ] )
+        self._grip_pos_sum = 35 + 71 + 3 + 6
+        self._finger_pkt = bytearray( [ 35, 70, 0, 10, 0, 0, 0, 0, 0, 0 ] )
+        self._finger_sum = 35 + 70 + 10
+        self._finger_group_pkt = bytearray( 20 )
+        self._finger_group_pkt[0:4] = bytes( [ 35, 70, 255, 20 ] )
+        self._finger_group_sum = 35 + 70 + 255 + 20
+        view = np.frombuffer( self._finger_group_pkt, dtype = np.uint8 )     # shares memory with the packet
+        self._finger_group_positions = view[4:10]
+        self._finger_group_speeds = view[10:16]
+
+    def _encode_grip_position( self, position ):
+        """
+        Parameters
+        ----------
+        position : int [0, 255]
+            The proportional value for the current grip
+
+        Returns
+        -------
+        bytearray
+            The packet buffer (overwritten by the next call)
+        """
+        pkt = self._grip_pos_pkt
+        pkt[4] = position
+        pkt[5] = ( self._grip_pos_sum + position ) & 0xFF
+        return pkt
+
+    def _encode_finger_single( self, finger, speed, position, amps, stall ):
+        """
+        Parameters
+        ----------
+        finger : int
+            Index of the finger motor
+        speed : int [0, 255]
+            The speed for the finger movement
+        position : int [0, 255]
+            The finger motor position
+        amps : int
+            The maximum current draw of a digit (10s of mA)
+        stall : int
+            The stall period (10s of ms)
+
+        Returns
+        -------
+        bytearray
+            The packet buffer (overwritten by the next call)
+        """
+        pkt = self._finger_pkt
+        pkt[2] = finger
+        pkt[4] = speed
+        pkt[5] = position
+        pkt[6] = amps
+        pkt[8] = stall
+        pkt[9] = ( self._finger_sum + finger + speed + position + amps + stall ) & 0xFF
+        return pkt
+
+    def _encode_finger_group( self, positions, speeds, amps, stall ):
+        """
+        Parameters
+        ----------
+        positions : iterable of ints (6,) [0, 255]
+            List of finger motor positions
+        speeds : iterable of ints (6,) [0, 255]
+            List of finger motor speeds
+        amps : int
+            The maximum current draw of a digit (10s of mA)
+        stall : int
+            The stall period (10s of ms)
+
+        Returns
+        -------
+        bytearray
+            The packet buffer (overwritten by the next call)
+
+        Raises
+        ------
+        struct.error
+            Positions or speeds do not hold one value in [0, 255] per motor
+        """
+        pkt = self._finger_group_pkt
+        TASKA._FINGER_GROUP_PAYLOAD.pack_into( pkt, 4, *positions, *speeds, amps, stall )
+        pkt[19] = ( self._finger_group_sum + sum( pkt[4:19] ) ) & 0xFF
+        return pkt
+
+    def _encode_finger_map( self, finger_map, values, speed, amps, stall ):
+        """
+        Parameters
+        ----------
+        finger_map : FingerMap
+            The calibrated mapping from finger values to motor positions
+        values : iterable of floats (6,)
+            The finger values in the units of the finger map
+        speed : float or iterable of floats (6,) [0, 1]
+            The speed of all fingers or of each finger
+        amps : int
+            The maximum current draw of a digit (10s of mA)
+        stall : int
+            The stall period (10s of ms)
+
+        Returns
+        -------
+        bytearray
+            The packet buffer (overwritten by the next call)
+
+        Notes
+        -----
+        Positions and speeds are written straight into the packet through a uint8 view of the buffer
+        """
+        finger_map.map( values, out = self._finger_group_positions )
+        finger_map.quantize( speed, out = self._finger_group_speeds )
+        pkt = self._finger_group_pkt
+        pkt[16] = amps
+        pkt[18] = stall
+        pkt[19] = ( self._finger_group_sum + sum( pkt[4:19] ) ) & 0xFF
+        return pkt
+
+    def _send( self, pkt, opcode, key = None ):
+        """
+        Parameters
+        ----------
+        pkt : bytes
+            The complete packet (including checksum)
+        opcode : int
+            The opcode of the expected response packet
+        key : str
+            Identifies commands where only the most recent pending one needs to be sent (None to always send)
+        """
+        # queued packets must not alias the reusable encode buffers
+        if self._sender is not None: self._sender.submit( bytes( pkt ), opcode, key )
+        else: self._transport.send( pkt, opcode = opcode, wait = not self._pipelined )
+
+    @property
+    def connected( self ):
+        """
+        Returns
+        -------
+        bool or None
+            True if the bluetooth module reported a connection, False if it reported a failure, None if it did not answer
+        """
+        return self._connected
+
+    @property
+    def healthy( self ):
+        """
+        Returns
+        -------
+        bool
+            True if the serial link is still up and no queued command has failed on it
+        """
+        if not self._transport.alive: return False
+        return self._sender is None or self._sender.errors == 0
+
+    @property
+    def link_stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Transport counters (sent, acked, timeouts, ...) and, if enabled, coalescing counters
+        """
+        stats = dict( self._transport.stats )
+        if self._sender is not None: stats[ 'coalescer' ] = self._sender.stats
+        return stats
+
     def _select_grip_pattern( self, grip ):
         """
         Parameters
@@ -96,12 +331,7 @@ class TASKA():
         -----
         The expected response packet: [ 64, 71, 2, 5, CHKSUM ]
         """
-        pkt = [ 35, 71, 2, 6, self._grip_dict[grip] ]
-        pkt.append( TASKA.checksum( pkt ) )
-        pkt = bytes( pkt )
-
-        self._ser.write( pkt )
-        resp = self._ser.read( size = 5 )
+        self._send( self._grip_pkts[grip], opcode = 71 )
 
     def _move_grip_pattern( self, position ):
         """
@@ -114,12 +344,8 @@ class TASKA():
         -----
         The expected response packet: [ 64, 71, 3, 5, CHKSUM ]
         """
-        pkt = [ 35, 71, 3, 6, position ]
-        pkt.append( TASKA.checksum( pkt ) )
-        pkt = bytes( pkt )
-
-        self._ser.write( pkt )
-        resp = self._ser.read( size = 5 )
+        pkt = self._encode_grip_position( position )
+        self._send( pkt, opcode = 71, key = 'grip_position' )
 
     def _move_finger_single( self, finger, speed, position, amps = 10, stall = 20 ):
         """
@@ -141,12 +367,8 @@ class TASKA():
         The expected response packet: [ 64, 70, FINGER_IDX, 5, CHKSUM ]
         Excessive stall time will potentially burn out the motors of the TASKA hand. Normal values are considered to be <500 ms
         """
-        pkt = [ 35, 70, self._finger_dict[finger], 10, speed, position, amps, 0, stall ]
-        pkt.append( TASKA.checksum( pkt ) )
-        pkt = bytes( pkt )
-
-        self._ser.write( pkt )
-        self._ser.read( size = 5 )
+        pkt = self._encode_finger_single( self._finger_dict[finger], speed, position, amps, stall )
+        self._send( pkt, opcode = 70 )
 
     def _move_finger_group( self, positions, speeds, amps = 20, stall = 20 ):
         #changed amps from 10 to 20 amps
@@ -168,25 +390,11 @@ class TASKA():
         Iterables should be in the following finger order: [Index, Middle, Ring, Little, Thumb, Rotator]
         Excessive stall time will potentially burn out the motors of the TASKA hand. Normal values are considered to be <500 ms
         """
-        pkt = [ 35, 70, 255, 20 ]
-        for pos in positions:
-            pkt.append( pos )
-        for spd in speeds:
-            pkt.append( spd )
-
-        # pkt.extend( positions )
-        # pkt.extend( speeds )
-        pkt.extend( [ amps, 0, stall ] )
-        pkt.append( TASKA.checksum( pkt ) )
-        pkt = bytes( pkt )
-
-        
-        print(pkt)
-
-        self._ser.write( pkt )
-        resp = self._ser.read( size = 5 )
+        pkt = self._encode_finger_group( positions, speeds, amps, stall )
+        if log.isEnabledFor( logging.DEBUG ): log.debug( 'finger group %s', bytes( pkt ) )
+        self._send( pkt, opcode = 70, key = 'finger_group' )
 
-    def publish( self, move = None, prop = 1.0, angles = None, speed = 1.0 ):
+    def publish( self, move = None, prop = 1.0, angles = None, speed = 1.0, finger_map = None ):
         """
         Parameters
         ----------
@@ -196,8 +404,10 @@ class TASKA():
             The proportion to actuate the desired grip where 0 is fully open, 1 is fully closed
         angles : iterable of floats (6,) [0, 1]
             The proportion to actuate each individual finger where 0 is fully open, 1 is fully closed
-        speed : iterable of floats (6,) [0,1]
+        speed : float or iterable of floats (6,) [0,1]
             The speed at which to actuate each individual finger where 0 is no movement, 1 is full speed
+        finger_map : FingerMap
+            Maps angles given in other units (e.g. degrees) to motor positions (None for proportions [0, 1])
 
         Notes
         -----
@@ -211,49 +421,106 @@ class TASKA():
             self._move_grip_pattern( round( 255 * prop ) )
         elif angles is not None:
             self._last_move = None
-            # set finger speeds appropriately
-            if isinstance( speed, float ):
-                speed = max( 0.0, min( 1.0, speed ) )
-                speeds = [ speed ] * TASKA.NUM_MOTORS
             # check to make sure dimensions are appropriate
-            if len( angles ) == TASKA.NUM_MOTORS and len( speeds ) == TASKA.NUM_MOTORS:
-                for i in range( TASKA.NUM_MOTORS ):
-                    angles[i] = max( 0.0, min( 1.0, angles[i] ) )
-                #need to add this to bring the range from 0 to 255 now
-                angles = [ int( 255 * x ) for x in angles ]
-                speeds = [ int( 255 * x ) for x in speeds ]
+            if len( angles ) == TASKA.NUM_MOTORS and np.size( speed ) in ( 1, TASKA.NUM_MOTORS ):
+                # clamp, scale and quantize straight into the finger group packet
+                if finger_map is None: finger_map = self.finger_map
+                pkt = self._encode_finger_map( finger_map, angles, speed, 20, 20 )
+                if log.isEnabledFor( logging.DEBUG ): log.debug( 'finger group %s', bytes( pkt ) )
+                self._send( pkt, opcode = 70, key = 'finger_group' )
+
+    def read_encoders( self, out = None ):
+        """
+        Read all six encoder positions in a single pipelined transaction
+
+        Parameters
+        ----------
+        out : numpy.ndarray (6,), optional
+            Preallocated buffer to write the positions into
+
+        Returns
+        -------
+        numpy.ndarray (6,)
+            The encoder positions for each motor
+
+        Raises
+        ------
+        RuntimeError
+            An I2C bus did not answer before the transport timeout, or answered with a short or invalid response
+        ConnectionError
+            The serial port failed
+
+        Notes
+        -----
+        The three bus requests are written back to back and their responses collected afterwards,
+        so the read costs one link round trip instead of three.
+        """
+        if out is None: out = np.empty( TASKA.NUM_MOTORS, dtype = float )
+        futures = [ self._transport.send( self._encoder_request_pkts[ i2c ], opcode = 109, responses = 2 )
+                    for i2c in [ 11, 12, 13 ] ]
+
+        raw = self._encoder_raw
+        for bus, future in enumerate( futures ):
+            # two response packets of 21 and 26 bytes per bus
+            resp = self._transport.result( future )
+            if resp is None: raise RuntimeError( 'No encoder response from I2C bus: ', 11 + bus )
+            recv_1, recv_2 = resp
+            if len( recv_1 ) < 15 or len( recv_2 ) < 15: raise RuntimeError( 'Short encoder response from I2C bus: ', 11 + bus )
+            if not ( recv_1[14] or recv_1[13] ) or not ( recv_2[14] or recv_2[13] ):
+                raise RuntimeError( 'Zero encoder range from I2C bus: ', 11 + bus )
 
-                self._move_finger_group( angles, speeds )
+            # extract position information
+            raw[ 2 * bus ] = ( 256 * recv_1[8] + recv_1[7] ) / ( 256 * recv_1[14] + recv_1[13] )
+            raw[ 2 * bus + 1 ] = ( 256 * recv_2[8] + recv_2[7] ) / ( 256 * recv_2[14] + recv_2[13] )
+        np.take( raw, TASKA._ENCODER_ORDER, out = out )
+        return out
+
+    def start_encoder_poller( self, rate = None ):
+        """
+        Keep an encoder snapshot updated in the background
+
+        Parameters
+        ----------
+        rate : float
+            The polling rate (in Hz), if None the rate that keeps polling to half of the link
+            (~1.5 Hz at 4800 baud, at most 10 Hz)
+
+        Returns
+        -------
+        EncoderPoller
+            The poller (use subscribe() on it to be notified of every update)
+        """
+        if self._poller is None:
+            if rate is None:
+                baudrate = getattr( self._ser, 'baudrate', None ) or 4800
+                rate = min( 10.0, 0.5 * baudrate / ( 10 * TASKA.ENCODER_READ_BYTES ) )
+            self._poller = EncoderPoller( self, rate = rate )
+        return self._poller
+
+    def stop_encoder_poller( self ):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
 
     @property
     def encoders(self):
         """
         Returns
         -------
-        numpy.ndarray (6,)
-            The encoder positions for each motor
+        numpy.ndarray (6,) or None
+            The encoder positions for each motor (None if the poller has no reading within 1 s)
 
         Notes
         -----
         Encoder positions are raito of total encoder range
         Encoder positions are in the following order: [Index, Middle, Ring, Little, Thumb, Rotator]
+        If the encoder poller is running the latest snapshot is returned without touching the link,
+        waiting for its first poll so the initial all-zero snapshot is never mistaken for a reading
         """
-        pos = []
-        for i2c in [ 11, 12, 13 ]:
-            # construct packet
-            pkt = [ 35, 109, i2c, 5 ]
-            pkt.append( TASKA.checksum( pkt ) )
-            pkt = bytes( pkt )
-
-            # send / receive info
-            self._ser.write( pkt )
-            recv_1 = self._ser.read( size = 21 )
-            recv_2 = self._ser.read( size = 26 )
-
-            # extract position information
-            pos.append( ( 256 * recv_1[8] + recv_1[7] ) / ( 256 * recv_1[14] + recv_1[13] ) )
-            pos.append( ( 256 * recv_2[8] + recv_2[7] ) / ( 256 * recv_2[14] + recv_2[13] ) )
-        return np.array( pos[ [ 4, 3, 2, 1, 5, 0 ] ] )
+        if self._poller is not None:
+            if not self._poller.wait( timeout = 1.0 ): return None
+            return self._poller.latest()[0]
+        return self.read_encoders()
         
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,402 @@
+import os
+import random
+import select
+import threading
+import time
+
+from collections import deque
+
+class TASKAEmulator():
+    """ Protocol-level model of the TASKA hand and its bluetooth serial dongle """
+    NUM_MOTORS = 6
+
+    def __init__( self, baudrate = 4800, ack_latency = 0.005, drop_rate = 0.0, full_speed = 2.0,
+                  encoder_range = 4000, seed = 0, clock = time.monotonic ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        baudrate : float
+            The simulated link rate (10 bits per byte on the wire in each direction)
+        ack_latency : float
+            The processing time (in seconds) between a command fully arriving and its response starting
+        drop_rate : float [0, 1]
+            The probability that any single response byte is lost
+        full_speed : float
+            The fraction of the full finger range travelled per second at speed 255
+        encoder_range : int
+            The encoder count reported for a fully closed finger
+        seed : int
+            The seed for the byte-drop random number generator
+        clock : callable
+            The monotonic clock used for all timing
+
+        Returns
+        -------
+        obj
+            A TASKAEmulator object
+
+        Notes
+        -----
+        Commands are [ 35, OPCODE, ID, LENGTH, ..., CHKSUM ] packets and responses are [ 64, OPCODE, ID, LENGTH, ..., CHKSUM ]
+        packets where LENGTH is the total size and CHKSUM the low byte of the sum of the preceding bytes.
+        Supported commands: 'atd' connect, 77 encoder enable, 71 grip select / grip position, 70 single finger /
+        finger group, 109 encoder read (two responses of 21 and 26 bytes) and 82 disconnect (no response).
+        Finger positions move linearly toward their targets at a rate proportional to the commanded speed.
+        """
+        self._byte_time = 10.0 / baudrate
+        self._ack_latency = ack_latency
+        self._drop_rate = drop_rate
+        self._full_speed = full_speed
+        self._encoder_range = encoder_range
+        self._rng = random.Random( seed )
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._rx = bytearray()                  # command bytes not parsed yet
+        self._tx = deque()                      # ( ready time, byte ) in wire order
+        self._host_free = 0.0                   # when the host->hand direction is idle again
+        self._hand_free = 0.0                   # when the hand->host direction is idle again
+
+        self._positions = [ 0.0 ] * TASKAEmulator.NUM_MOTORS
+        self._targets = [ 0.0 ] * TASKAEmulator.NUM_MOTORS
+        self._rates = [ 0.0 ] * TASKAEmulator.NUM_MOTORS
+        self._moved = clock()
+        self._grip = None
+        self._encoders_enabled = set()
+
+        self.connected = False
+        self.commands = {}
+        self.bad_packets = 0
+        self.dropped_bytes = 0
+        self.log = []                           # ( arrival time, command packet )
+
+    @staticmethod
+    def checksum( array ):
+        return sum( array ) & 0xFF
+
+    @property
+    def positions( self ):
+        """
+        Returns
+        -------
+        list of floats (6,)
+            The current finger positions [0, 1] in the order [Index, Middle, Ring, Little, Thumb, Rotator]
+        """
+        with self._lock:
+            self._advance( self._clock() )
+            return list( self._positions )
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Command counts by opcode, corrupt command packets and dropped response bytes
+        """
+        with self._lock:
+            return { 'commands' : dict( self.commands ), 'bad_packets' : self.bad_packets,
+                     'dropped_bytes' : self.dropped_bytes }
+
+    def feed( self, data ):
+        """
+        Deliver bytes written by the host
+
+        Parameters
+        ----------
+        data : bytes-like
+            The bytes written to the serial port
+        """
+        now = self._clock()
+        with self._lock:
+            start = max( now, self._host_free )
+            self._host_free = start + len( data ) * self._byte_time
+            self._rx.extend( data )
+            self._parse( self._host_free )
+
+    def next_ready( self ):
+        """
+        Returns
+        -------
+        float or None
+            The time the next response byte becomes readable (None if nothing is pending)
+        """
+        with self._lock:
+            return self._tx[0][0] if self._tx else None
+
+    def pending( self, now = None ):
+        """
+        Returns
+        -------
+        int
+            The number of response bytes readable at time now
+        """
+        if now is None: now = self._clock()
+        with self._lock:
+            count = 0
+            for ready, _ in self._tx:
+                if ready > now: break
+                count += 1
+            return count
+
+    def take( self, size, now = None ):
+        """
+        Remove up to size response bytes that have arrived at the host
+
+        Parameters
+        ----------
+        size : int
+            The maximum number of bytes to return
+        now : float
+            The current time on the emulator clock
+
+        Returns
+        -------
+        bytes
+            The response bytes readable at time now
+        """
+        if now is None: now = self._clock()
+        out = bytearray()
+        with self._lock:
+            while self._tx and len( out ) < size and self._tx[0][0] <= now:
+                out.append( self._tx.popleft()[1] )
+        return bytes( out )
+
+    def _respond( self, pkt, arrived ):
+        """
+        Queue a response so its bytes trickle out at the link rate after the acknowledgement latency
+        """
+        t = max( arrived + self._ack_latency, self._hand_free )
+        for byte in pkt:
+            t += self._byte_time
+            if self._drop_rate and self._rng.random() < self._drop_rate:
+                self.dropped_bytes += 1
+                continue
+            self._tx.append( ( t, byte ) )
+        self._hand_free = t
+
+    def _packet( self, body ):
+        body = list( body )
+        body[3] = len( body ) + 1
+        return bytes( body + [ TASKAEmulator.checksum( body ) ] )
+
+    def _parse( self, arrived ):
+        """
+        Process every complete command in the receive buffer
+        """
+        buf = self._rx
+        while buf:
+            if buf.startswith( b'atd' ):
+                end = buf.find( b'\n' )
+                if end < 0: return
+                del buf[:end + 1]
+                self.connected = True
+                self.log.append( ( arrived, b'atd' ) )
+                self._hand_free = max( self._hand_free, arrived + self._ack_latency )
+                for byte in b'\r\nCONNECT 680AE2746762\r\n':
+                    self._hand_free += self._byte_time
+                    self._tx.append( ( self._hand_free, byte ) )
+                continue
+            if buf[0] != 35:
+                del buf[0]
+                continue
+            if len( buf ) < 4: return
+            length = buf[3]
+            if length < 5:
+                del buf[0]
+                continue
+            if len( buf ) < length: return
+            pkt = bytes( buf[:length] )
+            if TASKAEmulator.checksum( pkt[:-1] ) != pkt[-1]:
+                self.bad_packets += 1
+                del buf[0]
+                continue
+            del buf[:length]
+            self.log.append( ( arrived, pkt ) )
+            self.commands[ pkt[1] ] = self.commands.get( pkt[1], 0 ) + 1
+            self._execute( pkt, arrived )
+
+    def _execute( self, pkt, arrived ):
+        """
+        Apply a command to the hand model and queue its response
+        """
+        opcode, ident = pkt[1], pkt[2]
+        self._advance( arrived )
+        if opcode == 77:
+            self._encoders_enabled.add( ( ident, pkt[4] ) )
+            self._respond( self._packet( [ 64, 77, ident, 0, 11 ] ), arrived )
+        elif opcode == 71:
+            if ident == 2: self._grip = pkt[4]
+            elif ident == 3:
+                for i in range( TASKAEmulator.NUM_MOTORS ):
+                    self._set_target( i, pkt[4], 255 )
+            self._respond( self._packet( [ 64, 71, ident, 0 ] ), arrived )
+        elif opcode == 70:
+            if ident == 255:
+                for i in range( TASKAEmulator.NUM_MOTORS ):
+                    self._set_target( i, pkt[4 + i], pkt[10 + i] )
+            elif ident < TASKAEmulator.NUM_MOTORS:
+                self._set_target( ident, pkt[5], pkt[4] )
+            self._respond( self._packet( [ 64, 70, ident, 0 ] ), arrived )
+        elif opcode == 109:
+            # raw order is [ I2C 11 motor 1, I2C 11 motor 2, I2C 12 motor 1, ... ] -> finger [ 5, 3, 2, 1, 0, 4 ]
+            fingers = { 11 : ( 5, 3 ), 12 : ( 2, 1 ), 13 : ( 0, 4 ) }.get( ident )
+            if fingers is None: return
+            for size, finger in zip( ( 21, 26 ), fingers ):
+                body = [ 64, 109, ident, 0 ] + [ 0 ] * ( size - 5 )
+                pos = int( round( self._positions[ finger ] * self._encoder_range ) )
+                body[7], body[8] = pos & 0xFF, pos >> 8
+                body[13], body[14] = self._encoder_range & 0xFF, self._encoder_range >> 8
+                self._respond( self._packet( body ), arrived )
+        elif opcode == 82:
+            self.connected = False
+
+    def _set_target( self, finger, position, speed ):
+        self._targets[ finger ] = position / 255.0
+        self._rates[ finger ] = self._full_speed * speed / 255.0
+
+    def _advance( self, now ):
+        """
+        Move every finger toward its target up to time now
+        """
+        dt = now - self._moved
+        if dt <= 0: return
+        self._moved = now
+        for i in range( TASKAEmulator.NUM_MOTORS ):
+            error = self._targets[i] - self._positions[i]
+            step = self._rates[i] * dt
+            if abs( error ) <= step: self._positions[i] = self._targets[i]
+            else: self._positions[i] += step if error > 0 else -step
+
+class SimulatedSerial():
+    """ In-process stand-in for serial.Serial connected to a TASKAEmulator """
+    def __init__( self, emulator = None, timeout = 0.5, **kwargs ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        emulator : TASKAEmulator
+            The emulated hand (a default one is created if None)
+        timeout : float
+            The read timeout (in seconds), as for serial.Serial
+        kwargs : dict
+            Passed to TASKAEmulator when no emulator is given
+
+        Returns
+        -------
+        obj
+            A serial-like object that can be passed to TASKA( com = ... )
+        """
+        self.emulator = emulator if emulator is not None else TASKAEmulator( **kwargs )
+        self.timeout = timeout
+        self.is_open = True
+
+    @property
+    def in_waiting( self ):
+        return self.emulator.pending()
+
+    def write( self, data ):
+        if not self.is_open: raise OSError( 'Simulated port is closed' )
+        self.emulator.feed( data )
+        return len( data )
+
+    def read( self, size = 1 ):
+        """
+        Read up to size bytes, waiting at most timeout seconds for them to arrive
+        """
+        if not self.is_open: raise OSError( 'Simulated port is closed' )
+        deadline = time.monotonic() + ( self.timeout or 0.0 )
+        out = bytearray()
+        while self.is_open:
+            out += self.emulator.take( size - len( out ) )
+            if len( out ) >= size: break
+            now = time.monotonic()
+            if now >= deadline: break
+            ready = self.emulator.next_ready()
+            wake = deadline if ready is None else min( deadline, max( ready, now ) )
+            time.sleep( max( 0.0, min( wake - now, 0.002 ) ) )
+        return bytes( out )
+
+    def reset_input_buffer( self ):
+        self.emulator.take( 1 << 30, now = float( 'inf' ) )
+
+    def close( self ):
+        self.is_open = False
+
+class PtySimulator():
+    """ TASKA emulator served on a pseudo-terminal (/dev/pts/N) for use with pyserial (POSIX only) """
+    def __init__( self, emulator = None, **kwargs ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        emulator : TASKAEmulator
+            The emulated hand (a default one is created if None)
+        kwargs : dict
+            Passed to TASKAEmulator when no emulator is given
+
+        Returns
+        -------
+        obj
+            A PtySimulator object with its service thread running (open self.port like any serial port)
+        """
+        import tty     # POSIX only, imported here so SimulatedSerial still works on Windows
+
+        self.emulator = emulator if emulator is not None else TASKAEmulator( **kwargs )
+        self._master, self._slave = os.openpty()
+        tty.setraw( self._slave )
+        self.port = os.ttyname( self._slave )
+
+        self._running = True
+        self._thread = threading.Thread( target = self._serve, daemon = True )
+        self._thread.start()
+
+    def close( self ):
+        self._running = False
+        self._thread.join( timeout = 1.0 )
+        os.close( self._master )
+        os.close( self._slave )
+
+    def _serve( self ):
+        """
+        Pump bytes between the pty and the emulator, releasing responses at their simulated arrival time
+        """
+        while self._running:
+            ready = self.emulator.next_ready()
+            wait = 0.05 if ready is None else min( 0.05, max( 0.0, ready - time.monotonic() ) )
+            readable, _, _ = select.select( [ self._master ], [], [], wait )
+            if readable:
+                try: data = os.read( self._master, 4096 )
+                except OSError: break
+                if data: self.emulator.feed( data )
+            out = self.emulator.take( 4096 )
+            if out: os.write( self._master, out )
+
+if __name__ == '__main__':
+    # load / latency test of the TASKA driver against the emulated hand
+    from TASKA import TASKA
+
+    taska = TASKA( com = SimulatedSerial( TASKAEmulator( baudrate = 4800 ) ), coalesce = False )
+    transport = taska._transport
+
+    n = 20
+    start = time.perf_counter()
+    for i in range( n ):
+        transport.send( taska._grip_pkts[ 'tripod' ], opcode = 71, wait = True )
+    elapsed = time.perf_counter() - start
+    print( 'Blocking grip select:  %6.1f ms per command' % ( 1e3 * elapsed / n ) )
+
+    start = time.perf_counter()
+    futures = [ transport.send( taska._grip_pkts[ 'tripod' ], opcode = 71 ) for i in range( n ) ]
+    for future in futures: transport.result( future )
+    elapsed = time.perf_counter() - start
+    print( 'Pipelined grip select: %6.1f ms per command' % ( 1e3 * elapsed / n ) )
+
+    taska.publish( angles = [ 1.0 ] * 6, speed = 1.0 )
+    time.sleep( 0.6 )
+    print( 'Encoders after closing:', taska.read_encoders() )
+    print( transport.stats )
@@ -0,0 +1,103 @@
+import struct
+import time
+
+from collections import namedtuple
+
+import numpy as np
+
+# Binary tracker datagram (all fields little-endian)
+#   offset  size  field
+#   0       2     magic b'TQ'
+#   2       1     format version
+#   3       1     flags (bit 0 set: float64 payload, clear: float32 payload)
+#   4       4     sender sequence number (uint32)
+#   8       8     sender timestamp in seconds (float64)
+#   16      32/64 tracker quaternion followed by calibrator quaternion (8 floats)
+MAGIC = b'TQ'
+VERSION = 1
+FLAG_FLOAT64 = 0x01
+
+_HEADER = struct.Struct( '<2sBBId' )
+_PAYLOAD_DTYPE = { 0 : np.dtype( '<f4' ), FLAG_FLOAT64 : np.dtype( '<f8' ) }
+
+TrackerSample = namedtuple( 'TrackerSample', [ 'tracker', 'calibrator', 'seq', 'stamp' ] )
+
+def encode( tracker, calibrator, seq = 0, stamp = None, double = False ):
+    """
+    Encode a tracker/calibrator pair into a binary datagram
+
+    Parameters
+    ----------
+    tracker : iterable of floats (4,)
+        The tracker quaternion
+    calibrator : iterable of floats (4,)
+        The calibrator quaternion
+    seq : int
+        The sender sequence number (wraps at 2**32)
+    stamp : float
+        The sender timestamp in seconds (time.time() if None)
+    double : bool
+        True to send float64 values, False for float32
+
+    Returns
+    -------
+    bytes
+        The encoded datagram (48 bytes for float32, 80 bytes for float64)
+    """
+    flags = FLAG_FLOAT64 if double else 0
+    if stamp is None: stamp = time.time()
+    values = np.empty( 8, dtype = _PAYLOAD_DTYPE[ flags ] )
+    values[0:4] = tracker
+    values[4:8] = calibrator
+    return _HEADER.pack( MAGIC, VERSION, flags, seq & 0xFFFFFFFF, stamp ) + values.tobytes()
+
+def decode( data ):
+    """
+    Decode a tracker datagram in either the binary or the legacy CSV format
+
+    Parameters
+    ----------
+    data : bytes-like
+        The raw datagram
+
+    Returns
+    -------
+    TrackerSample
+        The tracker and calibrator quaternions with the sender sequence number and timestamp
+
+    Raises
+    ------
+    ValueError
+        The datagram is malformed or uses an unsupported version
+
+    Notes
+    -----
+    The format is detected per packet from the magic bytes. Binary payloads are returned as
+    read-only NumPy views of the datagram (no copy); CSV datagrams ( 8 comma separated floats )
+    are returned as lists with seq and stamp set to None.
+    """
+    if data[:2] == MAGIC:
+        if len( data ) < _HEADER.size:
+            raise ValueError( 'Truncated tracker datagram header' )
+        _, version, flags, seq, stamp = _HEADER.unpack_from( data )
+        if version != VERSION:
+            raise ValueError( 'Unsupported tracker datagram version: ', version )
+        dtype = _PAYLOAD_DTYPE.get( flags & FLAG_FLOAT64 )
+        if len( data ) < _HEADER.size + 8 * dtype.itemsize:
+            raise ValueError( 'Truncated tracker datagram payload' )
+        values = np.frombuffer( data, dtype = dtype, count = 8, offset = _HEADER.size )
+        return TrackerSample( values[0:4], values[4:8], seq, stamp )
+
+    a_list = list( map( float, bytes( data ).decode( 'utf-8' ).split( ',' ) ) )
+    if len( a_list ) != 8:
+        raise ValueError( 'Expected 8 comma separated floats, got ', len( a_list ) )
+    return TrackerSample( a_list[0:4], a_list[4:8], None, None )
+
+if __name__ == '__main__':
+    tracker = [ 0.7, 0.1, 0.2, 0.3 ]
+    calibrator = [ 1.0, 0.0, 0.0, 0.0 ]
+
+    csv = ','.join( map( str, tracker + calibrator ) ).encode( 'utf-8' )
+    binary = encode( tracker, calibrator, seq = 1 )
+    print( 'CSV datagram    (%2d bytes):' % len( csv ), decode( csv ) )
+    print( 'Binary datagram (%2d bytes):' % len( binary ), decode( binary ) )
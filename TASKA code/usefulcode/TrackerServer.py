@@ -0,0 +1,266 @@
+import asyncio
+import socket
+
+import LatencyTracer
+import TrackerCodec
+
+from BatchReceiver import BatchReceiver
+from PoseMailbox import PoseMailbox
+
+class TrackerProtocol( asyncio.DatagramProtocol ):
+    """ asyncio datagram protocol that forwards tracker packets to a TrackerServer """
+    def __init__( self, server ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        server : TrackerServer
+            The server that owns this protocol
+
+        Returns
+        -------
+        obj
+            A TrackerProtocol object
+        """
+        self._server = server
+
+    def datagram_received( self, data, addr ):
+        self._server._receive( data, addr )
+
+    def error_received( self, exc ):
+        self._server.dropped += 1
+
+class TrackerServer():
+    """ Reusable asyncio UDP server for tracker/calibrator quaternion datagrams """
+    def __init__( self, host = '127.0.0.1', port = 20001, max_age = None, batch = False ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        host : str
+            The local IP address to bind to
+        port : int
+            The local UDP port to bind to (0 picks a free port)
+        max_age : float
+            The maximum age (in seconds) of a pose handed to the control loop (no limit if None)
+        batch : bool
+            True to drain every pending datagram per socket wakeup with a BatchReceiver, False to
+            receive one datagram per callback through the asyncio datagram transport
+
+        Returns
+        -------
+        obj
+            A TrackerServer object (call start() from a running event loop to bind the socket)
+
+        Notes
+        -----
+        Each datagram holds the tracker quaternion followed by the calibrator quaternion, either in the binary
+        TrackerCodec format or as 8 comma separated floats (detected per packet).
+        Poses go through a PoseMailbox: poses that arrive while the control loop is busy replace the pending one
+        and are counted as superseded, and poses older than max_age are discarded as stale.
+        An empty datagram asks the server to stop.
+        Batch mode registers the socket with loop.add_reader(), which the Windows proactor event loop does not support.
+        """
+        self._host = host
+        self._port = port
+        self._batch = batch
+        self._transport = None
+        self._sock = None
+        self._receiver = None
+        self._new_pose = None
+        self._stopped = None
+
+        self.mailbox = PoseMailbox( max_age = max_age )
+
+        self.received = 0
+        self.dropped = 0
+        self.lost = 0
+        self._last_sender_seq = None
+
+    async def start( self ):
+        """
+        Bind the UDP socket on the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        self._new_pose = asyncio.Event()
+        self._stopped = asyncio.Event()
+        if self._batch:
+            self._sock = socket.socket( family = socket.AF_INET, type = socket.SOCK_DGRAM )
+            self._sock.bind( ( self._host, self._port ) )
+            self._receiver = BatchReceiver( self._sock )
+            loop.add_reader( self._sock.fileno(), self._drain )
+        else:
+            self._transport, _ = await loop.create_datagram_endpoint( lambda: TrackerProtocol( self ),
+                                                                      local_addr = ( self._host, self._port ) )
+
+    def close( self ):
+        """
+        Close the UDP socket and wake up anything waiting on a pose
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader( self._sock.fileno() )
+            self._sock.close()
+            self._sock = None
+        if self._stopped is not None:
+            self._stopped.set()
+            self._new_pose.set()
+
+    @property
+    def address( self ):
+        """
+        Returns
+        -------
+        tuple
+            The ( host, port ) the server is bound to
+        """
+        if self._sock is not None: return self._sock.getsockname()
+        return self._transport.get_extra_info( 'sockname' )
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of received, dropped (malformed) and lost (sequence gaps in binary datagrams) datagrams,
+            plus the mailbox counts of delivered, superseded (never handed to the control loop) and stale poses
+        """
+        stats = { 'received' : self.received, 'dropped' : self.dropped, 'lost' : self.lost }
+        stats.update( self.mailbox.stats )
+        return stats
+
+    def _receive( self, data, addr ):
+        """
+        Parse a datagram and make it the pending pose
+
+        Parameters
+        ----------
+        data : bytes
+            The raw datagram
+        addr : tuple
+            The address of the sender
+        """
+        if not data:
+            self.close()
+            return
+        tracer = LatencyTracer.active
+        if tracer is not None: tracer.begin()
+        try:
+            sample = TrackerCodec.decode( data )
+        except ValueError:
+            self.dropped += 1
+            return
+        if tracer is not None: tracer.stamp( 'decode' )
+
+        if sample.seq is not None: self._track_seq( sample.seq )
+
+        self.received += 1
+        self.mailbox.put( sample.tracker, sample.calibrator )
+        self._new_pose.set()
+
+    def _drain( self ):
+        """
+        Read every pending datagram and post only the newest one to the mailbox (batch mode)
+        """
+        dropped = self._receiver.dropped
+        block = self._receiver.drain()
+        self.dropped += self._receiver.dropped - dropped
+
+        for seq in self._receiver.seq:
+            if seq >= 0: self._track_seq( int( seq ) )
+
+        if len( block ):
+            self.received += len( block )
+            self.mailbox.put( block[-1,0:4].tolist(), block[-1,4:8].tolist(), count = len( block ) )
+            self._new_pose.set()
+        if self._receiver.closed: self.close()
+
+    def _track_seq( self, seq ):
+        """
+        Count sender sequence numbers that never arrived
+
+        Parameters
+        ----------
+        seq : int
+            The sender sequence number of the datagram just received
+        """
+        if self._last_sender_seq is not None:
+            gap = ( seq - self._last_sender_seq - 1 ) & 0xFFFFFFFF
+            if gap < 0x80000000: self.lost += gap  # ignore reordered / restarted senders
+        self._last_sender_seq = seq
+
+    def latest( self ):
+        """
+        Take the pending pose without waiting
+
+        Returns
+        -------
+        tuple or None
+            ( seq, receive time, tracker, calibrator ) for the newest pose, or None if nothing new and fresh arrived
+        """
+        return self.mailbox.take()
+
+    async def wait_pose( self ):
+        """
+        Wait for a fresh pose newer than the last one taken
+
+        Returns
+        -------
+        tuple or None
+            ( seq, receive time, tracker, calibrator ) for the newest pose, or None if the server was closed
+        """
+        while True:
+            pose = self.mailbox.take()
+            if pose is not None: return pose
+            if self._stopped.is_set(): return None
+            self._new_pose.clear()
+            await self._new_pose.wait()
+
+    async def run( self, handler, executor = None ):
+        """
+        Hand the latest pose to handler until the server is closed
+
+        Parameters
+        ----------
+        handler : callable
+            Called as handler( tracker, calibrator ) for each pose taken
+        executor : concurrent.futures.Executor
+            The executor the handler runs in (default event loop executor if None)
+
+        Notes
+        -----
+        The handler runs outside the event loop so blocking device I/O never stops datagrams from being received.
+        Poses that arrive while the handler is busy are collapsed into the most recent one.
+        """
+        loop = asyncio.get_running_loop()
+
+        def dispatch( tracker, calibrator ):
+            # the hand-off to the executor thread is traced as its own stage, not as part of compute
+            tracer = LatencyTracer.active
+            if tracer is not None: tracer.stamp( 'dispatch' )
+            handler( tracker, calibrator )
+
+        while True:
+            pose = await self.wait_pose()
+            if pose is None: break
+            _, _, tracker, calibrator = pose
+            await loop.run_in_executor( executor, dispatch, tracker, calibrator )
+
+if __name__ == '__main__':
+    # print poses sent to the default tracker port
+    async def main():
+        server = TrackerServer()
+        await server.start()
+        print( 'UDP server is booted and ready on', server.address )
+        try:
+            await server.run( lambda tracker, calibrator: print( tracker, calibrator ) )
+        finally:
+            server.close()
+            print( server.stats )
+
+    asyncio.run( main() )
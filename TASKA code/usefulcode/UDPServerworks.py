@@ -1,8 +1,10 @@
 import socket
 import sys
+import logging
 import math
+import threading
 
-from Quaternion import _AXES2TUPLE, relative, to_euler
+from Quaternion import _AXES2TUPLE, relative_euler
 
 import time
 import serial
@@ -13,11 +15,16 @@ from serial import Serial
 
 import sys
 
-import bluetooth
-
 from TASKA import TASKA
 from ActiveWrist import ActiveWrist
 from Positional import Positional
+from PoseMailbox import PoseMailbox
+from BatchReceiver import BatchReceiver
+from WristController import WristController
+from ControlLoop import ControlLoop
+from SessionRecorder import SessionRecorder
+import LatencyTracer
+import BufferedLog
 
 # might need a user input for pronate/supinate
 proorsup = str.lower(input('Enter Pronate or Supinate?: '))
@@ -27,6 +34,11 @@ if proorsup != 'pronate' and proorsup != 'supinate':
 localIP = "127.0.0.1"
 localPort = 20001
 buffersize = 1024
+maxage = 0.1 # seconds, poses older than this are discarded instead of acted on
+controlrate = 50 # Hz, the wrist is updated on a fixed schedule and commanded at most 10 times a second
+tracelatency = False # stamp every sample at each stage and print per-stage percentiles on exit
+loglevel = logging.INFO # logging.DEBUG also logs every received pose and error
+recordpath = None # e.g. time.strftime('session_%Y%m%d_%H%M%S.tsr') to record poses and device traffic
 
 msgFromServer = "Hello UDP Client"
 bytestoSend = str.encode(msgFromServer)
@@ -37,64 +49,81 @@ UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
 # bind address and ip
 UDPServerSocket.bind((localIP, localPort))
 
-print("UDP server is booted and ready")
+# console output is written by a background thread so slow terminals never stall a sample
+BufferedLog.start(loglevel)
+log = logging.getLogger('UDPServerworks')
+
+log.info("UDP server is booted and ready")
 
 # Listen for incoming datagrams
 
-hand = Positional()
+recorder = SessionRecorder(recordpath) if recordpath else None
+if tracelatency:
+    LatencyTracer.enable()
+hand = Positional(recorder = recorder)
 
-## Get initial position 
-bytesAddressPair = UDPServerSocket.recvfrom(buffersize)
+# the reader thread only keeps the newest pose, so the control loop never works through a backlog
+mailbox = PoseMailbox(max_age = maxage)
 
-message = bytesAddressPair[0]
+def read_poses():
+    #drains every pending datagram per wakeup into one preallocated block
+    receiver = BatchReceiver(UDPServerSocket, slot_size = buffersize)
+    while True:
+        block = receiver.wait()
 
-#convert message bytes to a list format
-message = message.decode("utf-8")
-a_list = list(map(float,message.split(',')))
+        #each row is one datagram, first 4 values are tracker, the last 4 are calibrator
+        if len(block):
+            mailbox.put(block[-1,0:4].tolist(), block[-1,4:8].tolist(), count = len(block))
 
-clientMsg = "Message from Client: {}".format(a_list)
-print (clientMsg)
+threading.Thread(target = read_poses, daemon = True).start()
 
-#first 4 elements are tracker, the last 4 are calibrator
-tracker = a_list[0:4]
-calibrator = a_list[4:8]
+## Get initial position 
+_, _, tracker, calibrator = mailbox.wait()
+
+log.debug("Message from Client: %s %s", tracker, calibrator)
 
-#calculate euler angles for relative AND source
-quat_combine = relative(calibrator,tracker)
-euler_angs = to_euler(quat_combine, axes='sxyz')
-tracker_angs = to_euler(tracker, axes = 'sxyz')
+#calculate relative euler angles
+euler_angs = relative_euler(calibrator, tracker, axes='sxyz')
 
 # need a way to determine which of the 3 angles is the "roll" let's assume the x is roll
 
 target_value = -1
 
-#choose pronate or supinate here based on euler angle orientation
-hand.test_command(proorsup) 
-print('Initial error: ', abs(target_value - euler_angs[0]))
-
-while(abs(target_value - euler_angs[0]) > 0.1): #change 0.01 radians error empirically
-        print('Current error: ', abs(target_value - euler_angs[0]))
-
-        bytesAddressPair = UDPServerSocket.recvfrom(buffersize)
-        #prints the message received from Udpclient
-        message = bytesAddressPair[0]
-
-        #convert message bytes to a list format
-        message = message.decode("utf-8")
-        a_list = list(map(float,message.split(',')))
-
-        clientMsg = "Message from Client: {}".format(a_list)
-        print(clientMsg)
-
-        #first 4 elements are tracker, the last 4 are calibrator
-        tracker = a_list[0:4]
-        calibrator = a_list[4:8]
-
-        #calculate euler angles for relative AND source
-        quat_combine = relative(calibrator,tracker)
-
-        euler_angs = to_euler(quat_combine, axes='sxyz')
-        print(euler_angs)
-hand.test_command('rest')
+#the entered movement is the one that heads toward the target from here
+other = 'supinate' if proorsup == 'pronate' else 'pronate'
+hand.WristController = WristController(target = target_value, deadband = 0.1,
+                                       increase = proorsup if target_value > euler_angs[0] else other)
+log.info('Initial error: %.3f', abs(target_value - euler_angs[0]))
+
+def sense():
+    #freshest tracker/calibrator pair, older ones are discarded and counted (None skips the cycle)
+    pose = mailbox.take()
+    return None if pose is None else pose[2:]
+
+def compute(pose):
+    tracker, calibrator = pose
+    log.debug("Message from Client: %s %s", tracker, calibrator)
+
+    #the loop sends the command when the wrist budget allows it
+    cmd = hand.track_wrist(tracker, calibrator, send = False)
+    log.debug('Current error: %.3f', abs(hand.WristController.error))
+    if hand.WristController.settled: #change 0.1 radians error empirically
+        loop.stop()
+    return None if cmd is None else {'wrist': cmd}
+
+#rotate until the wrist is stopped inside the deadband, commands are only sent on transitions
+hand.track_wrist(tracker, calibrator)
+if not hand.WristController.settled:
+    loop = ControlLoop(hand, sense, compute, rate = controlrate)
+    loop.run()
+    log.info('%s', loop.stats)
+hand.send_wrist('rest')
+log.info('%s', hand.WristController.stats)
+log.info('%s', mailbox.stats)
+if recorder is not None:
+    recorder.close()
+if LatencyTracer.active is not None:
+    log.info('latency\n%s', LatencyTracer.active.report())
+BufferedLog.stop()
 
 UDPServerSocket.close()
\ No newline at end of file
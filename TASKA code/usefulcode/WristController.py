@@ -0,0 +1,140 @@
+import math
+import time
+
+from Quaternion import relative_euler
+
+class WristController():
+    """ Closed-loop wrist rotation from the tracker roll relative to the calibrator """
+    _OPPOSITE = { 'pronate' : 'supinate', 'supinate' : 'pronate' }
+
+    def __init__( self, target = 0.0, deadband = 0.05, hysteresis = 0.03, min_dwell = 0.2,
+                  increase = 'supinate', axes = 'sxyz', roll = 0, clock = time.monotonic ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        target : float
+            The desired relative roll (in radians)
+        deadband : float
+            The roll error (in radians) below which a running rotation stops
+        hysteresis : float
+            The extra error (in radians) above the deadband needed to start a rotation
+        min_dwell : float
+            The minimum time (in seconds) the wrist stays at rest or in a direction before starting
+            or reversing a rotation (stopping is never delayed)
+        increase : str
+            The wrist command ('pronate' or 'supinate') that increases the measured roll
+        axes : str
+            The euler axes convention of the relative rotation
+        roll : int
+            The index of the roll angle in the euler angles
+        clock : callable
+            The monotonic clock used for the dwell time
+
+        Returns
+        -------
+        obj
+            A WristController object at rest
+        """
+        if increase not in WristController._OPPOSITE:
+            raise RuntimeError( 'Invalid wrist movement for the WristController: ', increase )
+        self.target = target
+        self._deadband = deadband
+        self._engage = deadband + hysteresis
+        self._min_dwell = min_dwell
+        self._increase = increase
+        self._decrease = WristController._OPPOSITE[ increase ]
+        self._axes = axes
+        self._roll = roll
+        self._clock = clock
+
+        self.state = 'rest'
+        self.error = None
+        self.euler = None
+        self._changed = -math.inf
+
+        self.updates = 0
+        self.transitions = 0
+        self.held = 0
+
+    @property
+    def settled( self ):
+        """
+        Returns
+        -------
+        bool
+            True if the wrist is at rest and the roll error is too small to start a rotation
+        """
+        return self.state == 'rest' and self.error is not None and abs( self.error ) <= self._engage
+
+    @property
+    def stats( self ):
+        """
+        Returns
+        -------
+        dict
+            Counts of updates, emitted transitions and transitions held back by the minimum dwell
+        """
+        return { 'updates' : self.updates, 'transitions' : self.transitions, 'held' : self.held }
+
+    def reset( self ):
+        self.state = 'rest'
+        self.error = None
+        self._changed = -math.inf
+
+    def update( self, tracker, calibrator, now = None ):
+        """
+        Parameters
+        ----------
+        tracker : iterable of floats (4,)
+            The tracker orientation quaternion
+        calibrator : iterable of floats (4,)
+            The calibrator orientation quaternion
+        now : float
+            The current time on the controller clock
+
+        Returns
+        -------
+        str or None
+            The wrist command to send ('rest', 'pronate' or 'supinate') if the state changed, None else
+        """
+        self.euler = relative_euler( calibrator, tracker, axes = self._axes )
+        return self.update_error( self.target - self.euler[ self._roll ], now )
+
+    def update_error( self, error, now = None ):
+        """
+        Parameters
+        ----------
+        error : float
+            The roll error target - roll (in radians, wrapped to [-pi, pi))
+        now : float
+            The current time on the controller clock
+
+        Returns
+        -------
+        str or None
+            The wrist command to send if the state changed, None else
+        """
+        if now is None: now = self._clock()
+        error = ( error + math.pi ) % ( 2.0 * math.pi ) - math.pi
+        self.error = error
+        self.updates += 1
+
+        # rotate while outside the deadband, only start once outside deadband + hysteresis
+        threshold = self._deadband if self.state != 'rest' else self._engage
+        if error > threshold: desired = self._increase
+        elif error < -threshold: desired = self._decrease
+        else: desired = 'rest'
+        if self.state != 'rest' and desired != 'rest' and desired != self.state and abs( error ) < self._engage:
+            desired = 'rest'    # overshoot into the far hysteresis band stops first
+
+        if desired == self.state: return None
+        if desired != 'rest' and now - self._changed < self._min_dwell:
+            self.held += 1
+            if self.state == 'rest': return None
+            desired = 'rest'    # a reversal inside the dwell time stops instead of running the wrong way
+        self.state = desired
+        self._changed = now
+        self.transitions += 1
+        return desired
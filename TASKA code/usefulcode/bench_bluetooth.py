@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+
+from ActiveWrist import ActiveWrist
+from IBTSimulator import IBTStandIn
+
+#End-to-end movement command latency for the ActiveWrist against a local IBT stand-in
+#Compares the original four separate sends per move against the batched single write
+
+def legacy_send_movement_command( wrist, move ):
+    wrist._bt.send( b'\xff\x02\x9e\x9f' )         # stop last movement command
+    wrist._bt.send( wrist._move_dict['rest'] )     # clear last movement command
+    wrist._bt.send( wrist._move_dict[ move ] )     # send current movement command
+    wrist._bt.send( wrist._move_dict[ move ] )     # must send active movement commands twice
+
+def bench_moves( send, standin, wrist, frames_per_move, number = 500 ):
+    """
+    Time from issuing a movement command until the stand-in has decoded all of its frames
+
+    Returns
+    -------
+    numpy.ndarray
+        The per-move latencies (in microseconds)
+    """
+    moves = [ 'pronate', 'supinate' ]
+    latency = np.zeros( number )
+    for i in range( number ):
+        expected = standin.frames + frames_per_move
+        t0 = time.perf_counter()
+        send( wrist, moves[ i % 2 ] )
+        if not standin.wait_frames( expected ): raise RuntimeError( 'Stand-in did not receive the move' )
+        latency[ i ] = ( time.perf_counter() - t0 ) * 1e6
+    return latency
+
+def bench_bluetooth( number = 500, path = None ):
+    """
+    Compare movement command latencies over a TCP (or Unix socket) stand-in
+
+    Parameters
+    ----------
+    number : int
+        The number of movement commands per variant
+    path : str
+        Serve the stand-in on this Unix socket path instead of TCP
+
+    Returns
+    -------
+    dict
+        Latency percentiles in microseconds as { variant : ( p50, p95, p99 ) }
+    """
+    variants = [ ( 'legacy 4x send', [ 'stop', 'clear', 'move', 'move' ], legacy_send_movement_command ),
+                 ( 'batched sendall', [ 'stop', 'clear', 'move', 'move' ], ActiveWrist._send_movement_command ),
+                 ( 'batched stop+move', [ 'stop', 'move' ], ActiveWrist._send_movement_command ) ]
+    results = {}
+    for name, sequence, send in variants:
+        standin = IBTStandIn( path = path )
+        wrist = ActiveWrist( mac = standin.address, sequence = sequence )
+        latency = bench_moves( send, standin, wrist, len( sequence ), number )
+        results[ name ] = tuple( np.percentile( latency, [ 50, 95, 99 ] ) )
+        del wrist
+        standin.close()
+    return results
+
+if __name__ == '__main__':
+    for name, ( p50, p95, p99 ) in bench_bluetooth().items():
+        print( '%-18s p50 %7.1f us   p95 %7.1f us   p99 %7.1f us' % ( name, p50, p95, p99 ) )
@@ -0,0 +1,78 @@
+import timeit
+
+import numpy as np
+
+from Quaternion import relative, to_euler, relative_euler, multiply, rotate, to_matrix, from_euler
+
+#Microbenchmark for the per-datagram quaternion math done by the UDP servers
+#Compares the original relative() + to_euler() chain against the fused scalar relative_euler()
+
+def bench_relative_euler( number = 20000, repeat = 5 ):
+    """
+    Time the per-sample relative roll/pitch/yaw computation
+
+    Parameters
+    ----------
+    number : int
+        The number of calls per timing run
+    repeat : int
+        The number of timing runs (the fastest one is reported)
+
+    Returns
+    -------
+    dict
+        Per-call cost in microseconds for each implementation
+    """
+    # the servers receive plain python lists of floats
+    tracker = [ 0.7, 0.1, 0.2, 0.3 ]
+    calibrator = [ 0.9, -0.1, 0.05, 0.2 ]
+    out = np.empty( 3 )
+
+    assert np.allclose( to_euler( relative( calibrator, tracker ) ), relative_euler( calibrator, tracker ) )
+
+    cases = { 'to_euler(relative())'   : lambda: to_euler( relative( calibrator, tracker ), axes = 'sxyz' ),
+              'relative_euler()'       : lambda: relative_euler( calibrator, tracker, axes = 'sxyz' ),
+              'relative_euler(out=)'   : lambda: relative_euler( calibrator, tracker, axes = 'sxyz', out = out ) }
+    results = {}
+    for name, fn in cases.items():
+        best = min( timeit.repeat( fn, number = number, repeat = repeat ) )
+        results[ name ] = 1e6 * best / number
+    return results
+
+def bench_single( number = 20000, repeat = 5 ):
+    """
+    Time the single quaternion (4,) fast paths against the same call on a stacked (1, 4) array
+
+    Returns
+    -------
+    dict
+        Per-call cost in microseconds as { function : ( stacked, single ) }
+    """
+    q1 = np.array( [ 0.7, 0.1, 0.2, 0.3 ] )
+    q2 = np.array( [ 0.9, -0.1, 0.05, 0.2 ] )
+    v = np.array( [ 1.0, 2.0, 3.0 ] )
+    angles = np.array( [ 0.1, 0.2, 0.3 ] )
+
+    cases = { 'multiply'   : ( lambda: multiply( q1[None], q2[None] ), lambda: multiply( q1, q2 ) ),
+              'relative'   : ( lambda: relative( q1[None], q2[None] ), lambda: relative( q1, q2 ) ),
+              'rotate'     : ( lambda: rotate( q1[None], v[None] ),    lambda: rotate( q1, v ) ),
+              'to_euler'   : ( lambda: to_euler( q1[None] ),           lambda: to_euler( q1 ) ),
+              'to_matrix'  : ( lambda: to_matrix( q1[None] ),          lambda: to_matrix( q1 ) ),
+              'from_euler' : ( lambda: from_euler( angles[None] ),     lambda: from_euler( angles ) ) }
+    results = {}
+    for name, ( stacked, single ) in cases.items():
+        # the float fast path must match the array path
+        assert np.allclose( stacked()[0], single() ), name
+        results[ name ] = tuple( 1e6 * min( timeit.repeat( fn, number = number, repeat = repeat ) ) / number
+                                 for fn in ( stacked, single ) )
+    return results
+
+if __name__ == '__main__':
+    results = bench_relative_euler()
+    baseline = results[ 'to_euler(relative())' ]
+    for name, usec in results.items():
+        print( '%-24s %8.2f us/call  (%5.1fx)' % ( name, usec, baseline / usec ) )
+
+    print( '%-12s %14s %14s' % ( 'single (4,)', '(1,4) (us)', '(4,) (us)' ) )
+    for name, ( stacked, single ) in bench_single().items():
+        print( '%-12s %14.2f %14.2f' % ( name, stacked, single ) )
@@ -0,0 +1,379 @@
+import sys
+import json
+import math
+import time
+import socket
+import timeit
+import platform
+import threading
+
+import numpy as np
+
+import Quaternion
+import TrackerCodec
+import SessionRecorder
+
+from BatchReceiver import BatchReceiver
+from WristController import WristController
+from Positional import Positional
+from TASKASimulator import SimulatedSerial
+from IBTSimulator import IBTDecoder, IBTStandIn
+
+import bench_taska_encode
+
+#Headless benchmark suite for the math, codec, network and device layers (no hand or tracker needed)
+#Results are written as JSON, --compare flags regressions between two result files
+#
+#   python bench_suite.py -o before.json
+#   python bench_suite.py -o after.json
+#   python bench_suite.py --compare before.json after.json
+
+# every result is a time in microseconds, lower is better
+FORMAT_VERSION = 1
+
+# fixed seed so every run times the same inputs
+SEED = 1234
+
+def _timeit( fn, number, repeat ):
+    """
+    Returns
+    -------
+    float
+        The per-call cost (in microseconds) of the fastest timing run
+    """
+    return 1e6 * min( timeit.repeat( fn, number = number, repeat = repeat ) ) / number
+
+def _distribution( latency ):
+    """
+    Returns
+    -------
+    dict
+        The median of the latencies (in microseconds) as the value, with their p95/p99 and sample count
+    """
+    p50, p95, p99 = np.percentile( latency, [ 50, 95, 99 ] )
+    return { 'value' : float( p50 ), 'p95' : float( p95 ), 'p99' : float( p99 ), 'n' : len( latency ) }
+
+def _random_quaternions( rng, n ):
+    return Quaternion.normalize( rng.standard_normal( ( n, 4 ) ) )
+
+def bench_quaternion_ops( number = 20000, repeat = 5, batch = 1000 ):
+    """
+    Time single-sample and batched Quaternion operations
+
+    Parameters
+    ----------
+    number : int
+        The number of single-sample calls per timing run (batched calls use number / 100)
+    repeat : int
+        The number of timing runs (the fastest one is reported)
+    batch : int
+        The number of quaternions per batched call
+
+    Returns
+    -------
+    dict
+        Name -> per-call cost in microseconds (per batch for the batched ops)
+    """
+    rng = np.random.default_rng( SEED )
+    q1, q2 = _random_quaternions( rng, 2 )
+    tracker, calibrator = q1.tolist(), q2.tolist()
+    Q1 = _random_quaternions( rng, batch )
+    Q2 = _random_quaternions( rng, batch )
+    out = np.empty( 3 )
+
+    single = { 'multiply'          : lambda: Quaternion.multiply( q1, q2 ),
+               'relative'          : lambda: Quaternion.relative( q1, q2 ),
+               'to_euler'          : lambda: Quaternion.to_euler( q1 ),
+               'to_matrix'         : lambda: Quaternion.to_matrix( q1 ),
+               'rotate'            : lambda: Quaternion.rotate( q1, [ 1.0, 2.0, 3.0 ] ),
+               'to_euler_scalar'   : lambda: Quaternion.to_euler_scalar( tracker, out = out ),
+               'relative_euler'    : lambda: Quaternion.relative_euler( calibrator, tracker, out = out ),
+               'from_euler'        : lambda: Quaternion.from_euler( [ 0.1, 0.2, 0.3 ] ) }
+    batched = { 'multiply'         : lambda: Quaternion.multiply( Q1, Q2 ),
+                'relative'         : lambda: Quaternion.relative( Q1, Q2 ),
+                'to_euler'         : lambda: Quaternion.to_euler( Q1 ),
+                'average'          : lambda: Quaternion.average( Q1, axis = 0 ) }
+
+    results = {}
+    for name, fn in single.items():
+        results[ name ] = _timeit( fn, number, repeat )
+    for name, fn in batched.items():
+        results[ '%s[%d]' % ( name, batch ) ] = _timeit( fn, max( 1, number // 100 ), repeat )
+    return results
+
+def bench_encode( number = 20000, repeat = 5 ):
+    """
+    Time TASKA packet encoding (the current encoders of bench_taska_encode)
+
+    Returns
+    -------
+    dict
+        Command -> per-packet cost in microseconds
+    """
+    return { name : after for name, ( before, after ) in bench_taska_encode.bench_encode( number, repeat ).items() }
+
+def bench_decode( number = 20000, repeat = 5, batch = 64, drains = 200 ):
+    """
+    Time tracker datagram decoding, per datagram and per batch drained from a loopback UDP socket
+
+    Parameters
+    ----------
+    number : int
+        The number of single datagram decodes per timing run
+    repeat : int
+        The number of timing runs (the fastest one is reported)
+    batch : int
+        The number of datagrams queued before each drain
+    drains : int
+        The number of timed drains
+
+    Returns
+    -------
+    dict
+        Name -> per-datagram cost in microseconds (a distribution for the socket drain)
+    """
+    rng = np.random.default_rng( SEED )
+    tracker, calibrator = _random_quaternions( rng, 2 ).tolist()
+    f32 = TrackerCodec.encode( tracker, calibrator, seq = 1, stamp = 0.0 )
+    f64 = TrackerCodec.encode( tracker, calibrator, seq = 1, stamp = 0.0, double = True )
+    csv = ( ','.join( repr( v ) for v in tracker + calibrator ) ).encode()
+
+    results = { 'codec_f32' : _timeit( lambda: TrackerCodec.decode( f32 ), number, repeat ),
+                'codec_f64' : _timeit( lambda: TrackerCodec.decode( f64 ), number, repeat ),
+                'codec_csv' : _timeit( lambda: TrackerCodec.decode( csv ), number, repeat ) }
+
+    # the receive buffer must hold a whole batch so nothing is dropped before the drain
+    rx = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    rx.setsockopt( socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20 )
+    rx.bind( ( '127.0.0.1', 0 ) )
+    tx = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    tx.connect( rx.getsockname() )
+    receiver = BatchReceiver( rx, max_batch = batch )
+    latency = np.zeros( drains )
+    try:
+        for i in range( drains ):
+            for j in range( batch ): tx.send( f32 )
+            time.sleep( 0.001 )     # let loopback delivery settle so the drain only times reading and decoding
+            t0 = time.perf_counter()
+            block = receiver.drain()
+            latency[i] = 1e6 * ( time.perf_counter() - t0 ) / max( 1, len( block ) )
+            if len( block ) != batch: raise RuntimeError( 'Drained %d of %d datagrams' % ( len( block ), batch ) )
+    finally:
+        tx.close()
+        rx.close()
+    results[ 'drain[%d]' % batch ] = _distribution( latency )
+    return results
+
+class _Arrivals():
+    """ Recorder sink that counts the commands written to and acknowledged by the simulated TASKA """
+    def __init__( self ):
+        self._cond = threading.Condition()
+        self.count = 0
+        self.acks = 0
+
+    def record_pose( self, tracker, calibrator, euler = None, t = None ):
+        pass
+
+    def record_packet( self, kind, device, data, t = None ):
+        if device == SessionRecorder.TASKA:
+            with self._cond:
+                if kind == SessionRecorder.COMMAND: self.count += 1
+                elif kind == SessionRecorder.ACK: self.acks += 1
+                self._cond.notify_all()
+
+    def wait( self, count, acks = 0, timeout = 1.0 ):
+        with self._cond:
+            return self._cond.wait_for( lambda: self.count >= count and self.acks >= acks, timeout )
+
+def bench_end_to_end( samples = 3000, hand_samples = 500 ):
+    """
+    Time datagram -> decode -> Positional -> packet at the simulated devices
+
+    Parameters
+    ----------
+    samples : int
+        The number of tracker samples of an oscillating wrist roll fed through track_wrist
+    hand_samples : int
+        The number of finger angle commands sent through send_hand
+
+    Returns
+    -------
+    dict
+        Name -> latency distribution in microseconds
+            track_wrist: decode and controller update of every sample (most send nothing)
+            wrist_command: samples that changed the wrist movement, until the IBT stand-in decoded every frame
+            hand_command: decode and send_hand until the packet was written to the simulated TASKA
+
+    Notes
+    -----
+    Runs sequentially (parallel = False) so each latency covers exactly one sample. Sample stamps are
+    synthetic and passed to track_wrist, so the same commands are sent on every run.
+    The simulated TASKA runs a fast link with no acknowledgement delay and each finger command is timed after
+    the previous one was acknowledged; at the real 4800 baud a command waits ~57 ms for the previous
+    acknowledgement, which would hide any change in the driver itself.
+    """
+    rng = np.random.default_rng( SEED )
+    arrivals = _Arrivals()
+    standin = IBTStandIn()
+    hand = Positional( com = SimulatedSerial( baudrate = 1e7, ack_latency = 0.0 ), macA = standin.address,
+                       supervised = False, parallel = False, recorder = arrivals )
+    hand.WristController = WristController( target = 0.0, deadband = 0.05, hysteresis = 0.03, min_dwell = 0.0 )
+    frames = { move : len( IBTDecoder().feed( pkt ) ) for move, pkt in hand.ActiveWrist._move_pkts.items() }
+
+    calibrator = [ 1.0, 0.0, 0.0, 0.0 ]
+    poses = [ TrackerCodec.encode( Quaternion.from_euler( [ 0.8 * math.sin( i / 15 ), 0.0, 0.0 ] ), calibrator,
+                                   seq = i, stamp = 0.01 * i ) for i in range( samples ) ]
+    fingers = [ TrackerCodec.encode( Quaternion.from_euler( [ 0.0, 0.0, 0.0 ] ), calibrator, seq = i, stamp = 0.0 )
+                for i in range( hand_samples ) ]
+    degrees = 20.0 + 60.0 * rng.random( ( hand_samples, 6 ) )
+
+    track = np.zeros( samples )
+    wrist = []
+    hand_latency = np.zeros( hand_samples )
+    try:
+        for i, data in enumerate( poses ):
+            t0 = time.perf_counter()
+            sample = TrackerCodec.decode( data )
+            expected = standin.frames
+            cmd = hand.track_wrist( sample.tracker, sample.calibrator, now = sample.stamp )
+            track[i] = time.perf_counter() - t0
+            if cmd is not None:
+                if not standin.wait_frames( expected + frames[ cmd ] ): raise RuntimeError( 'Stand-in did not receive the move' )
+                wrist.append( time.perf_counter() - t0 )
+
+        for i, data in enumerate( fingers ):
+            expected = arrivals.count + 1
+            t0 = time.perf_counter()
+            sample = TrackerCodec.decode( data )
+            hand.send_hand( angles = degrees[i] )
+            if not arrivals.wait( expected ): raise RuntimeError( 'Simulated TASKA did not receive the command' )
+            hand_latency[i] = time.perf_counter() - t0
+            # the next command would otherwise queue behind this acknowledgement (simulator polling, not driver time)
+            if not arrivals.wait( expected, acks = expected ): raise RuntimeError( 'Simulated TASKA did not acknowledge' )
+    finally:
+        hand.close()
+        standin.close()
+
+    return { 'track_wrist'   : _distribution( 1e6 * track ),
+             'wrist_command' : _distribution( 1e6 * np.array( wrist ) ),
+             'hand_command'  : _distribution( 1e6 * hand_latency ) }
+
+# suite -> ( function, keyword arguments for a --quick run )
+SUITES = { 'quaternion' : ( bench_quaternion_ops, { 'number' : 2000, 'repeat' : 3 } ),
+           'encode'     : ( bench_encode, { 'number' : 2000, 'repeat' : 3 } ),
+           'decode'     : ( bench_decode, { 'number' : 2000, 'repeat' : 3, 'drains' : 50 } ),
+           'end_to_end' : ( bench_end_to_end, { 'samples' : 600, 'hand_samples' : 100 } ) }
+
+def run( suites = None, quick = False ):
+    """
+    Run the benchmark suites
+
+    Parameters
+    ----------
+    suites : iterable of str
+        The suites to run (all of SUITES if None)
+    quick : bool
+        True for fewer iterations (a smoke test, too noisy to compare against full runs)
+
+    Returns
+    -------
+    dict
+        JSON-serializable results as { 'version', 'meta', 'results' : { 'suite.name' : { 'value' : us, ... } } }
+    """
+    if suites is None: suites = list( SUITES )
+    results = {}
+    for suite in suites:
+        fn, quick_kwargs = SUITES[ suite ]
+        for name, value in fn( **( quick_kwargs if quick else {} ) ).items():
+            if not isinstance( value, dict ): value = { 'value' : value }
+            results[ '%s.%s' % ( suite, name ) ] = value
+    meta = { 'time'     : time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+             'python'   : platform.python_version(),
+             'numpy'    : np.__version__,
+             'platform' : platform.platform(),
+             'machine'  : platform.machine(),
+             'quick'    : quick,
+             'suites'   : list( suites ) }
+    return { 'version' : FORMAT_VERSION, 'meta' : meta, 'results' : results }
+
+def compare( baseline, current, threshold = 0.20 ):
+    """
+    Compare two runs benchmark by benchmark
+
+    Parameters
+    ----------
+    baseline : dict
+        The reference results returned by run()
+    current : dict
+        The results under test
+    threshold : float
+        The relative slowdown flagged as a regression (0.20 for 20% slower)
+
+    Returns
+    -------
+    list of tuples
+        ( name, baseline us, current us, current / baseline, status ) with status one of
+        'regression', 'improvement', 'same', 'added' or 'removed'
+    """
+    before = baseline[ 'results' ]
+    after = current[ 'results' ]
+    rows = []
+    for name in sorted( set( before ) | set( after ) ):
+        if name not in after:
+            rows.append( ( name, before[ name ][ 'value' ], None, None, 'removed' ) )
+        elif name not in before:
+            rows.append( ( name, None, after[ name ][ 'value' ], None, 'added' ) )
+        else:
+            old, new = before[ name ][ 'value' ], after[ name ][ 'value' ]
+            ratio = new / old if old > 0 else float( 'inf' )
+            if ratio > 1.0 + threshold: status = 'regression'
+            elif ratio < 1.0 / ( 1.0 + threshold ): status = 'improvement'
+            else: status = 'same'
+            rows.append( ( name, old, new, ratio, status ) )
+    return rows
+
+def _print_results( data ):
+    print( '%-32s %12s %12s %12s' % ( 'benchmark', 'us', 'p95 (us)', 'p99 (us)' ) )
+    for name, value in data[ 'results' ].items():
+        tails = [ '%12.2f' % value[ key ] if key in value else '%12s' % '' for key in ( 'p95', 'p99' ) ]
+        print( '%-32s %12.3f %s' % ( name, value[ 'value' ], ' '.join( tails ) ) )
+
+def _print_comparison( rows ):
+    fmt = lambda value: '%12s' % '-' if value is None else '%12.3f' % value
+    print( '%-32s %12s %12s %8s  %s' % ( 'benchmark', 'before (us)', 'after (us)', 'ratio', 'status' ) )
+    for name, old, new, ratio, status in rows:
+        print( '%-32s %s %s %8s  %s' % ( name, fmt( old ), fmt( new ), '-' if ratio is None else '%.2fx' % ratio, status ) )
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser( description = 'Headless benchmarks of the math, codec, network and device layers' )
+    parser.add_argument( '-o', '--output', default = None, help = 'write the results to this JSON file' )
+    parser.add_argument( '--suite', action = 'append', choices = list( SUITES ), help = 'run only this suite (repeatable)' )
+    parser.add_argument( '--quick', action = 'store_true', help = 'fewer iterations, for smoke testing' )
+    parser.add_argument( '--compare', nargs = 2, metavar = ( 'BASELINE', 'CURRENT' ), default = None,
+                         help = 'compare two result files instead of running (exit with 1 on a regression)' )
+    parser.add_argument( '--threshold', type = float, default = 0.20, help = 'relative slowdown flagged as a regression' )
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        results = []
+        for path in args.compare:
+            with open( path ) as f:
+                results.append( json.load( f ) )
+        baseline, current = results
+        for key in ( 'platform', 'python', 'numpy', 'quick' ):
+            if baseline[ 'meta' ].get( key ) != current[ 'meta' ].get( key ):
+                print( 'warning: runs differ in %s (%s vs %s)' % ( key, baseline[ 'meta' ].get( key ), current[ 'meta' ].get( key ) ) )
+        rows = compare( baseline, current, args.threshold )
+        _print_comparison( rows )
+        regressions = [ row[0] for row in rows if row[4] == 'regression' ]
+        if regressions:
+            print( '%d regression(s) above %.0f%%: %s' % ( len( regressions ), 100 * args.threshold, ', '.join( regressions ) ) )
+            sys.exit( 1 )
+    else:
+        data = run( args.suite, args.quick )
+        _print_results( data )
+        if args.output is not None:
+            with open( args.output, 'w' ) as f:
+                json.dump( data, f, indent = 2 )
@@ -0,0 +1,93 @@
+import timeit
+
+from TASKA import TASKA
+from FingerMap import FingerMap
+
+#Microbenchmark for TASKA packet encoding (no serial port needed)
+#Compares the original list-building encoders against the prebuilt packets / reusable buffers
+
+def legacy_checksum( array ):
+    chk = 0
+    for item in array: chk += item
+    return chk & 0xFF
+
+def legacy_select_grip( grip ):
+    pkt = [ 35, 71, 2, 6, TASKA._grip_dict[grip] ]
+    pkt.append( legacy_checksum( pkt ) )
+    return bytes( pkt )
+
+def legacy_grip_position( position ):
+    pkt = [ 35, 71, 3, 6, position ]
+    pkt.append( legacy_checksum( pkt ) )
+    return bytes( pkt )
+
+def legacy_finger_group( positions, speeds, amps = 20, stall = 20 ):
+    pkt = [ 35, 70, 255, 20 ]
+    for pos in positions:
+        pkt.append( pos )
+    for spd in speeds:
+        pkt.append( spd )
+    pkt.extend( [ amps, 0, stall ] )
+    pkt.append( legacy_checksum( pkt ) )
+    return bytes( pkt )
+
+def legacy_finger_degrees( degrees, speed ):
+    # Positional.send_command mapping followed by the TASKA.publish clamping / scaling
+    angles = [ min( max( 20, angle ), 80 ) for angle in degrees ]
+    angles = [ ( angles[0]-20 )/60, ( angles[1]-20 )/60, ( angles[2]-20 )/60, ( angles[3]-20 )/60, ( angles[4]-20 )/60, ( angles[5]-20 )/60 ]
+    speed = max( 0.0, min( 1.0, speed ) )
+    speeds = [ speed ] * TASKA.NUM_MOTORS
+    for i in range( TASKA.NUM_MOTORS ):
+        angles[i] = max( 0.0, min( 1.0, angles[i] ) )
+    angles = [ int( 255 * x ) for x in angles ]
+    speeds = [ int( 255 * x ) for x in speeds ]
+    return legacy_finger_group( angles, speeds )
+
+def bench_encode( number = 20000, repeat = 5 ):
+    """
+    Time the per-command encode cost of the TASKA packets
+
+    Parameters
+    ----------
+    number : int
+        The number of calls per timing run
+    repeat : int
+        The number of timing runs (the fastest one is reported)
+
+    Returns
+    -------
+    dict
+        Per-command cost in microseconds as { command : ( legacy, current ) }
+    """
+    # encoders only need the packet tables, not a serial connection
+    taska = TASKA.__new__( TASKA )
+    taska._build_packets()
+    degree_map = FingerMap( lower = 20, upper = 80 )
+    degrees = [ 15.0, 32.0, 47.5, 61.25, 79.9, 95.0 ]
+
+    positions = [ 10, 50, 90, 130, 170, 210 ]
+    speeds = [ 255 ] * TASKA.NUM_MOTORS
+
+    # both encoders must produce identical bytes
+    assert legacy_select_grip( 'tripod' ) == taska._grip_pkts[ 'tripod' ]
+    assert legacy_grip_position( 200 ) == taska._encode_grip_position( 200 )
+    assert legacy_finger_group( positions, speeds ) == taska._encode_finger_group( positions, speeds, 20, 20 )
+    assert legacy_finger_degrees( degrees, 0.7 ) == taska._encode_finger_map( degree_map, degrees, 0.7, 20, 20 )
+
+    cases = { 'select_grip'  : ( lambda: legacy_select_grip( 'tripod' ),
+                                 lambda: taska._grip_pkts[ 'tripod' ] ),
+              'grip_position': ( lambda: legacy_grip_position( 200 ),
+                                 lambda: taska._encode_grip_position( 200 ) ),
+              'finger_group' : ( lambda: legacy_finger_group( positions, speeds ),
+                                 lambda: taska._encode_finger_group( positions, speeds, 20, 20 ) ),
+              'finger_deg'   : ( lambda: legacy_finger_degrees( degrees, 0.7 ),
+                                 lambda: taska._encode_finger_map( degree_map, degrees, 0.7, 20, 20 ) ) }
+    results = {}
+    for name, fns in cases.items():
+        results[ name ] = tuple( 1e6 * min( timeit.repeat( fn, number = number, repeat = repeat ) ) / number for fn in fns )
+    return results
+
+if __name__ == '__main__':
+    print( '%-14s %12s %12s %8s' % ( 'command', 'before (us)', 'after (us)', 'speedup' ) )
+    for name, ( before, after ) in bench_encode().items():
+        print( '%-14s %12.3f %12.3f %7.1fx' % ( name, before, after, before / after ) )
@@ -0,0 +1,80 @@
+import socket
+
+import BTTransport
+
+#Checks BTTransport.alive against a stand-in for the PyBluez socket used on Windows,
+#whose recv only takes a byte count (no flags) and which has no sendall
+
+class PyBluezLike():
+    """ Socket with the PyBluez interface: send, recv( numbytes ), fileno and close """
+    def __init__( self, sock ):
+        self._sock = sock
+
+    def send( self, data ):
+        return self._sock.send( data[ :3 ] )     # short writes, like a busy RFCOMM link
+
+    def recv( self, numbytes ):
+        return self._sock.recv( numbytes )
+
+    def fileno( self ):
+        return self._sock.fileno()
+
+    def close( self ):
+        self._sock.close()
+
+def _pair():
+    local, peer = socket.socketpair()
+    return BTTransport.RFCOMMStream( PyBluezLike( local ) ), peer
+
+def test_alive_idle():
+    stream, peer = _pair()
+    assert BTTransport.alive( stream )
+    stream.close()
+    peer.close()
+
+def test_alive_keeps_pending_data():
+    stream, peer = _pair()
+    peer.sendall( b'\xff\x02\x00\x01' )
+    assert BTTransport.alive( stream )
+    assert BTTransport.alive( stream )
+    data = b''
+    while len( data ) < 4: data += stream.recv( 4 - len( data ) )
+    assert data == b'\xff\x02\x00\x01'
+    stream.close()
+    peer.close()
+
+def test_alive_peer_closed():
+    stream, peer = _pair()
+    peer.close()
+    assert not BTTransport.alive( stream )
+    stream.close()
+
+def test_alive_closed_locally():
+    stream, peer = _pair()
+    stream.close()
+    assert not BTTransport.alive( stream )
+    peer.close()
+
+def test_sendall_short_writes():
+    stream, peer = _pair()
+    stream.sendall( b'\xff\x02\x9e\x9f\xff\x02\x9b\x9c' )
+    data = b''
+    while len( data ) < 8: data += peer.recv( 8 )
+    assert data == b'\xff\x02\x9e\x9f\xff\x02\x9b\x9c'
+    stream.close()
+    peer.close()
+
+def test_alive_stdlib_socket():
+    local, peer = socket.socketpair()
+    peer.sendall( b'\x00' )
+    assert BTTransport.alive( local )
+    assert local.recv( 1 ) == b'\x00'
+    peer.close()
+    assert not BTTransport.alive( local )
+    local.close()
+
+if __name__ == '__main__':
+    for name, test in list( globals().items() ):
+        if name.startswith( 'test_' ):
+            test()
+            print( 'ok  ', name )